@@ -0,0 +1,78 @@
+"""Blocklist host matching: a linear suffix scan against DomainTrie.
+
+    python bench/bench_blocklist.py
+    python bench/bench_blocklist.py -n 1000 100000 --lookups 50000
+
+A page load on these embeds fires a few hundred requests and every one
+goes through the route handler, so the per-request cost is what counts.
+The scan grows with the size of the list; the trie only with the number
+of labels in the host.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from blocklist import DEFAULT_DOMAINS, DomainTrie
+
+SIZES = (50, 1000, 50000)
+LOOKUPS = 20000
+
+
+def rules(n, rng):
+    tlds = ("com", "net", "io", "ru", "xyz")
+    extra = [f"ad{i}-{rng.randrange(10**6)}.{rng.choice(tlds)}" for i in range(max(0, n - len(DEFAULT_DOMAINS)))]
+    return list(DEFAULT_DOMAINS[:n]) + extra
+
+
+def hosts(domains, n, rng):
+    """A third blocked (often a subdomain of a rule), the rest first-party and CDN hosts."""
+    out = []
+    for i in range(n):
+        if i % 3 == 0:
+            out.append(rng.choice(("", "cdn.", "px.")) + rng.choice(domains))
+        else:
+            out.append(f"edge{rng.randrange(50)}.stream-cdn{rng.randrange(5)}.net")
+    return out
+
+
+def linear_match(domains, host):
+    for d in domains:
+        if host == d or host.endswith("." + d):
+            return d
+    return None
+
+
+def timed(fn, items):
+    start = time.perf_counter()
+    hits = sum(1 for h in items if fn(h))
+    return time.perf_counter() - start, hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Blocklist matching benchmark: linear scan vs domain trie")
+    parser.add_argument("-n", "--rules", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--lookups", type=int, default=LOOKUPS)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'rules':>7} {'build':>9} {'linear/req':>11} {'trie/req':>9} {'hits':>13}")
+    for n in args.rules:
+        rng = random.Random(args.seed)
+        domains = rules(n, rng)
+        items = hosts(domains, args.lookups, rng)
+        start = time.perf_counter()
+        trie = DomainTrie(domains)
+        build = time.perf_counter() - start
+        linear_s, linear_hits = timed(lambda h: linear_match(domains, h), items)
+        trie_s, trie_hits = timed(trie.match, items)
+        print(f"{n:>7} {build * 1000:>7.1f}ms {linear_s / len(items) * 1e6:>9.2f}us "
+              f"{trie_s / len(items) * 1e6:>7.2f}us {linear_hits:>6}/{trie_hits:<6}")
+
+
+if __name__ == "__main__":
+    main()
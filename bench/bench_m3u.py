@@ -0,0 +1,80 @@
+"""Micro-benchmark for m3u.py on a large synthetic playlist.
+
+    python bench/bench_m3u.py            # 100k entries
+    python bench/bench_m3u.py 500000
+"""
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from m3u import M3UEntry, M3UWriter, iter_entries, iter_urls
+
+
+def synthetic_playlist(n: int) -> str:
+    out = io.StringIO()
+    w = M3UWriter(out, '#EXTM3U url-tvg="https://example.com/guide.xml"')
+    for i in range(n):
+        options = ['#EXTVLCOPT:http-referrer=https://example.com/'] if i % 3 == 0 else []
+        w.write(M3UEntry(
+            url=f"https://cdn{i % 8}.example.com/live/{i}/index.m3u8?token={i:08x}",
+            title=f"Channel {i}, HD",
+            attrs={"tvg-id": f"ch{i}", "tvg-logo": f"https://logos.example.com/{i}.png",
+                   "group-title": f"Group {i % 20}"},
+            options=options
+        ))
+    return out.getvalue()
+
+
+def readlines_baseline(text: str) -> set:
+    """What blurred.get_existing_urls used to do."""
+    lines = text.splitlines(keepends=True)
+    urls = set()
+    for i, line in enumerate(lines):
+        if line.startswith("#EXTINF") and i + 1 < len(lines):
+            urls.add(lines[i + 1].strip())
+    return urls
+
+
+def timed(label, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    # Second pass under tracemalloc, which would skew the timing
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<28} {elapsed * 1000:9.1f} ms   peak {peak / 1e6:7.1f} MB")
+    return result
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    text = synthetic_playlist(n)
+    print(f"📏 {n} entries, {len(text) / 1e6:.1f} MB")
+
+    timed("readlines() pairing", readlines_baseline, text)
+    header = {}
+    entries = timed("iter_entries -> list", lambda: list(iter_entries(io.StringIO(text), header)))
+    timed("iter_entries -> url set", lambda: {e.url for e in iter_entries(io.StringIO(text))})
+    timed("iter_urls -> url set", lambda: set(iter_urls(io.StringIO(text))))
+
+    def write_all():
+        out = io.StringIO()
+        w = M3UWriter(out, '#EXTM3U url-tvg="https://example.com/guide.xml"')
+        for e in entries:
+            w.write(e)
+        return out.getvalue()
+
+    written = timed("M3UWriter", write_all)
+    assert len(entries) == n and header.get("url-tvg")
+    assert written == text, "round trip changed the playlist"
+    print("✅ round trip identical")
+
+
+if __name__ == "__main__":
+    main()
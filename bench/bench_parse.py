@@ -0,0 +1,91 @@
+"""SharkStreams homepage parsing: the old one-shot DOTALL regex against
+the incremental MatchParser, on clean and on malformed pages.
+
+    python bench/bench_parse.py
+    python bench/bench_parse.py -n 1000 5000 --broken 0.5
+
+A malformed page has rows with no openEmbed(...) link. For each such row
+the regex's chained lazy `.*?` groups retry every later span on the page
+before giving up, so 300 rows already take seconds; the parser cuts the
+page at row starts and scans each byte a bounded number of times.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sharkstreams import MatchParser
+
+SIZES = (100, 1000, 10000)
+# Past this the regex takes minutes on a malformed page
+REGEX_MAX_ROWS = 200
+# Roughly what the homepage streams in per read
+CHUNK = 16 * 1024
+
+# What get_all_matches ran before the incremental parser
+ROW_RE = re.compile(
+    r'<div class="row">.*?<span class="ch-date">([^<]+)</span>.*?<span class="ch-category">([^<]+)</span>.*?<span class="ch-name">([^<]+)</span>.*?openEmbed\(\'([^\']+)\'\)',
+    re.DOTALL
+)
+
+
+def homepage(rows, broken=0.0):
+    """`broken` of the rows lose their Watch link, taken from the end of the page."""
+    keep = rows - int(rows * broken)
+    out = []
+    for i in range(rows):
+        link = f'<a class="btn" onclick="openEmbed(\'//embed.example/{i}\')">Watch</a>' if i < keep else ""
+        out.append(
+            f'<div class="row"><span class="ch-date">2025-11-18 {i % 24:02d}:00:00</span>'
+            f'<span class="ch-category">Basketball</span>'
+            f'<span class="ch-name">Team {2 * i} vs Team {2 * i + 1}</span>{link}</div>'
+        )
+    return "<html><body>" + "\n".join(out) + "</body></html>"
+
+
+def time_regex(html):
+    start = time.perf_counter()
+    found = ROW_RE.findall(html)
+    return time.perf_counter() - start, len(found)
+
+
+def time_parser(html):
+    parser = MatchParser()
+    found = 0
+    start = time.perf_counter()
+    for i in range(0, len(html), CHUNK):
+        parser.feed(html[i:i + CHUNK])
+        found += len(parser.pop_rows())
+    parser.close()
+    found += len(parser.pop_rows())
+    return time.perf_counter() - start, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Homepage parse benchmark: regex vs incremental parser")
+    parser.add_argument("-n", "--rows", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--broken", type=float, default=0.2, help="share of rows missing their embed link")
+    parser.add_argument("--regex-max-rows", type=int, default=REGEX_MAX_ROWS,
+                        help="largest malformed page to run the regex on")
+    args = parser.parse_args()
+
+    print(f"{'rows':>6} {'page':>9} {'kind':<9} {'regex':>9} {'parser':>9} {'found':>11}")
+    for rows in args.rows:
+        for kind, broken in (("clean", 0.0), ("malformed", args.broken)):
+            html = homepage(rows, broken)
+            parser_s, parser_n = time_parser(html)
+            if broken and rows > args.regex_max_rows:
+                regex, regex_n = "skipped", "-"
+            else:
+                regex_s, regex_n = time_regex(html)
+                regex = f"{regex_s * 1000:.1f}ms"
+            print(f"{rows:>6} {len(html) // 1024:>7}KB {kind:<9} {regex:>9} "
+                  f"{parser_s * 1000:>7.1f}ms {regex_n:>5}/{parser_n:<5}")
+
+
+if __name__ == "__main__":
+    main()
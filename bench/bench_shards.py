@@ -0,0 +1,93 @@
+"""Scaling of ppv's sharded browser tier (--shards) against bench/fake_site.py.
+
+    python bench/bench_shards.py                  # 1, 2, 4, 8 workers at 200 events
+    python bench/bench_shards.py -n 500 -w 1 4 8 -c 4
+
+Every embed is JS-only (no plain-HTTP tier), so the whole run is browser
+work. Each worker count starts cold in a fresh temp dir; wall time
+includes process spawn and browser launch, which is what a run pays.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import tempfile
+import time
+
+from bench_sources import RESULTS_DIR, count_entries, current_commit, point_at
+from fake_site import FakeSite
+
+import ppv
+
+WORKERS = (1, 2, 4, 8)
+
+
+def bench_one(shards, args):
+    site = FakeSite(events=args.events, fail_rate=args.fail_rate, static_rate=0.0,
+                    popup_rate=args.popup_rate, seed=args.seed)
+    base = site.start()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            point_at(base, workdir)
+            quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+            start = time.perf_counter()
+            with quiet:
+                asyncio.run(ppv.main(concurrency=args.concurrency, use_cache=False, force=True,
+                                     metrics_dir=workdir, shards=shards))
+            elapsed = time.perf_counter() - start
+            with open(os.path.join(workdir, "ppv.json"), "r", encoding="utf-8") as f:
+                report = json.load(f)
+            entries = count_entries(ppv.PLAYLIST_FILE)
+    finally:
+        site.stop()
+    scan = report["stages"].get("embed_scan", {})
+    return {
+        "workers": shards,
+        "events": args.events,
+        "seconds": round(elapsed, 3),
+        "entries": entries,
+        "scans": scan.get("count", 0),
+        "scan_p95": scan.get("p95"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ppv --shards scaling benchmark")
+    parser.add_argument("-n", "--events", type=int, default=200)
+    parser.add_argument("-w", "--workers", type=int, nargs="+", default=list(WORKERS))
+    parser.add_argument("-c", "--concurrency", type=int, default=ppv.MAX_CONCURRENT_PAGES,
+                        help="pages per worker")
+    parser.add_argument("--fail-rate", type=float, default=0.1)
+    parser.add_argument("--popup-rate", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("-v", "--verbose", action="store_true", help="keep the scraper's own output")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger("scraper").setLevel(logging.WARNING)
+
+    runs = []
+    for shards in args.workers:
+        print(f"⏱️ {shards} worker(s) @ {args.events} events...", flush=True)
+        runs.append(bench_one(shards, args))
+
+    base = runs[0]["seconds"]
+    print(f"\n{'workers':>7} {'wall':>9} {'ev/s':>8} {'speedup':>8} {'out':>5} {'p95 scan':>9}")
+    for r in runs:
+        p95 = f"{r['scan_p95']:.2f}s" if r["scan_p95"] is not None else "-"
+        print(f"{r['workers']:>7} {r['seconds']:>8.2f}s {r['events'] / r['seconds']:>8.1f} "
+              f"{base / r['seconds']:>7.2f}x {r['entries']:>5} {p95:>9}")
+
+    commit = current_commit()
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"shards-{commit}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"commit": commit, "date": int(time.time()), "args": vars(args), "runs": runs}, f, indent=1)
+    print(f"\n💾 {path}")
+
+
+if __name__ == "__main__":
+    main()
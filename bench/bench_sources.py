@@ -0,0 +1,187 @@
+"""End-to-end benchmark of every source against bench/fake_site.py, offline.
+
+    python bench/bench_sources.py                        # 10, 100, 1000 events, all sources
+    python bench/bench_sources.py -n 100 -s ppv blurred
+    python bench/bench_sources.py --compare bench/results/1a2b3c4.json
+
+Each run starts from empty state in a temp dir (no cache, no validators,
+no host history), so numbers measure a cold run. Results are saved to
+bench/results/<commit>.json for comparison across commits.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import blurred
+import cdn
+import metrics
+import ppv
+import sharkstreams
+from fake_site import FakeSite
+
+SIZES = (10, 100, 1000)
+RESULTS_DIR = os.path.join(ROOT, "bench", "results")
+
+
+def point_at(base, workdir):
+    """Sends every source's upstream to the fake site and its files to `workdir`."""
+    path = lambda name: os.path.join(workdir, name)
+    ppv.API_URL = f"{base}/api/streams"
+    ppv.PLAYLIST_FILE = path("PPVLand.m3u8")
+    ppv.CACHE_FILE = path("ppv_cache.json")
+    ppv.HTTP_STATE_FILE = path("http_ppv.json")
+    ppv.HEALTH_FILE = path("hosts_ppv.json")
+    ppv.ENGINE_STATS_FILE = path("engines_ppv.json")
+
+    sharkstreams.HOMEPAGE_URL = base
+    sharkstreams.PLAYLIST_FILE = path("SharkStreams.m3u8")
+    sharkstreams.HTTP_STATE_FILE = path("http_shark.json")
+    sharkstreams.HEALTH_FILE = path("hosts_shark.json")
+    sharkstreams.ENGINE_STATS_FILE = path("engines_shark.json")
+
+    blurred.UPSTREAM_URLS = (f"{base}/blurred.m3u",)
+    blurred.OUTPUT_FILE = path("BlurredTV.m3u8")
+    blurred.INDEX_FILE = path("blurred_index.json")
+    blurred.HTTP_STATE_FILE = path("http_blurred.json")
+
+    cdn.CDN_HISTORY_FILE = path("cdn_speed.json")
+
+
+def run_ppv(metrics_dir):
+    asyncio.run(ppv.main(use_cache=False, force=True, metrics_dir=metrics_dir))
+    return ppv.PLAYLIST_FILE
+
+
+def run_sharkstreams(metrics_dir):
+    with metrics.collect("sharkstreams") as report:
+        playlist, _ = asyncio.run(sharkstreams.generate_playlist(
+            http=sharkstreams.new_http_client(), use_cache=False, force=True
+        ))
+    report.export(metrics_dir)
+    with open(sharkstreams.PLAYLIST_FILE, "w", encoding="utf-8") as f:
+        f.write(playlist or "")
+    return sharkstreams.PLAYLIST_FILE
+
+
+def run_blurred(metrics_dir):
+    blurred.main(force=True, metrics_dir=metrics_dir)
+    return blurred.OUTPUT_FILE
+
+
+RUNNERS = {"ppv": run_ppv, "sharkstreams": run_sharkstreams, "blurred": run_blurred}
+
+
+def count_entries(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return sum(1 for line in f if line.startswith("#EXTINF"))
+    except FileNotFoundError:
+        return 0
+
+
+def bench_one(source, events, args):
+    site = FakeSite(events=events, fail_rate=args.fail_rate, static_rate=args.static_rate,
+                    popup_rate=args.popup_rate, seed=args.seed)
+    base = site.start()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            point_at(base, workdir)
+            quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+            start = time.perf_counter()
+            with quiet:
+                out = RUNNERS[source](workdir)
+            elapsed = time.perf_counter() - start
+            with open(os.path.join(workdir, f"{source}.json"), "r", encoding="utf-8") as f:
+                report = json.load(f)
+            entries = count_entries(out)
+    finally:
+        site.stop()
+
+    return {
+        "source": source,
+        "events": events,
+        "seconds": round(elapsed, 3),
+        "events_per_sec": round(events / elapsed, 2),
+        "entries": entries,
+        "hits": site.hits,
+        "stages": {
+            stage: {k: s[k] for k in ("count", "total", "p50", "p95")}
+            for stage, s in report["stages"].items()
+        },
+    }
+
+
+def p95(run, stage):
+    s = run["stages"].get(stage)
+    return f"{s['p95']:.2f}s" if s else "-"
+
+
+def print_table(runs, baseline=None):
+    old = {(r["source"], r["events"]): r for r in (baseline or {}).get("runs", [])}
+    print(f"\n{'source':<13} {'events':>6} {'wall':>9} {'ev/s':>8} {'out':>5} "
+          f"{'p95 scan':>9} {'p95 m3u8':>9} {'p95 probe':>9}  vs baseline")
+    for r in runs:
+        prev = old.get((r["source"], r["events"]))
+        delta = f"{(r['seconds'] / prev['seconds'] - 1) * 100:+.0f}%" if prev and prev["seconds"] else ""
+        print(f"{r['source']:<13} {r['events']:>6} {r['seconds']:>8.2f}s {r['events_per_sec']:>8.1f} "
+              f"{r['entries']:>5} {p95(r, 'embed_scan'):>9} {p95(r, 'time_to_m3u8'):>9} "
+              f"{p95(r, 'probe_ttfb'):>9}  {delta}")
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "local"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the scrapers")
+    parser.add_argument("-n", "--events", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("-s", "--sources", nargs="+", choices=list(RUNNERS), default=list(RUNNERS))
+    parser.add_argument("--fail-rate", type=float, default=0.1, help="embeds that never play")
+    parser.add_argument("--static-rate", type=float, default=0.5,
+                        help="embeds whose manifest is in the HTML (plain-HTTP tier)")
+    parser.add_argument("--popup-rate", type=float, default=0.3, help="embeds that open a popup on click")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    parser.add_argument("-v", "--verbose", action="store_true", help="keep the scrapers' own output")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger("scraper").setLevel(logging.WARNING)
+
+    runs = []
+    for events in args.events:
+        for source in args.sources:
+            print(f"⏱️ {source} @ {events} events...", flush=True)
+            runs.append(bench_one(source, events, args))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_table(runs, baseline)
+
+    commit = current_commit()
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{commit}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"commit": commit, "date": int(time.time()), "args": vars(args), "runs": runs}, f, indent=1)
+    print(f"\n💾 {path}")
+
+
+if __name__ == "__main__":
+    main()
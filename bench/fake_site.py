@@ -0,0 +1,205 @@
+"""Local stand-in for ppv.to, sharkstreams.net and the BlurredTV upstream.
+
+Serves, for `events` synthetic events:
+    /api/streams         ppv-style JSON listing
+    /                    SharkStreams-style homepage (ch-date/ch-category/ch-name/openEmbed)
+    /blurred.m3u         upstream M3U for blurred.py
+    /embed/<i>           player page; either carries the manifest URL in its
+                         HTML (plain-HTTP tier) or builds it in JS and requests
+                         it after a delay (browser tier only), may open a popup
+                         on click, or never plays and names no manifest at all
+    /hls/<i>/index.m3u8  a tiny live media playlist
+
+Every per-event behaviour is drawn from a seeded RNG, so two runs with the
+same arguments serve the same site.
+
+    site = FakeSite(events=100, fail_rate=0.1)
+    base = site.start()          # background thread, returns http://127.0.0.1:<port>
+    ...
+    site.stop()
+"""
+import asyncio
+import random
+import threading
+import time
+from datetime import datetime
+
+from aiohttp import web
+
+CATEGORIES = ("Basketball", "Football", "Combat Sports", "Ice Hockey", "Motorsports", "Darts")
+
+EMBED_JS = """<!doctype html><html><head><title>player {i}</title></head><body>
+<div id="player" style="width:640px;height:360px"><button class="vjs-big-play-button">play</button></div>
+<script>
+  var popup = {popup};
+  document.addEventListener("click", function () {{
+    if (popup) {{ popup = false; window.open("about:blank"); }}
+  }});
+{play}
+</script></body></html>"""
+
+# Pieced together at runtime so no manifest URL is in the HTML for the
+# plain-HTTP tier to find
+EMBED_PLAY = """  setTimeout(function () {{
+    fetch(location.origin + "/hls/{i}/index.m3u" + "8?expires={expires}").catch(function () {{}});
+  }}, {delay_ms});"""
+
+EMBED_STATIC = """<!doctype html><html><head><title>player {i}</title></head><body>
+<script>var player = jwplayer("player").setup({{ file: "{manifest}" }});</script>
+</body></html>"""
+
+MEDIA_PLAYLIST = """#EXTM3U
+#EXT-X-VERSION:3
+#EXT-X-TARGETDURATION:6
+#EXT-X-MEDIA-SEQUENCE:{seq}
+#EXTINF:6.0,
+seg{seq}.ts
+#EXTINF:6.0,
+seg{next}.ts
+"""
+
+
+class FakeSite:
+    def __init__(self, events=100, delay=(0.2, 1.5), page_delay=(0.0, 0.1), fail_rate=0.1,
+                 popup_rate=0.3, static_rate=0.5, seed=1):
+        self.events = events
+        self.base = None
+        self.hits = {"api": 0, "home": 0, "embed": 0, "manifest": 0, "blurred": 0}
+        self._loop = None
+        self._thread = None
+        self._runner = None
+        self._ready = threading.Event()
+
+        rng = random.Random(seed)
+        self.plan = []
+        for i in range(events):
+            roll = rng.random()
+            self.plan.append({
+                "fails": roll < fail_rate,
+                "static": fail_rate <= roll < fail_rate + static_rate,
+                "popup": rng.random() < popup_rate,
+                "delay": rng.uniform(*delay),
+                "page_delay": rng.uniform(*page_delay),
+            })
+
+    # --- pages ---
+    @staticmethod
+    def expires():
+        return int(time.time()) + 3 * 60 * 60
+
+    def manifest_url(self, i):
+        return f"{self.base}/hls/{i}/index.m3u8?expires={self.expires()}"
+
+    async def api_streams(self, request):
+        self.hits["api"] += 1
+        now = int(time.time())
+        by_cat = {}
+        for i in range(self.events):
+            cat = CATEGORIES[i % len(CATEGORIES)]
+            starts_at = now - 3600 + (i % 48) * 300
+            by_cat.setdefault(cat, []).append({
+                "id": i,
+                "name": f"Team {2 * i} vs Team {2 * i + 1}",
+                "iframe": f"{self.base}/embed/{i}",
+                "poster": "",
+                "starts_at": starts_at,
+                "ends_at": starts_at + 3 * 60 * 60,
+            })
+        body = {"streams": [{"category": c, "streams": s} for c, s in by_cat.items()]}
+        return web.json_response(body)
+
+    async def homepage(self, request):
+        self.hits["home"] += 1
+        today = datetime.now().strftime("%Y-%m-%d")
+        rows = []
+        for i in range(self.events):
+            rows.append(
+                f'<div class="row"><span class="ch-date">{today} {i % 24:02d}:00:00</span>'
+                f'<span class="ch-category">{CATEGORIES[i % len(CATEGORIES)]}</span>'
+                f'<span class="ch-name">Team {2 * i} vs Team {2 * i + 1}</span>'
+                f'<a class="btn" onclick="openEmbed(\'{self.base}/embed/{i}\')">Watch</a></div>'
+            )
+        return web.Response(text="<html><body>" + "\n".join(rows) + "</body></html>",
+                            content_type="text/html")
+
+    async def embed(self, request):
+        self.hits["embed"] += 1
+        i = int(request.match_info["i"])
+        plan = self.plan[i % self.events]
+        await asyncio.sleep(plan["page_delay"])
+        if plan["static"]:
+            text = EMBED_STATIC.format(i=i, manifest=self.manifest_url(i))
+        else:
+            play = "" if plan["fails"] else EMBED_PLAY.format(
+                i=i, expires=self.expires(), delay_ms=int(plan["delay"] * 1000))
+            text = EMBED_JS.format(i=i, play=play, popup="true" if plan["popup"] else "false")
+        return web.Response(text=text, content_type="text/html")
+
+    async def manifest(self, request):
+        self.hits["manifest"] += 1
+        seq = int(time.time()) // 6
+        return web.Response(text=MEDIA_PLAYLIST.format(seq=seq, next=seq + 1),
+                            content_type="application/vnd.apple.mpegurl")
+
+    async def blurred(self, request):
+        self.hits["blurred"] += 1
+        lines = ["#EXTM3U"]
+        for i in range(self.events):
+            lines.append(f'#EXTINF:-1 tvg-id="ch{i}.jp" tvg-logo="" group-title="News",Channel {i}')
+            lines.append(f"{self.base}/hls/{i}/index.m3u8")
+        return web.Response(text="\n".join(lines) + "\n", content_type="audio/x-mpegurl")
+
+    # --- lifecycle ---
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/", self.homepage)
+        app.router.add_get("/api/streams", self.api_streams)
+        app.router.add_get("/blurred.m3u", self.blurred)
+        app.router.add_get("/embed/{i}", self.embed)
+        app.router.add_get("/hls/{i}/index.m3u8", self.manifest)
+        return app
+
+    async def _serve(self):
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.base = f"http://127.0.0.1:{port}"
+        self._ready.set()
+
+    def start(self) -> str:
+        """Serves from a background thread so callers can use asyncio.run()."""
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self._serve())
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self.base
+
+    def stop(self):
+        if not self._loop:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve the fake stream sites until Ctrl+C")
+    parser.add_argument("-n", "--events", type=int, default=100)
+    parser.add_argument("--fail-rate", type=float, default=0.1)
+    args = parser.parse_args()
+    fake = FakeSite(events=args.events, fail_rate=args.fail_rate)
+    print(f"🧪 Serving {args.events} events at {fake.start()}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        fake.stop()
+        print(f"📈 Hits: {fake.hits}")
@@ -0,0 +1,215 @@
+"""Request blocking for every browser context the scrapers open.
+
+Ad, analytics and player-telemetry hosts are matched with a domain trie:
+a host's labels are walked right to left (com -> example -> ads), so a
+lookup costs one dict step per label however long the list gets, and a
+rule for example.com also covers every subdomain of it.
+
+The rules are DEFAULT_DOMAINS plus BLOCKLIST_FILE when it exists. That
+file may hold plain domains, hosts-file lines (0.0.0.0 ads.example.com)
+or adblock host rules (||ads.example.com^); anything else is skipped.
+
+RequestBlocker.install() puts the route, popup prevention and byte
+accounting on a context, so every page the context opens is covered
+before its first request. Route and page handlers run in the browser
+connection's task, not in whichever source is scanning, so the blocker
+keeps its own counters and sources take them into their report.
+"""
+import contextlib
+import functools
+import weakref
+from urllib.parse import urlsplit
+
+from capture import is_manifest
+
+# --- CONFIGURATION ---
+BLOCKLIST_FILE = "blocklist.txt"
+DEFAULT_DOMAINS = (
+    # Ad networks, including the popunder ones these embeds favour
+    "doubleclick.net", "googlesyndication.com", "googleadservices.com", "adservice.google.com",
+    "amazon-adsystem.com", "adnxs.com", "criteo.com", "criteo.net", "taboola.com", "outbrain.com",
+    "popads.net", "popcash.net", "propellerads.com", "adsterra.com", "exoclick.com", "exdynsrv.com",
+    "juicyads.com", "hilltopads.net", "onclickads.net", "adcash.com", "a-ads.com", "clickadu.com",
+    "mgid.com", "revcontent.com", "zedo.com",
+    # Analytics
+    "google-analytics.com", "googletagmanager.com", "googletagservices.com", "scorecardresearch.com",
+    "quantserve.com", "hotjar.com", "mc.yandex.ru", "histats.com", "statcounter.com",
+    "static.cloudflareinsights.com", "connect.facebook.net",
+    # Player telemetry
+    "jwpltx.com", "litix.io", "conviva.com", "npaw.com", "analytics-ingress-global.bitmovin.com",
+)
+
+# window.open() returns nothing and clicks on links that would open a new
+# tab or window are dropped, so overlay ads can't spawn popups at all
+POPUP_GUARD_SCRIPT = """
+(() => {
+  window.open = function () { return null; };
+  document.addEventListener('click', (e) => {
+    const a = e.target && e.target.closest && e.target.closest('a[target]');
+    if (a && a.target !== '_self' && a.target !== '_parent' && a.target !== '_top') {
+      e.preventDefault();
+      e.stopImmediatePropagation();
+    }
+  }, true);
+})();
+"""
+
+
+class DomainTrie:
+    """Domains stored label by label from the right."""
+
+    _END = ""
+
+    def __init__(self, domains=()):
+        self.root = {}
+        self.size = 0
+        for domain in domains:
+            self.add(domain)
+
+    def add(self, domain):
+        labels = domain.strip().lower().strip(".").split(".")
+        if not labels or not all(labels):
+            return
+        node = self.root
+        for label in reversed(labels):
+            node = node.setdefault(label, {})
+        if self._END not in node:
+            node[self._END] = domain
+            self.size += 1
+
+    def match(self, host):
+        """The rule covering `host` (itself or a parent domain), or None."""
+        node = self.root
+        for label in reversed(host.lower().rstrip(".").split(".")):
+            node = node.get(label)
+            if node is None:
+                return None
+            if self._END in node:
+                return node[self._END]
+        return None
+
+    def __contains__(self, host):
+        return self.match(host) is not None
+
+    def __len__(self):
+        return self.size
+
+
+def parse_rule(line: str):
+    """One blocklist line -> domain, or None for comments and rules that
+    aren't plain host rules."""
+    line = line.split("#", 1)[0].strip()
+    if not line or line.startswith("!"):
+        return None
+    if line.startswith("||"):
+        line = line[2:]
+        if line.endswith("^"):
+            line = line[:-1]
+        return line if line and not any(c in line for c in "/*^$") else None
+    parts = line.split()
+    if len(parts) == 2 and parts[0] in ("0.0.0.0", "127.0.0.1", "::"):
+        line = parts[1]
+    elif len(parts) != 1:
+        return None
+    return None if line in ("localhost", "0.0.0.0") or "/" in line else line
+
+
+def load_domains(path) -> list:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return [d for d in map(parse_rule, f) if d]
+    except FileNotFoundError:
+        return []
+
+
+@functools.lru_cache(maxsize=None)
+def default_trie(path=BLOCKLIST_FILE) -> DomainTrie:
+    """Built once per process and shared by every context."""
+    return DomainTrie([*DEFAULT_DOMAINS, *load_domains(path)])
+
+
+class RequestBlocker:
+    """Aborts requests to blocked hosts and of blocked resource types.
+
+    Aborted requests never transfer anything, so blocked bytes are an
+    estimate: each one counts the average size seen so far for its
+    resource type among the responses that did go through. `counters`
+    uses the RunReport names blocked_summary() reads.
+    """
+
+    def __init__(self, trie=None, resource_types=()):
+        self.trie = trie if trie is not None else default_trie()
+        self.resource_types = frozenset(resource_types)
+        self.counters = {}
+        self._installed = weakref.WeakSet()
+        # resource type -> [responses with a Content-Length, their bytes]
+        self._sizes = {}
+
+    async def install(self, context):
+        """Once per context; a second route would count every request twice."""
+        if context in self._installed:
+            return
+        self._installed.add(context)
+        await context.add_init_script(POPUP_GUARD_SCRIPT)
+        await context.route("**/*", self._route)
+        context.on("response", self._on_response)
+        context.on("page", self._on_page)
+
+    def rule_for(self, url, resource_type):
+        """Why `url` would be blocked ("type:image", a domain rule), or None."""
+        if resource_type in self.resource_types:
+            return f"type:{resource_type}"
+        if is_manifest(url):
+            return None
+        host = urlsplit(url).hostname
+        return self.trie.match(host) if host else None
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def take_counters(self) -> dict:
+        """Counters since the last call, which start again from zero."""
+        counters, self.counters = self.counters, {}
+        return counters
+
+    def estimate(self, resource_type) -> int:
+        seen, total = self._sizes.get(resource_type, (0, 0))
+        return total // seen if seen else 0
+
+    async def _route(self, route):
+        request = route.request
+        rule = self.rule_for(request.url, request.resource_type)
+        if rule is None:
+            await route.continue_()
+            return
+        self.count("blocked_requests")
+        self.count("blocked_requests_type" if rule.startswith("type:") else "blocked_requests_domain")
+        self.count("blocked_bytes_est", self.estimate(request.resource_type))
+        with contextlib.suppress(Exception):
+            await route.abort("blockedbyclient")
+
+    def _on_response(self, response):
+        try:
+            length = int(response.headers.get("content-length", ""))
+        except ValueError:
+            return
+        sizes = self._sizes.setdefault(response.request.resource_type, [0, 0])
+        sizes[0] += 1
+        sizes[1] += length
+
+    async def _on_page(self, page):
+        # A popup that got past the guard script (noopener links, middle
+        # clicks) is closed as soon as it exists
+        with contextlib.suppress(Exception):
+            if await page.opener() is not None:
+                self.count("popups_closed")
+                await page.close()
+
+
+def blocked_summary(counters) -> str:
+    blocked = counters.get("blocked_requests", 0)
+    mb = counters.get("blocked_bytes_est", 0) / 1e6
+    line = f"{blocked} requests blocked (~{mb:.1f} MB)"
+    if counters.get("popups_closed"):
+        line += f", {counters['popups_closed']} popups closed"
+    return line
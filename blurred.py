@@ -1,73 +1,333 @@
-import requests
-import re
+import argparse
+import asyncio
+import json
+import os
+from m3u import EntryParser, iter_entries, render_playlist, write_if_changed
+from probe import probe_all, probe_summary
+from http_client import HttpClient
+from host_health import host_of
+import metrics
 
-UPSTREAM_URL = "https://gitflic.ru/project/utako/utako/blob/raw?file=jp_clean.m3u"
+# Same playlist from every mirror; on ties (merge mode) earlier ones win
+UPSTREAM_URLS = (
+    "https://gitflic.ru/project/utako/utako/blob/raw?file=jp_clean.m3u",
+)
+# first: the first mirror to answer with a usable playlist wins, the rest
+# are cancelled | merge: every mirror that answers in time is merged
+MIRROR_MODES = ("first", "merge")
+# A mirror that hasn't delivered its whole playlist by then is given up on
+MIRROR_TIMEOUT = 20
 OUTPUT_FILE = "BlurredTV.m3u8"
 FORCED_GROUP_NAME = "JapanTV"
 TVG_HEADER = '#EXTM3U url-tvg="https://epg.freejptv.com/jp.xml,https://animenosekai.github.io/japanterebi-xmltv/guide.xml" tvg-shift=0'
 
-group_regex = re.compile(r'group-title=".*?"')
+# URL -> key of every entry this script synced from upstream. Entries added
+# to the playlist by hand are not in it, so they are never pruned.
+INDEX_FILE = "state/blurred_index.json"
+# ETag / Last-Modified / body hash of the upstream playlist from the last run
+HTTP_STATE_FILE = "state/http_blurred.json"
 
-def get_existing_urls(file_path):
-    urls = set()
+def entry_key(entry):
+    """Identity that survives a URL rotation: tvg-id plus title."""
+    return f"{entry.attrs.get('tvg-id', '')}|{entry.title.strip()}"
+
+def load_local(file_path):
     try:
         with open(file_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-        for i, line in enumerate(lines):
-            if line.startswith("#EXTINF") and i + 1 < len(lines):
-                urls.add(lines[i + 1].strip())
-        return urls
+            return list(iter_entries(f))
     except FileNotFoundError:
-        return set()
+        return []
+
+def load_index(path):
+    """None when there is no index yet; every local entry then counts as synced."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def save_index(path, entries):
+    """`entries` are the ones synced from upstream; local additions stay
+    out, so sync() never mistakes them for channels upstream dropped."""
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({e.url: entry_key(e) for e in entries}, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+def drop_information(entry):
+    return None if entry.attrs.get("group-title") == "Information" else entry
+
+def force_group(entry):
+    entry.attrs["group-title"] = FORCED_GROUP_NAME
+    return entry
+
+# Applied to each upstream entry as soon as it is parsed, in this order
+TRANSFORMS = (drop_information, force_group)
+
+class ChannelIndex:
+    """Upstream entries deduplicated as they arrive, in arrival order.
+
+    A URL is only ever listed once. Across mirrors a tvg-id is too: the
+    same channel behind a different URL on a later mirror is a duplicate,
+    while one mirror may still list a tvg-id several times (feeds,
+    qualities)."""
+
+    def __init__(self):
+        self.entries = []
+        self.urls = set()
+        self.ids = {}
+
+    def add(self, entry, source="") -> bool:
+        tvg_id = entry.attrs.get("tvg-id", "")
+        if entry.url in self.urls or (tvg_id and self.ids.get(tvg_id, source) != source):
+            return False
+        self.urls.add(entry.url)
+        if tvg_id:
+            self.ids.setdefault(tvg_id, source)
+        self.entries.append(entry)
+        return True
+
+    def clear(self):
+        self.entries = []
+        self.urls = set()
+        self.ids = {}
+
+def upstream_stream(index, source=""):
+    """(on_start, on_chunk, close) that parse, transform and index a
+    playlist body while it downloads, without holding it in memory.
+    on_start() empties `index` and starts a fresh parser, so a retried
+    download doesn't add to what a cut-off one left behind."""
+    parser = EntryParser()
+
+    def start():
+        nonlocal parser
+        parser = EntryParser()
+        index.clear()
+
+    def keep(entries):
+        for entry in entries:
+            for transform in TRANSFORMS:
+                entry = transform(entry)
+                if entry is None:
+                    break
+            else:
+                index.add(entry, source)
+
+    return start, (lambda text: keep(parser.feed(text))), (lambda: keep(parser.close()))
+
+def sync(local, upstream, index):
+    """Three-way sync of the local playlist against upstream in one pass.
+
+    Returns (kept, changes): `kept` is the local playlist in its original
+    order with updates applied in place and removals dropped; new entries
+    are in changes["added"] for the caller to append."""
+    by_url = {}
+    by_key = {}
+    for i, e in enumerate(local):
+        by_url.setdefault(e.url, i)
+        by_key.setdefault(entry_key(e), []).append(i)
 
-def clean_and_force_group(m3u_content, existing_urls):
-    lines = m3u_content.strip().splitlines()
-    output_lines = []
-    skip_next = False
+    result = list(local)
+    matched = set()
+    leftovers = []
+    changes = {"added": [], "changed": [], "updated": [], "removed": [], "unchanged": 0}
 
-    for i, line in enumerate(lines):
-        if skip_next:
-            skip_next = False
+    for entry in upstream:
+        i = by_url.get(entry.url)
+        if i is None or i in matched:
+            leftovers.append(entry)
             continue
+        matched.add(i)
+        if entry == local[i]:
+            changes["unchanged"] += 1
+        else:
+            # Same URL, new logo/title/options
+            result[i] = entry
+            changes["updated"].append(entry)
+
+    # Every URL match is known now, so an unmatched local entry with the
+    # same key is that channel under a rotated URL
+    for entry in leftovers:
+        slot = next((i for i in by_key.get(entry_key(entry), []) if i not in matched), None)
+        if slot is None:
+            changes["added"].append(entry)
+        else:
+            matched.add(slot)
+            result[slot] = entry
+            changes["changed"].append(entry)
+
+    for i, e in enumerate(local):
+        if i not in matched and (index is None or e.url in index):
+            result[i] = None
+            changes["removed"].append(e)
+
+    return [e for e in result if e is not None], changes
+
+async def drop_dead_entries(entries):
+    """Probes every entry's URL and keeps only the live ones.
+    Dropped entries are not in the playlist, so they get retried next run."""
+    if not entries:
+        return entries
+    results = await probe_all([e.url for e in entries])
+    print(f"🩺 {probe_summary(results)}")
+    if not any(r["ok"] for r in results):
+        # Every single one failing points at our network (or a geo-block), not the streams
+        print("⚠️ No probe succeeded, keeping all new entries")
+        return entries
+    kept = []
+    for entry, r in zip(entries, results):
+        if r["ok"]:
+            kept.append(entry)
+        else:
+            print(f"💀 Skipping dead entry ({r['reason']}): {entry.url}")
+    return kept
+
+def print_summary(changes):
+    print(
+        f"📋 Sync: ➕ {len(changes['added'])} added | 🔁 {len(changes['changed'])} URL changed | "
+        f"✏️ {len(changes['updated'])} updated | ➖ {len(changes['removed'])} removed | "
+        f"💤 {changes['unchanged']} unchanged"
+    )
+    for label, key in (("➕", "added"), ("🔁", "changed"), ("✏️", "updated"), ("➖", "removed")):
+        for e in changes[key]:
+            print(f"   {label} {e.title.strip()}  {e.url}")
+
+def new_http_client():
+    return HttpClient(state_file=HTTP_STATE_FILE)
+
+async def fetch_mirror(http, url, conditional):
+    """(url, response, entries) for one mirror; entries is a ChannelIndex
+    of its transformed entries. response is None when it failed or timed out."""
+    entries = ChannelIndex()
+    on_start, on_chunk, close = upstream_stream(entries, url)
+    try:
+        with metrics.span("upstream_fetch", domain=host_of(url)):
+            response = await asyncio.wait_for(http.get(url, conditional=conditional, on_chunk=on_chunk,
+                                                       on_start=on_start), MIRROR_TIMEOUT)
+    except Exception as e:
+        print(f"⚠️ {host_of(url)}: {str(e) or type(e).__name__}")
+        return url, None, entries
+    close()
+    if response.status != 200:
+        print(f"⚠️ {host_of(url)}: HTTP {response.status}")
+    elif not response.unchanged and not is_playlist(response.text):
+        print(f"⚠️ {host_of(url)}: not an M3U playlist")
+    elif not response.unchanged and not entries.entries:
+        print(f"⚠️ {host_of(url)}: no usable entries")
+    return url, response, entries
+
+def is_playlist(text) -> bool:
+    return text.lstrip("\ufeff \r\n\t").startswith("#EXTM3U")
+
+def usable(result) -> bool:
+    _, response, entries = result
+    if response is None or response.status != 200:
+        return False
+    return response.unchanged or (is_playlist(response.text) and bool(entries.entries))
+
+async def fetch_first(http, urls, conditional):
+    """The first usable mirror's result, or None. Slower mirrors are cancelled."""
+    tasks = [asyncio.ensure_future(fetch_mirror(http, url, conditional)) for url in urls]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            if usable(result):
+                return result
+        return None
+    finally:
+        for t in tasks:
+            t.cancel()
+        # Settled while the session they use is still open
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def fetch_merged(http, urls, conditional):
+    """Every usable mirror merged in UPSTREAM_URLS order, as one result.
+    Unchanged only if every usable mirror is; then nothing is refetched."""
+    results = [r for r in await asyncio.gather(*(fetch_mirror(http, u, conditional) for u in urls)) if usable(r)]
+    if not results:
+        return None
+    if all(r[1].unchanged for r in results):
+        return results[0]
+    # A 304 has no body to merge, so those mirrors are asked again in full
+    stale = [i for i, r in enumerate(results) if r[1].unchanged]
+    for i, result in zip(stale, await asyncio.gather(*(fetch_mirror(http, results[i][0], False) for i in stale))):
+        results[i] = result
+    merged = ChannelIndex()
+    for url, _, entries in results:
+        for entry in entries.entries:
+            merged.add(entry, url)
+    print(f"🪞 Merged {len(results)} mirrors: {len(merged.entries)} channels")
+    return results[0][0], results[0][1], merged
+
+async def generate_playlist(http=None, force=False, mirrors=None, mode="first"):
+    """Returns the synced playlist text and the change summary. The text
+    is None when upstream is unchanged, unreachable or empty.
+    `mirrors` defaults to UPSTREAM_URLS; `mode` is one of MIRROR_MODES."""
+    http = http or HttpClient()
+    mirrors = mirrors or UPSTREAM_URLS
+    fetch = fetch_merged if mode == "merge" else fetch_first
+    async with http:
+        result = await fetch(http, mirrors, not force)
+    if result is None:
+        print(f"❌ Failed to download: no usable playlist from {len(mirrors)} mirror(s)")
+        return None, {}
+    url, response, upstream = result
+    if response.unchanged:
+        print("💤 Upstream unchanged since the last run, nothing to do")
+        return None, {}
+    if len(mirrors) > 1:
+        print(f"🪞 Using {host_of(url)}" if mode == "first" else f"🪞 Primary {host_of(url)}")
+
+    local = load_local(OUTPUT_FILE)
+    index = load_index(INDEX_FILE)
+    kept, changes = sync(local, upstream.entries, index)
+
+    upstream_count = changes["unchanged"] + sum(len(changes[k]) for k in ("added", "changed", "updated"))
+    if not upstream_count:
+        # An empty or mangled upstream would otherwise prune the whole playlist
+        print("❌ Upstream playlist has no entries, leaving ours untouched")
+        return None, changes
+
+    changes["added"] = await drop_dead_entries(changes["added"])
+    entries = kept + changes["added"]
+    print_summary(changes)
+    for key in ("added", "changed", "updated", "removed"):
+        metrics.count(key, len(changes[key]))
+    metrics.count("unchanged", changes["unchanged"])
+    upstream_urls = {e.url for e in upstream.entries}
+    save_index(INDEX_FILE, [e for e in entries if e.url in upstream_urls])
+    return render_playlist(entries, TVG_HEADER), changes
 
-        if line.startswith("#EXTINF"):
-            if 'group-title="Information"' in line:
-                skip_next = True
-                continue
-
-            if i + 1 < len(lines):
-                url_line = lines[i + 1].strip()
-                if url_line not in existing_urls:
-                    if 'group-title="' in line:
-                        line = group_regex.sub(f'group-title="{FORCED_GROUP_NAME}"', line)
-                    else:
-                        line = line.replace('#EXTINF:', f'#EXTINF group-title="{FORCED_GROUP_NAME}":')
-
-                    output_lines.append(line)
-                    output_lines.append(url_line)
-                skip_next = True
-    return output_lines
-
-def main():
-    response = requests.get(UPSTREAM_URL)
-    if response.status_code != 200:
-        print(f"❌ Failed to download: HTTP {response.status_code}")
-        return
-
-    existing_urls = get_existing_urls(OUTPUT_FILE)
-    modified_lines = clean_and_force_group(response.text, existing_urls)
-
-    if not existing_urls:
-        with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-            f.write(TVG_HEADER + "\n")
-            f.write("\n".join(modified_lines) + "\n")
-        print(f"✅ Created {OUTPUT_FILE} with new entries")
-    elif modified_lines:
-        with open(OUTPUT_FILE, "a", encoding="utf-8") as f:
-            f.write("\n".join(modified_lines) + "\n")
-        print(f"✅ Appended {len(modified_lines)//2} new entries to {OUTPUT_FILE}")
-    else:
-        print("ℹ No new entries, playlist unchanged")
+def main(force=False, metrics_dir=metrics.METRICS_DIR, profile=False, mirrors=None, mode="first"):
+    http = new_http_client()
+    with metrics.collect("blurred") as report, metrics.profiled(report, profile, metrics_dir):
+        playlist, _ = asyncio.run(generate_playlist(http, force=force, mirrors=mirrors, mode=mode))
+        if playlist is not None:
+            with metrics.span("playlist_write"):
+                written = write_if_changed(OUTPUT_FILE, playlist)
+            if written:
+                print(f"✅ Wrote {OUTPUT_FILE}")
+            else:
+                print("ℹ No changes, playlist untouched")
+            http.save()
+    report.export(metrics_dir)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="BlurredTV / JapanTV playlist sync")
+    parser.add_argument("--force", action="store_true",
+                        help="sync even if the upstream playlist is unchanged since last time")
+    parser.add_argument("--mirror", action="append", default=[], metavar="URL",
+                        help="upstream playlist URL to use instead of UPSTREAM_URLS (repeatable)")
+    parser.add_argument("--mode", choices=MIRROR_MODES, default="first",
+                        help="first: fastest usable mirror wins | merge: combine every mirror that answers "
+                             f"within {MIRROR_TIMEOUT}s (default first)")
+    parser.add_argument("--metrics-dir", default=metrics.METRICS_DIR,
+                        help=f"where the JSON run report and Prometheus textfile go (default {metrics.METRICS_DIR})")
+    parser.add_argument("--profile", action="store_true",
+                        help="run under cProfile and tracemalloc; writes <metrics-dir>/blurred.prof")
+    args = parser.parse_args()
+    main(force=args.force, metrics_dir=args.metrics_dir, profile=args.profile,
+         mirrors=args.mirror, mode=args.mode)
@@ -0,0 +1,317 @@
+import asyncio
+import contextlib
+import os
+
+from playwright.async_api import async_playwright
+
+import metrics
+from blocklist import RequestBlocker
+from capture import install_context_hooks
+
+ENGINES = ("chromium", "firefox", "webkit")
+
+# A browser is relaunched after serving this many pages, or once the
+# browser processes together grow past RECYCLE_RSS_MB (local browsers only)
+RECYCLE_PAGES = 300
+RECYCLE_RSS_MB = 1500
+RSS_CHECK_EVERY = 20
+
+# ws://... from `python -m playwright run-server --port 3000`, or
+# http://... of a Chromium started with --remote-debugging-port
+BROWSER_SERVER_ENV = "BROWSER_SERVER"
+
+
+def process_table():
+    """(children by parent pid, RSS in KB by pid) from /proc; both empty
+    where /proc isn't available."""
+    children = {}
+    rss = {}
+    try:
+        pids = [p for p in os.listdir("/proc") if p.isdigit()]
+        page_kb = os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, AttributeError, ValueError):
+        return children, rss
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat", "r") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # comm may contain spaces; the fields after it are fixed
+        fields = stat[stat.rfind(")") + 2:].split()
+        children.setdefault(int(fields[1]), []).append(int(pid))
+        rss[int(pid)] = int(fields[21]) * page_kb
+    return children, rss
+
+
+def descendants(root_pid, children) -> set:
+    found, stack = set(), [root_pid]
+    while stack:
+        pid = stack.pop()
+        found.add(pid)
+        stack.extend(children.get(pid, []))
+    return found
+
+
+def tree_rss_mb(root_pid=None, table=None) -> float:
+    """Resident memory of `root_pid` and all its descendants, from /proc.
+    Returns 0 where /proc isn't available."""
+    children, rss = table or process_table()
+    return sum(rss.get(pid, 0) for pid in descendants(root_pid or os.getpid(), children)) / 1024
+
+
+class PagePool:
+    """Warm pages on one context, reset to about:blank between uses.
+
+    Request blocking (blocklisted hosts plus the `block` resource types),
+    popup prevention and the manifest capture hooks are installed on the
+    context once, so pages come out ready to navigate. A new context is
+    made whenever the underlying browser was recycled, one per browser
+    however many leases arrive at once.
+    """
+
+    def __init__(self, browsers, engine, block=()):
+        self.browsers = browsers
+        self.engine = engine
+        self.blocker = RequestBlocker(resource_types=block)
+        self.browser = None
+        self.context = None
+        self.idle = []
+        self.owned = set()
+        self._lock = asyncio.Lock()
+
+    async def _context_for(self, browser):
+        """The context on `browser`, made on first use. Leases racing in
+        after a launch or a recycle wait for the first one to make it."""
+        async with self._lock:
+            if browser is self.browser and self.context is not None:
+                return self.context
+            old = self.context
+            context = await browser.new_context()
+            await self.blocker.install(context)
+            await install_context_hooks(context)
+            self.idle = []
+            self.owned = set()
+            self.browser, self.context = browser, context
+        if old is not None:
+            # Its browser was recycled, so no page of it is still leased
+            with contextlib.suppress(Exception):
+                await old.close()
+        return context
+
+    @contextlib.asynccontextmanager
+    async def page(self):
+        browser = await self.browsers.lease(self.engine)
+        page = None
+        try:
+            context = await self._context_for(browser)
+            while self.idle and page is None:
+                page = self.idle.pop()
+                if page.is_closed():
+                    page = None
+            if page is None:
+                page = await context.new_page()
+                self.owned.add(page)
+            yield page
+        finally:
+            if page is not None and not page.is_closed():
+                try:
+                    await page.goto("about:blank", timeout=3000)
+                    if browser is self.browser:
+                        self.idle.append(page)
+                except Exception:
+                    # A page that can't even load about:blank is not worth keeping
+                    with contextlib.suppress(Exception):
+                        await page.close()
+            await self._close_popups()
+            self.browsers.release(self.engine)
+
+    async def _close_popups(self):
+        """Closes whatever the embeds still managed to open (new tabs the
+        blocker's page hook hasn't got to yet)."""
+        if self.context is None:
+            return
+        for p in self.context.pages:
+            if p not in self.owned:
+                with contextlib.suppress(Exception):
+                    await p.close()
+        self.owned = {p for p in self.owned if not p.is_closed()}
+
+    async def close(self):
+        self.idle = []
+        self.owned = set()
+        if self.context is not None:
+            with contextlib.suppress(Exception):
+                await self.context.close()
+        self.context = None
+        self.browser = None
+
+
+class BrowserPool:
+    """One Playwright instance shared by every source in the process.
+
+    Playwright and each engine's browser start lazily on first get(), so
+    a run that never needs a browser never pays for one. `page_budget`
+    caps the pages open across all sources at once.
+
+    With `server` (or $BROWSER_SERVER) the pool connects to a long-lived
+    browser instead of launching one: a ws:// endpoint from
+    `python -m playwright run-server`, or the http:// CDP endpoint of a
+    Chromium started with --remote-debugging-port.
+
+    Pages leased through page_pool() count towards recycling: after
+    `recycle_pages` pages, or once local browser memory passes
+    `recycle_rss_mb`, new leases wait for in-flight pages to finish and
+    the browser is relaunched.
+
+    Each locally launched browser's processes are noted at launch, so
+    engine_rss_mb() can tell the engines apart.
+    """
+
+    def __init__(self, page_budget=None, headless=True, server=None,
+                 recycle_pages=RECYCLE_PAGES, recycle_rss_mb=RECYCLE_RSS_MB):
+        self.headless = headless
+        self.server = server or os.environ.get(BROWSER_SERVER_ENV) or None
+        self.recycle_pages = recycle_pages
+        self.recycle_rss_mb = recycle_rss_mb
+        self.pages = asyncio.Semaphore(page_budget) if page_budget else None
+        self.browsers = {}
+        self.page_pools = {}
+        self.served = {}
+        self.leased = {}
+        self.stale = set()
+        self.roots = {}
+        self.recycled = 0
+        self._pw = None
+        self._lock = asyncio.Lock()
+        self._drained = asyncio.Condition()
+        self._notifies = set()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _launch(self, engine):
+        with metrics.span("browser_launch", engine=engine):
+            if self._pw is None:
+                self._pw = await async_playwright().start()
+            launcher = getattr(self._pw, engine)
+            if self.server and self.server.startswith("http"):
+                return await launcher.connect_over_cdp(self.server)
+            if self.server:
+                return await launcher.connect(self.server)
+            before = descendants(os.getpid(), process_table()[0])
+            browser = await launcher.launch(headless=self.headless)
+            children, _ = process_table()
+            new = descendants(os.getpid(), children) - before
+            # Minus whatever another engine's browser spawned meanwhile
+            for pid in {pid for roots in self.roots.values() for pid in roots}:
+                new -= descendants(pid, children)
+            # The launched processes whose parent was already running
+            self.roots[engine] = new - {c for pid in new for c in children.get(pid, [])}
+            return browser
+
+    async def get(self, engine):
+        if engine not in ENGINES:
+            raise ValueError(f"unknown browser engine {engine!r}")
+        if engine in self.stale:
+            await self._recycle(engine)
+        async with self._lock:
+            if engine not in self.browsers:
+                self.browsers[engine] = await self._launch(engine)
+        return self.browsers[engine]
+
+    async def _recycle(self, engine):
+        async with self._drained:
+            await self._drained.wait_for(lambda: not self.leased.get(engine))
+            if engine not in self.stale:
+                return
+            self.stale.discard(engine)
+            browser = self.browsers.pop(engine, None)
+            self.roots.pop(engine, None)
+            self.served[engine] = 0
+            self.recycled += 1
+        if browser is not None:
+            with contextlib.suppress(Exception):
+                await browser.close()
+
+    async def lease(self, engine):
+        """Browser for one pooled page's lifetime; pair with release()."""
+        browser = await self.get(engine)
+        self.leased[engine] = self.leased.get(engine, 0) + 1
+        served = self.served[engine] = self.served.get(engine, 0) + 1
+        if served >= self.recycle_pages:
+            self.stale.add(engine)
+        elif not self.server and served % RSS_CHECK_EVERY == 0 and tree_rss_mb() > self.recycle_rss_mb:
+            self.stale.add(engine)
+        return browser
+
+    def engine_rss_mb(self, engine) -> float:
+        """Resident memory of `engine`'s local browser processes; 0 when it
+        isn't running here (not launched yet, or on a browser server)."""
+        roots = self.roots.get(engine)
+        if not roots:
+            return 0.0
+        table = process_table()
+        return sum(tree_rss_mb(pid, table) for pid in roots)
+
+    def release(self, engine):
+        self.leased[engine] -= 1
+        if not self.leased[engine]:
+            task = asyncio.ensure_future(self._notify_drained())
+            self._notifies.add(task)
+            task.add_done_callback(self._notifies.discard)
+
+    async def _notify_drained(self):
+        async with self._drained:
+            self._drained.notify_all()
+
+    def page_pool(self, key, engine, block=()) -> PagePool:
+        """Warm page pool shared by everyone asking for the same `key`."""
+        if key not in self.page_pools:
+            self.page_pools[key] = PagePool(self, engine, block)
+        return self.page_pools[key]
+
+    def report_blocked(self, prefix):
+        """Adds what the blockers of the page pools whose key starts with
+        `prefix` stopped since the last call to the active RunReport."""
+        for key, pages in self.page_pools.items():
+            if key.startswith(prefix):
+                for name, n in pages.blocker.take_counters().items():
+                    metrics.count(name, n)
+
+    def page_slot(self):
+        """`async with pool.page_slot():` around each page's lifetime."""
+        return self.pages if self.pages else contextlib.nullcontext()
+
+    async def close(self):
+        # Nobody is left to wait for a drained browser
+        for task in self._notifies:
+            task.cancel()
+        await asyncio.gather(*self._notifies, return_exceptions=True)
+        for pages in self.page_pools.values():
+            await pages.close()
+        self.page_pools = {}
+        for browser in self.browsers.values():
+            try:
+                # Only disconnects when attached to a browser server
+                await browser.close()
+            except Exception:
+                pass
+        self.browsers = {}
+        self.roots = {}
+        if self._pw is not None:
+            await self._pw.stop()
+            self._pw = None
+
+
+@contextlib.asynccontextmanager
+async def pool_or_new(pool=None):
+    """Yields `pool`, or a private BrowserPool closed on exit when none is given."""
+    if pool is not None:
+        yield pool
+        return
+    async with BrowserPool() as own:
+        yield own
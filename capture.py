@@ -0,0 +1,256 @@
+import asyncio
+import time
+import weakref
+
+from playwright.async_api import Error as PlaywrightError
+
+from http_extract import is_ignored
+
+# How long leaving a capture waits for its window.stop() to land
+STOP_GRACE = 2.0
+
+# Hooks fetch/XHR/<video src>/hls.js loadSource in every frame so the
+# manifest URL is reported before its network request is even sent.
+CAPTURE_INIT_SCRIPT = """
+(() => {
+  const report = (u) => {
+    try {
+      u = new URL(String(u && u.url ? u.url : u), location.href).href;
+      if (u.includes('.m3u8') && window.__m3u8Found) window.__m3u8Found(u);
+    } catch (e) {}
+  };
+
+  const origFetch = window.fetch;
+  if (origFetch) {
+    window.fetch = function (input) {
+      report(input);
+      return origFetch.apply(this, arguments);
+    };
+  }
+
+  const origOpen = XMLHttpRequest.prototype.open;
+  XMLHttpRequest.prototype.open = function (method, url) {
+    report(url);
+    return origOpen.apply(this, arguments);
+  };
+
+  const srcDesc = Object.getOwnPropertyDescriptor(HTMLMediaElement.prototype, 'src');
+  if (srcDesc && srcDesc.set) {
+    Object.defineProperty(HTMLMediaElement.prototype, 'src', {
+      ...srcDesc,
+      set(v) { report(v); return srcDesc.set.call(this, v); }
+    });
+  }
+
+  let hls;
+  Object.defineProperty(window, 'Hls', {
+    configurable: true,
+    get() { return hls; },
+    set(v) {
+      hls = v;
+      const proto = v && v.prototype;
+      if (proto && proto.loadSource && !proto.__m3u8Hooked) {
+        const orig = proto.loadSource;
+        proto.loadSource = function (src) { report(src); return orig.apply(this, arguments); };
+        proto.__m3u8Hooked = true;
+      }
+    }
+  });
+})();
+"""
+
+
+# Contexts whose pages already carry the hooks, pages given them one by
+# one (outside a hooked context), and the capture active on each page
+_hooked_contexts = weakref.WeakSet()
+_hooked_pages = weakref.WeakSet()
+_active = {}
+
+
+def is_manifest(url: str) -> bool:
+    return ".m3u8" in url and not is_ignored(url)
+
+
+class Candidates(list):
+    """Manifest URLs, first seen first. `seconds` is how long the first
+    one took from the start of the capture, None when there is none."""
+
+    def __init__(self, urls=(), seconds=None):
+        super().__init__(urls)
+        self.seconds = seconds
+
+
+def time_to_first(urls):
+    """Seconds to the first manifest of a scan's candidates, if known."""
+    return getattr(urls, "seconds", None)
+
+
+async def install_context_hooks(context):
+    """Installs the JS hooks once for every page `context` will ever open.
+    Reports go to whichever M3U8Capture is active on the reporting page,
+    so recycled pages need no per-page setup."""
+    if context in _hooked_contexts:
+        return
+    await context.expose_binding("__m3u8Found", _dispatch)
+    await context.add_init_script(CAPTURE_INIT_SCRIPT)
+    _hooked_contexts.add(context)
+
+
+def _dispatch(source, url):
+    cap = _active.get(source.get("page"))
+    if cap is not None:
+        cap._offer(url)
+
+
+class M3U8Capture:
+    """Resolves a future on the first manifest a page asks for.
+
+    Listens to network requests/responses and to the injected JS hooks,
+    then detaches its listeners and stops the page loading:
+
+        async with M3U8Capture(page) as cap:
+            await cap.race(page.goto(url), timeout=6)
+            url = await cap.wait(timeout=2)
+
+    With `window` > 0 it keeps listening that many seconds after the first
+    manifest, and collect() returns every distinct one seen in order.
+    `first_after` is the time from entering the capture (just before
+    navigation) to the first manifest, without the window.
+    """
+
+    def __init__(self, page, events=("request", "response"), window=0):
+        self.page = page
+        self.events = events
+        self.window = window
+        self.candidates = []
+        loop = asyncio.get_running_loop()
+        self.future = loop.create_future()
+        self._closed = loop.create_future()
+        self._attached = False
+        self.started = None
+        self.first_after = None
+        self._timer = None
+        self._tasks = set()
+
+    @property
+    def url(self):
+        return self.future.result() if self.future.done() else None
+
+    async def __aenter__(self):
+        for event in self.events:
+            self.page.on(event, self._on_network)
+        self._attached = True
+        self.started = time.monotonic()
+        _active[self.page] = self
+        if self.page.context in _hooked_contexts or self.page in _hooked_pages:
+            return self
+        try:
+            # Same dispatch as the context hooks, so a reused page reaches
+            # whichever capture is active on it
+            await self.page.expose_binding("__m3u8Found", _dispatch)
+            _hooked_pages.add(self.page)
+            await self.page.add_init_script(CAPTURE_INIT_SCRIPT)
+        except PlaywrightError:
+            # A page closing under us; network listeners still work without the JS hooks
+            pass
+        return self
+
+    async def __aexit__(self, *exc):
+        self.detach()
+        if _active.get(self.page) is self:
+            del _active[self.page]
+        if self._timer is not None:
+            self._timer.cancel()
+        if not self.future.done():
+            self.future.cancel()
+        if not self._closed.done():
+            self._closed.set_result(None)
+        if self._tasks:
+            # window.stop() gets a moment to land, but nothing outlives the capture
+            _, pending = await asyncio.wait(set(self._tasks), timeout=STOP_GRACE)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def detach(self):
+        if not self._attached:
+            return
+        self._attached = False
+        for event in self.events:
+            try:
+                self.page.remove_listener(event, self._on_network)
+            except Exception:
+                pass
+
+    def _on_network(self, req_or_resp):
+        self._offer(req_or_resp.url)
+
+    def _offer(self, url):
+        if self._closed.done() or not url or not is_manifest(url) or url in self.candidates:
+            return
+        self.candidates.append(url)
+        if self.future.done():
+            return
+        self.first_after = time.monotonic() - self.started
+        self.future.set_result(url)
+        if self.window > 0:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._close)
+        else:
+            self._close()
+
+    def _close(self):
+        if self._closed.done():
+            return
+        self._closed.set_result(None)
+        self.detach()
+        self._spawn(self._stop_loading())
+
+    async def _stop_loading(self):
+        try:
+            await self.page.evaluate("window.stop()")
+        except Exception:
+            pass
+
+    async def wait(self, timeout):
+        """Waits up to `timeout` seconds. Returns the URL or None."""
+        try:
+            return await asyncio.wait_for(asyncio.shield(self.future), timeout)
+        except asyncio.TimeoutError:
+            return self.url
+
+    async def collect(self, timeout) -> Candidates:
+        """Waits up to `timeout` for the first manifest, then for the rest
+        of the window. Returns every candidate, first seen first."""
+        if await self.wait(timeout) is None:
+            return Candidates()
+        await asyncio.wait({self._closed}, timeout=self.window)
+        return Candidates(self.candidates, self.first_after)
+
+    async def race(self, coro, timeout=None):
+        """Runs `coro` (navigation, clicks...) until it finishes or a
+        manifest is captured, whichever comes first. An error from `coro`
+        is only raised if nothing was captured; navigation often aborts
+        once we stop the page."""
+        task = self._spawn(coro)
+        error = None
+        try:
+            await asyncio.wait({task, self.future}, timeout=timeout,
+                               return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not task.done():
+                task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                error = e
+        if error is not None and self.url is None:
+            raise error
+        return self.url
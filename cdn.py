@@ -0,0 +1,250 @@
+"""Picks the fastest of several manifest candidates for one stream.
+
+Embeds often request the same stream from more than one CDN (SharkStreams
+rotates across cdn1.dbfile.cfd, cdn7.stcloud.xyz, cdn7.dtplumber.cfd...).
+The capture keeps every candidate it sees within CANDIDATE_WINDOW, one per
+host, and rank_candidates() orders them:
+
+- when every candidate host has MIN_SAMPLES of history, by that history
+  alone, without a request;
+- otherwise by probing all of them at once: time to the manifest's first
+  byte, then a timed read of up to PROBE_SEGMENT_BYTES of the newest
+  segment.
+
+The first URL is emitted; the runners-up are kept as fallbacks for this
+process (fallbacks_for) and get a chance when the emitted one fails the
+liveness probe (swap_dead). Probe outcomes land in the per-host history,
+saved between runs like HostHealth:
+
+    {host: {"ttfb": [seconds, ...], "bps": [bytes/s, ...], "ok": [1, 0, ...]}}
+"""
+import asyncio
+import json
+import os
+import time
+from urllib.parse import urljoin
+
+import aiohttp
+
+import metrics
+from hls import choose_variant, is_master, parse_master
+from host_health import host_of
+from http_client import new_session
+from probe import probe_all
+
+# --- CONFIGURATION ---
+CDN_HISTORY_FILE = "state/cdn_speed.json"
+# Collection goes on this long after the first manifest shows up (seconds)
+CANDIDATE_WINDOW = 1.5
+CDN_TIMEOUT = 5
+# Enough of a segment to see sustained throughput, not just the first packet
+PROBE_SEGMENT_BYTES = 256 * 1024
+MAX_MANIFEST_BYTES = 256 * 1024
+WINDOW = 20
+MIN_SAMPLES = 3
+# Hosts failing more often than this rank after every healthy one
+MIN_OK_RATE = 0.5
+
+_fallbacks = {}
+_histories = {}
+_forward = None
+
+
+def median(values):
+    ranked = sorted(values)
+    return ranked[len(ranked) // 2]
+
+
+def expected_seconds(ttfb, bps) -> float:
+    """What the ranking minimises: first byte, then one probe's worth of segment."""
+    return ttfb + PROBE_SEGMENT_BYTES / max(bps, 1)
+
+
+class CDNHistory:
+    def __init__(self, path=None):
+        self.path = path
+        self.hosts = {}
+        if path:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.hosts = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self.hosts = {}
+
+    def save(self):
+        if not self.path:
+            return
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.hosts, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def record(self, result):
+        host = host_of(result["url"])
+        if not host:
+            return
+        h = self.hosts.setdefault(host, {"ttfb": [], "bps": [], "ok": []})
+        h["ok"] = (h["ok"] + [1 if result["ok"] else 0])[-WINDOW:]
+        if result["ok"]:
+            h["ttfb"] = (h["ttfb"] + [round(result["ttfb"], 3)])[-WINDOW:]
+            h["bps"] = (h["bps"] + [int(result["bps"])])[-WINDOW:]
+        if _forward is not None:
+            _forward.put(("cdn", self.path, result))
+
+    def known(self, url) -> bool:
+        h = self.hosts.get(host_of(url))
+        return bool(h) and len(h["ok"]) >= MIN_SAMPLES
+
+    def score(self, url) -> tuple:
+        """Sort key: healthy hosts by expected seconds, then the rest."""
+        h = self.hosts.get(host_of(url))
+        if not h or not h["ok"] or not h["ttfb"]:
+            return (1, float("inf"))
+        failing = sum(h["ok"]) / len(h["ok"]) < MIN_OK_RATE
+        return (1 if failing else 0, expected_seconds(median(h["ttfb"]), median(h["bps"])))
+
+    def report(self) -> str:
+        lines = []
+        for host, h in sorted(self.hosts.items(), key=lambda kv: self.score("https://" + kv[0])):
+            rate = f"{sum(h['ok']) * 100 // len(h['ok'])}%" if h["ok"] else "-"
+            if h["ttfb"]:
+                speed = f"TTFB {median(h['ttfb']) * 1000:.0f} ms, {median(h['bps']) / 1e6:.1f} MB/s"
+            else:
+                speed = "no successful probe"
+            lines.append(f"{host}: ok {rate} of {len(h['ok'])}, {speed}")
+        return "\n".join(lines)
+
+
+def history(path=None) -> CDNHistory:
+    """One history per file for the whole process."""
+    path = path or CDN_HISTORY_FILE
+    if path not in _histories:
+        _histories[path] = CDNHistory(path)
+    return _histories[path]
+
+
+def forward_to(out):
+    """In a shard worker: every probe outcome recorded from here on is also
+    put on `out` as ("cdn", path, result), for the parent to record."""
+    global _forward
+    _forward = out
+
+
+async def _read(resp, limit):
+    body = b""
+    while len(body) < limit:
+        chunk = await resp.content.read(limit - len(body))
+        if not chunk:
+            break
+        body += chunk
+    return body
+
+
+async def probe_speed(session, url, headers=None) -> dict:
+    """{"url", "ok", "ttfb", "bps", "reason"}: time to the manifest's first
+    byte and the read speed of its newest segment (through the first
+    variant of a master playlist)."""
+    result = {"url": url, "ok": False, "ttfb": None, "bps": None, "reason": ""}
+    start = time.monotonic()
+    try:
+        async with session.get(url, headers=headers, allow_redirects=True) as resp:
+            if resp.status != 200:
+                result["reason"] = f"HTTP {resp.status}"
+                return result
+            first = await resp.content.readany()
+            result["ttfb"] = time.monotonic() - start
+            text = (first + await _read(resp, MAX_MANIFEST_BYTES - len(first))).decode("utf-8", errors="ignore")
+            base = str(resp.url)
+
+        if is_master(text):
+            variant = choose_variant(parse_master(text, base), "lowest")
+            if not variant:
+                result["reason"] = "empty master playlist"
+                return result
+            async with session.get(variant["url"], headers=headers, allow_redirects=True) as resp:
+                base = str(resp.url)
+                text = (await _read(resp, MAX_MANIFEST_BYTES)).decode("utf-8", errors="ignore")
+
+        segments = [line.strip() for line in text.splitlines() if line.strip() and not line.startswith("#")]
+        if not segments:
+            result["reason"] = "no segments"
+            return result
+        seg_start = time.monotonic()
+        async with session.get(urljoin(base, segments[-1]), headers=headers, allow_redirects=True) as resp:
+            if resp.status != 200:
+                result["reason"] = f"segment HTTP {resp.status}"
+                return result
+            size = len(await _read(resp, PROBE_SEGMENT_BYTES))
+        result["bps"] = size / max(time.monotonic() - seg_start, 1e-3)
+        result["ok"] = size > 0
+        if not size:
+            result["reason"] = "empty segment"
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        result["reason"] = type(e).__name__
+    return result
+
+
+def one_per_host(urls) -> list:
+    seen = set()
+    out = []
+    for url in urls:
+        host = host_of(url)
+        if host not in seen:
+            seen.add(host)
+            out.append(url)
+    return out
+
+
+async def rank_candidates(urls, headers=None, hist=None) -> list:
+    """`urls` fastest first. A single candidate is returned as is."""
+    urls = one_per_host(urls)
+    if len(urls) < 2:
+        return urls
+    hist = hist or history()
+    metrics.count("cdn_multi_candidate")
+    if all(hist.known(u) for u in urls):
+        metrics.count("cdn_history_picks")
+        ranked = sorted(urls, key=hist.score)
+    else:
+        with metrics.span("cdn_probe", candidates=len(urls)):
+            async with new_session(timeout=CDN_TIMEOUT, limit_per_host=2) as session:
+                results = await asyncio.gather(*(probe_speed(session, u, headers) for u in urls))
+        for r in results:
+            hist.record(r)
+        metrics.count("cdn_probed_picks")
+        alive = sorted((r for r in results if r["ok"]), key=lambda r: expected_seconds(r["ttfb"], r["bps"]))
+        # When nothing answers, keep capture order rather than drop the stream
+        ranked = [r["url"] for r in alive] or urls
+    remember_fallbacks(ranked[0], ranked[1:])
+    return ranked
+
+
+def remember_fallbacks(url, fallbacks):
+    if url and fallbacks:
+        _fallbacks[url] = list(fallbacks)
+
+
+def fallbacks_for(url) -> list:
+    return _fallbacks.get(url, [])
+
+
+async def swap_dead(urls, alive, headers=None) -> int:
+    """Each dead URL in `urls` is replaced by its first fallback that passes
+    the liveness probe. Changes `urls` and `alive` in place; returns how
+    many were revived."""
+    tries = [(i, fb) for i, (url, ok) in enumerate(zip(urls, alive)) if url and not ok
+             for fb in fallbacks_for(url)]
+    if not tries:
+        return 0
+    probes = await probe_all([fb for _, fb in tries], headers)
+    revived = 0
+    for (i, fb), r in zip(tries, probes):
+        if r["ok"] and not alive[i]:
+            urls[i] = fb
+            alive[i] = True
+            revived += 1
+    metrics.count("cdn_fallbacks_used", revived)
+    return revived
@@ -0,0 +1,179 @@
+"""Per-domain browser engine choice for the browser tier (--engine auto).
+
+Each source keeps, per embed domain and engine, the recent outcomes of
+its scans: seconds from navigation to the first manifest, success, and
+the engine's browser memory when the scan ended. Memory is measured on
+the whole browser, so with several pages in flight it is shared between
+domains; it is meant for comparing engines, not pages.
+
+A domain goes to its fastest reliable engine: among the candidates with
+MIN_SAMPLES, those whose success rate is within OK_RATE_SLACK of the
+best one, lowest median time to manifest first. Until there is enough
+data it stays on the source's default engine. SAMPLE_RATE of the scans
+go to another candidate instead, the least sampled one for that domain,
+so the comparison keeps up as players change.
+
+Saved between runs like HostHealth:
+
+    {domain: {engine: {"ttm": [seconds, ...], "ok": [1, 0, ...], "rss": [MB, ...]}}}
+
+    python engines.py                          # every state/engines_*.json
+    python engines.py state/engines_ppv.json
+"""
+import argparse
+import glob
+import json
+import os
+import random
+
+import metrics
+from host_health import host_of, percentile
+
+# --- CONFIGURATION ---
+AUTO = "auto"
+ENGINE_FILES = "state/engines_*.json"
+# Engines --engine auto chooses between (webkit can be added where it's installed)
+CANDIDATES = ("chromium", "firefox")
+# Share of scans sent to another engine than the domain's current pick
+SAMPLE_RATE = 0.1
+WINDOW = 30
+MIN_SAMPLES = 5
+# Engines this close to the best success rate count as equally reliable
+OK_RATE_SLACK = 0.1
+
+_stats = {}
+_forward = None
+
+
+class EngineStats:
+    def __init__(self, path=None, candidates=CANDIDATES, sample_rate=SAMPLE_RATE, rng=None):
+        self.path = path
+        self.candidates = tuple(candidates)
+        self.sample_rate = sample_rate
+        self.rng = rng or random.Random()
+        self.hosts = {}
+        if path:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.hosts = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self.hosts = {}
+
+    def save(self):
+        if not self.path:
+            return
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.hosts, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def record(self, url, engine, ok, ttm=None, rss_mb=None):
+        """One scan of `url` on `engine`; `ttm` is navigation to manifest."""
+        host = host_of(url)
+        if not host:
+            return
+        e = self.hosts.setdefault(host, {}).setdefault(engine, {"ttm": [], "ok": [], "rss": []})
+        e["ok"] = (e["ok"] + [1 if ok else 0])[-WINDOW:]
+        if ok and ttm is not None:
+            e["ttm"] = (e["ttm"] + [round(ttm, 2)])[-WINDOW:]
+        if rss_mb:
+            e["rss"] = (e["rss"] + [int(rss_mb)])[-WINDOW:]
+        if _forward is not None:
+            _forward.put(("engine", self.path, (url, engine, ok, ttm, rss_mb)))
+
+    def samples(self, url, engine) -> int:
+        return len(self.hosts.get(host_of(url), {}).get(engine, {}).get("ok", []))
+
+    def best(self, url, default) -> str:
+        """The fastest reliable engine for `url`'s domain, or `default`
+        while no candidate has enough samples."""
+        h = self.hosts.get(host_of(url), {})
+        rated = {}
+        for engine in self.candidates:
+            e = h.get(engine)
+            if e and len(e["ok"]) >= MIN_SAMPLES:
+                rated[engine] = sum(e["ok"]) / len(e["ok"])
+        if not rated:
+            return default
+        top = max(rated.values())
+        reliable = [e for e, rate in rated.items() if rate >= top - OK_RATE_SLACK and h[e]["ttm"]]
+        if not reliable:
+            return default
+        return min(reliable, key=lambda e: percentile(h[e]["ttm"], 50))
+
+    def pick(self, url, default) -> str:
+        """Engine for the next scan of `url`: best(), or now and then
+        another candidate as a sample."""
+        choice = self.best(url, default)
+        others = [e for e in self.candidates if e != choice]
+        if others and self.rng.random() < self.sample_rate:
+            choice = min(others, key=lambda e: self.samples(url, e))
+            metrics.count("engine_samples")
+        metrics.count(f"engine_{choice}")
+        return choice
+
+    def report(self) -> str:
+        """Per domain, each engine's success, time to manifest and peak
+        memory, and the engine the domain is routed to."""
+        lines = []
+        totals = {}
+        for host in sorted(self.hosts):
+            h = self.hosts[host]
+            lines.append(f"{host} → {self.best('https://' + host, 'default')}")
+            for engine in sorted(h):
+                e = h[engine]
+                t = totals.setdefault(engine, {"ttm": [], "ok": [], "rss": []})
+                for k in t:
+                    t[k] += e[k]
+                lines.append(f"  {engine_line(engine, e)}")
+        if totals:
+            lines.append("all domains")
+            lines += [f"  {engine_line(engine, t)}" for engine, t in sorted(totals.items())]
+        return "\n".join(lines)
+
+
+def engine_line(engine, e) -> str:
+    rate = f"{sum(e['ok']) * 100 // len(e['ok'])}%" if e["ok"] else "-"
+    ttm = f"p50 {percentile(e['ttm'], 50):.1f}s, p95 {percentile(e['ttm'], 95):.1f}s" if e["ttm"] else "no manifest"
+    rss = f"{max(e['rss'])} MB" if e["rss"] else "-"
+    return f"{engine:<9} ok {rate:>4} of {len(e['ok']):<3} to m3u8 {ttm}, peak RSS {rss}"
+
+
+def engine_summary(counters) -> str:
+    """Scans per engine in this run, from the pick() counters."""
+    used = [f"{e} {counters[f'engine_{e}']}" for e in CANDIDATES if counters.get(f"engine_{e}")]
+    line = ", ".join(used) or "no browser scans"
+    if counters.get("engine_samples"):
+        line += f" ({counters['engine_samples']} samples)"
+    return line
+
+
+def engine_stats(path) -> EngineStats:
+    """One per file for the whole process."""
+    if path not in _stats:
+        _stats[path] = EngineStats(path)
+    return _stats[path]
+
+
+def forward_to(out):
+    """In a shard worker: every sample recorded from here on is also put
+    on `out` as ("engine", path, sample), for the parent to record."""
+    global _forward
+    _forward = out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare browser engines per embed domain")
+    parser.add_argument("files", nargs="*", help=f"engine stats files (default {ENGINE_FILES})")
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(ENGINE_FILES))
+    if not files:
+        print(f"🤷 No engine stats yet; run a source with --engine {AUTO}")
+    for path in files:
+        stats = EngineStats(path)
+        print(f"🧪 {path}")
+        print(stats.report() or "  (empty)")
@@ -0,0 +1,288 @@
+"""Groups the same fixture across sources and builds one merged playlist.
+
+    python events.py                        # list every source, report fixtures listed twice
+    python events.py --merge                # resolve each fixture once, write Merged.m3u8
+    python events.py --merge --alternates   # also keep the other sources' streams
+
+Two listings are the same fixture when their cleaned names share enough
+tokens, their categories don't contradict each other and they start
+within TIME_TOLERANCE of each other (when both sides give a time).
+
+With --merge each fixture is resolved through the cheapest route first:
+a cached URL from any source, then plain HTTP on every listing, and only
+then a browser, one listing at a time in host-health order, stopping at
+the first that plays. The scrapers' own playlists are untouched.
+"""
+import argparse
+import asyncio
+import logging
+import re
+import time
+
+from browser_pool import BrowserPool
+from cdn import history as cdn_history
+from http_extract import http_resolve_many
+from m3u import render_playlist, write_if_changed
+from sharkstreams import TV_IDS, strip_non_ascii
+from sites import SITES
+
+log = logging.getLogger("events")
+
+# --- CONFIGURATION ---
+MERGED_FILE = "Merged.m3u8"
+# Listed start times may disagree by this much and still be one fixture
+TIME_TOLERANCE = 2 * 60 * 60
+# Shared name tokens over the shorter name's tokens
+NAME_MATCH = 0.75
+# Browser pages open at once across all fixtures
+PAGE_BUDGET = 6
+# Tie-break when host health doesn't prefer either listing
+SOURCE_ORDER = tuple(SITES)
+
+STOPWORDS = {"vs", "v", "at", "the", "and", "live", "fc", "sc", "cf"}
+# Category spellings TV_IDS doesn't cover, mapped onto one of its families
+FAMILY_ALIASES = {
+    "combat sports": TV_IDS["ufc"],
+    "wrestling": TV_IDS["wwe"],
+    "motorsports": TV_IDS["f1"],
+    "ice hockey": TV_IDS["nhl"],
+}
+
+
+def name_tokens(name: str) -> frozenset:
+    """'Los Angeles Lakers vs. Boston Celtics (Nov 18 - 07:00 PM ET)'
+    -> {'los', 'angeles', 'lakers', 'boston', 'celtics'}"""
+    text = re.sub(r"\([^)]*\)", " ", strip_non_ascii(name or "")).lower()
+    return frozenset(t for t in re.split(r"[^a-z0-9]+", text) if t and t not in STOPWORDS)
+
+
+def category_family(category: str):
+    """The TV_IDS family a category belongs to, or None when unknown."""
+    clean = strip_non_ascii(category or "").lower().replace("-", " ").strip()
+    if clean in FAMILY_ALIASES:
+        return FAMILY_ALIASES[clean]
+    for key, family in TV_IDS.items():
+        if key != "other" and key in clean:
+            return family
+    return None
+
+
+def name_score(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    shared = len(a & b)
+    # One shared word ("united") is never enough on its own
+    if shared < min(2, len(a), len(b)):
+        return 0.0
+    return shared / min(len(a), len(b))
+
+
+class Group:
+    """One fixture: at most one listing per source."""
+    __slots__ = ("id", "members", "tokens", "family", "starts_at")
+
+    def __init__(self, gid, tokens, family, starts_at):
+        self.id = gid
+        self.members = []
+        self.tokens = tokens
+        self.family = family
+        self.starts_at = starts_at
+
+    @property
+    def sources(self):
+        return {source for source, _ in self.members}
+
+    def score(self, tokens, family, starts_at) -> float:
+        if self.family and family and self.family != family:
+            return 0.0
+        if self.starts_at and starts_at and abs(self.starts_at - starts_at) > TIME_TOLERANCE:
+            return 0.0
+        return name_score(self.tokens, tokens)
+
+
+class EventIndex:
+    """Listings from every source, grouped into fixtures as they are added.
+    Candidates come from an inverted index on name tokens, so adding a
+    listing only looks at groups that share a word with it."""
+
+    def __init__(self):
+        self.groups = []
+        self._by_token = {}
+
+    def add(self, source, event) -> Group:
+        tokens = name_tokens(event.get("name") or event.get("title"))
+        family = category_family(event.get("category"))
+        starts_at = event.get("starts_at") or None
+
+        candidates = set()
+        for token in tokens:
+            candidates |= self._by_token.get(token, set())
+        best, best_score = None, NAME_MATCH
+        for gid in sorted(candidates):
+            group = self.groups[gid]
+            if source in group.sources:
+                continue
+            score = group.score(tokens, family, starts_at)
+            if score >= best_score:
+                best, best_score = group, score
+
+        if best is None:
+            best = Group(len(self.groups), tokens, family, starts_at)
+            self.groups.append(best)
+            for token in tokens:
+                self._by_token.setdefault(token, set()).add(best.id)
+        best.members.append((source, event))
+        best.family = best.family or family
+        best.starts_at = best.starts_at or starts_at
+        return best
+
+    def shared(self) -> list:
+        """Groups listed by more than one source."""
+        return [g for g in self.groups if len(g.members) > 1]
+
+
+def fallback_order(group, sites) -> list:
+    """Members cheapest-first: healthiest embed host, then SOURCE_ORDER."""
+    return sorted(group.members, key=lambda m: (
+        sites[m[0]].health.rank(m[1]["embed"]),
+        SOURCE_ORDER.index(m[0]) if m[0] in SOURCE_ORDER else len(SOURCE_ORDER),
+    ))
+
+
+async def list_events(sites, index):
+    listings = await asyncio.gather(*(site.fetch_events() for site in sites.values()))
+    for site, events in zip(sites.values(), listings):
+        log.info(f"📋 {site.title}: {len(events)} events")
+        for event in events:
+            index.add(site.name, event)
+
+
+async def resolve_groups(groups, sites, browsers, alternates=False):
+    """{(source, key): url} with every group resolved at most once in a browser."""
+    urls = {}
+    for group in groups:
+        for source, event in group.members:
+            cached = sites[source].cache.get(event["embed"])
+            if cached:
+                urls[(source, event["key"])] = cached
+
+    def wanted(group):
+        members = [(s, e) for s, e in group.members if (s, e["key"]) not in urls]
+        if alternates:
+            return members
+        return [] if len(members) < len(group.members) else members
+
+    # Plain HTTP costs next to nothing, so every listing still open gets it
+    by_source = {}
+    for group in groups:
+        for source, event in wanted(group):
+            by_source.setdefault(source, []).append(event)
+    for source, events in by_source.items():
+        log.info(f"🌐 {sites[source].title}: trying {len(events)} embeds over plain HTTP...")
+        found = await http_resolve_many([e["embed"] for e in events], sites[source].headers)
+        for event, url in zip(events, found):
+            if url:
+                urls[(source, event["key"])] = url
+
+    browsed = 0
+
+    async def browse(group):
+        nonlocal browsed
+        for source, event in fallback_order(group, sites):
+            site = sites[source]
+            if site.cache.should_skip(event["embed"]):
+                continue
+            if not site.health.allow(event["embed"]):
+                # Behind an open breaker: not tried, so not a failure to back off from
+                continue
+            browsed += 1
+            url = await site.browse(browsers, event["embed"])
+            if url:
+                urls[(source, event["key"])] = url
+                return
+            site.cache.mark_failed(event["embed"], starts_at=event.get("starts_at"))
+
+    pending = [g for g in groups if not any((s, e["key"]) in urls for s, e in g.members)]
+    if pending:
+        log.info(f"🧭 Browsing {len(pending)} fixtures, one listing at a time")
+        await asyncio.gather(*(browse(g) for g in pending))
+    log.info(f"🧭 {browsed} browser resolutions for {len(groups)} fixtures "
+             f"({sum(len(g.members) for g in groups)} listings)")
+
+    for group in groups:
+        for source, event in group.members:
+            url = urls.get((source, event["key"]))
+            if url:
+                sites[source].cache.put(event["embed"], url)
+    return urls
+
+
+def merged_entries(groups, sites, urls, alternates=False) -> list:
+    """Primary listing per fixture, then its alternates under the same
+    tvg-id and group, titled with their source."""
+    entries = []
+    for group in sorted(groups, key=lambda g: g.starts_at or 0):
+        resolved = [(s, e, urls[(s, e["key"])]) for s, e in fallback_order(group, sites)
+                    if (s, e["key"]) in urls]
+        if not resolved:
+            continue
+        source, event, url = resolved[0]
+        primary = sites[source].entry(event, url)
+        entries.append(primary)
+        for source, event, url in resolved[1:] if alternates else ():
+            alt = sites[source].entry(event, url)
+            alt.title = f"{primary.title} ({sites[source].title})"
+            alt.attrs["tvg-id"] = primary.attrs.get("tvg-id", "")
+            alt.attrs["group-title"] = primary.attrs.get("group-title", "")
+            entries.append(alt)
+    return entries
+
+
+async def main(names, merge=False, alternates=False, output=MERGED_FILE, page_budget=PAGE_BUDGET):
+    sites = {name: SITES[name]() for name in names}
+    index = EventIndex()
+    await list_events(sites, index)
+
+    shared = index.shared()
+    log.info(f"🔗 {len(index.groups)} fixtures, {len(shared)} listed by more than one source")
+    for group in shared:
+        listed = ", ".join(f"{sites[s].title}: {e.get('name') or e.get('title')}" for s, e in group.members)
+        log.info(f"   • {listed}")
+    if not merge:
+        return
+
+    async with BrowserPool(page_budget) as browsers:
+        urls = await resolve_groups(index.groups, sites, browsers, alternates)
+    for site in sites.values():
+        site.cache.evict()
+        site.cache.save()
+        site.health.save()
+    cdn_history().save()
+
+    entries = merged_entries(index.groups, sites, urls, alternates)
+    if write_if_changed(output, render_playlist(entries)):
+        log.info(f"💾 {len(entries)} entries written to {output}")
+    else:
+        log.info(f"💤 {output} unchanged")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cross-source fixture index and merged playlist")
+    parser.add_argument("sources", nargs="*",
+                        help=f"sources to index (default: all of {', '.join(SITES)})")
+    parser.add_argument("--merge", action="store_true",
+                        help=f"resolve each fixture once and write {MERGED_FILE}")
+    parser.add_argument("--alternates", action="store_true",
+                        help="keep every source that resolves without a browser as an alternate entry")
+    parser.add_argument("-o", "--output", default=MERGED_FILE)
+    parser.add_argument("--pages", type=int, default=PAGE_BUDGET,
+                        help=f"browser pages open at once (default {PAGE_BUDGET})")
+    args = parser.parse_args()
+
+    unknown = [n for n in args.sources if n not in SITES]
+    if unknown:
+        parser.error(f"unknown source(s): {', '.join(unknown)}")
+
+    start = time.monotonic()
+    asyncio.run(main(args.sources or list(SITES), args.merge, args.alternates, args.output, args.pages))
+    log.info(f"🕓 Done in {time.monotonic() - start:.1f}s")
@@ -0,0 +1,290 @@
+"""Serves stable per-event playlist URLs and resolves them on demand.
+
+    python gateway.py                         # http://127.0.0.1:8787
+    python gateway.py --port 9000 --pages 4
+
+    /ppv.m3u8, /shark.m3u8      every listed event, pointing back at the gateway
+    /ppv/<id>.m3u8              one PPV event (id from the ppv.to API)
+    /shark/<slug>.m3u8          one SharkStreams match (slug of its title)
+    /status                     counters as JSON
+
+An event is resolved the first time someone asks for it (plain HTTP tier
+first, then a warm browser page) and the URL is kept until its token is
+about to expire. Concurrent requests for the same event, manifest or
+listing share a single upstream request, so a thousand viewers opening
+the same match cost one resolution. Manifests are fetched with the
+source's Origin/Referer/User-Agent and rewritten so variants, keys and
+segments go through /<source>/relay, which sends the same headers;
+players need no #EXTVLCOPT support.
+"""
+import argparse
+import asyncio
+import logging
+import re
+import time
+from urllib.parse import quote, urljoin
+
+import aiohttp
+from aiohttp import web
+
+from browser_pool import BrowserPool
+from host_health import host_of
+from http_client import new_session
+from http_extract import http_resolve_many
+from m3u import render_playlist
+from sites import SITES
+
+log = logging.getLogger("gateway")
+
+# --- CONFIGURATION ---
+HOST = "127.0.0.1"
+PORT = 8787
+# Pages open at once for on-demand resolutions
+PAGE_BUDGET = 4
+# Event listings are refetched at most this often
+LISTING_TTL = 5 * 60
+# Viewers asking for the same live manifest within this window share one fetch
+MANIFEST_TTL = 2
+# An event that failed to resolve isn't retried for this long
+NEGATIVE_TTL = 60
+UPSTREAM_TIMEOUT = 15
+RELAY_CHUNK = 64 * 1024
+# Upstream answers meaning the token behind a cached URL went stale
+STALE_STATUSES = {401, 403, 404, 410}
+
+HLS_CONTENT_TYPE = "application/vnd.apple.mpegurl"
+URI_ATTR_RE = re.compile(r'URI="([^"]+)"')
+
+
+def rewrite_playlist(text, base_url, relay) -> str:
+    """Points every URI in an HLS playlist (variants, segments, keys, maps)
+    at `relay(absolute_url)`."""
+    out = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped and not stripped.startswith("#"):
+            out.append(relay(urljoin(base_url, stripped)))
+        elif 'URI="' in stripped:
+            out.append(URI_ATTR_RE.sub(lambda m: f'URI="{relay(urljoin(base_url, m.group(1)))}"', line))
+        else:
+            out.append(line)
+    return "\n".join(out) + "\n"
+
+
+class Gateway:
+    def __init__(self, sites, browsers):
+        self.sites = {s.name: s for s in sites}
+        self.browsers = browsers
+        self.session = None
+        self.inflight = {}
+        self.manifests = {}
+        self.failed = {}
+        self.stats = {"requests": 0, "resolutions": 0, "resolved": 0, "coalesced": 0,
+                      "cache_hits": 0, "manifest_fetches": 0, "relayed": 0, "refreshed": 0}
+
+    async def _once(self, key, make):
+        """Runs make() once for everyone waiting on `key`. The shared task is
+        shielded, so a viewer hanging up never cancels it for the others."""
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(make())
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        else:
+            self.stats["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    # --- events ---
+    async def _list(self, site):
+        events = await site.fetch_events()
+        if events:
+            site.events = {e["key"]: e for e in events}
+        site.listed_at = time.monotonic()
+        log.info(f"📋 {site.name}: {len(site.events)} events listed")
+
+    async def event(self, site, key):
+        if site.listed_at is None or time.monotonic() - site.listed_at > LISTING_TTL:
+            await self._once(("listing", site.name), lambda: self._list(site))
+        return site.events.get(key)
+
+    # --- resolution ---
+    async def resolve(self, site, event):
+        embed = event["embed"]
+        url = site.cache.get(embed)
+        if url:
+            self.stats["cache_hits"] += 1
+            return url
+        if time.time() - self.failed.get(embed, 0) < NEGATIVE_TTL:
+            return None
+        return await self._once(("resolve", embed), lambda: self._resolve(site, embed))
+
+    async def _resolve(self, site, embed):
+        self.stats["resolutions"] += 1
+        log.info(f"🔎 Resolving {site.name} {embed}")
+        found = (await http_resolve_many([embed], site.headers))[0]
+        if not found and site.health.allow(embed):
+            found = await site.browse(self.browsers, embed)
+        if not found:
+            self.failed[embed] = time.time()
+            return None
+        self.stats["resolved"] += 1
+        site.cache.put(embed, found)
+        site.hosts.add(host_of(found))
+        return found
+
+    def invalidate(self, site, event, url):
+        """Forgets `url` unless a newer resolution already replaced it."""
+        entry = site.cache.ok.get(event["embed"])
+        if entry and entry[0] == url:
+            site.cache.forget(event["embed"])
+
+    # --- upstream ---
+    async def fetch_manifest(self, site, url):
+        """(status, final_url, text), shared by everyone asking within MANIFEST_TTL."""
+        cached = self.manifests.get(url)
+        if cached and time.monotonic() - cached[0] < MANIFEST_TTL:
+            return cached[1]
+        return await self._once(("manifest", url), lambda: self._fetch_manifest(site, url))
+
+    async def _fetch_manifest(self, site, url):
+        self.stats["manifest_fetches"] += 1
+        try:
+            async with self.session.get(url, headers=site.headers) as resp:
+                text = await resp.text(errors="ignore") if resp.status == 200 else ""
+                result = (resp.status, str(resp.url), text)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            result = (502, url, "")
+        now = time.monotonic()
+        self.manifests = {u: c for u, c in self.manifests.items() if now - c[0] < MANIFEST_TTL}
+        self.manifests[url] = (now, result)
+        return result
+
+    def playlist_response(self, site, final_url, text):
+        def relay(url):
+            site.hosts.add(host_of(url))
+            return f"/{site.name}/relay?u={quote(url, safe='')}"
+
+        return web.Response(text=rewrite_playlist(text, final_url, relay), content_type=HLS_CONTENT_TYPE,
+                            headers={"Cache-Control": "no-cache"})
+
+    # --- handlers ---
+    def site_for(self, request):
+        site = self.sites.get(request.match_info["site"])
+        if site is None:
+            raise web.HTTPNotFound(text="unknown source")
+        return site
+
+    async def handle_event(self, request):
+        self.stats["requests"] += 1
+        site = self.site_for(request)
+        event = await self.event(site, request.match_info["key"])
+        if event is None:
+            raise web.HTTPNotFound(text="unknown event")
+
+        url = await self.resolve(site, event)
+        if not url:
+            raise web.HTTPServiceUnavailable(text="no stream found for this event (yet)")
+        status, final_url, text = await self.fetch_manifest(site, url)
+        if status in STALE_STATUSES:
+            # Token expired early: re-resolve once
+            self.stats["refreshed"] += 1
+            self.invalidate(site, event, url)
+            url = await self.resolve(site, event)
+            if not url:
+                raise web.HTTPServiceUnavailable(text="stream went away")
+            status, final_url, text = await self.fetch_manifest(site, url)
+        if status != 200:
+            raise web.HTTPBadGateway(text=f"upstream answered {status}")
+        return self.playlist_response(site, final_url, text)
+
+    async def handle_relay(self, request):
+        site = self.site_for(request)
+        url = request.query.get("u", "")
+        if not url.startswith("http") or host_of(url) not in site.hosts:
+            raise web.HTTPForbidden(text="not a host this gateway has served")
+        self.stats["relayed"] += 1
+
+        if url.split("?", 1)[0].endswith(".m3u8"):
+            status, final_url, text = await self.fetch_manifest(site, url)
+            if status != 200:
+                raise web.HTTPBadGateway(text=f"upstream answered {status}")
+            return self.playlist_response(site, final_url, text)
+
+        headers = dict(site.headers)
+        if "Range" in request.headers:
+            headers["Range"] = request.headers["Range"]
+        try:
+            async with self.session.get(url, headers=headers) as up:
+                resp = web.StreamResponse(status=up.status)
+                for name in ("Content-Type", "Content-Length", "Content-Range", "Accept-Ranges"):
+                    if name in up.headers:
+                        resp.headers[name] = up.headers[name]
+                await resp.prepare(request)
+                async for chunk in up.content.iter_chunked(RELAY_CHUNK):
+                    await resp.write(chunk)
+                await resp.write_eof()
+                return resp
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            raise web.HTTPBadGateway(text="upstream fetch failed")
+
+    async def handle_index(self, request):
+        site = self.site_for(request)
+        await self.event(site, "")
+        origin = f"{request.scheme}://{request.host}"
+        entries = []
+        for key, event in site.events.items():
+            entry = site.entry(event, f"{origin}/{site.name}/{quote(key)}.m3u8")
+            # The gateway sends these upstream itself
+            entry.options = []
+            entries.append(entry)
+        return web.Response(text=render_playlist(entries), content_type=HLS_CONTENT_TYPE)
+
+    async def handle_status(self, request):
+        return web.json_response({
+            **self.stats,
+            "inflight": len(self.inflight),
+            "events": {name: len(s.events) for name, s in self.sites.items()},
+            "cached": {name: len(s.cache.ok) for name, s in self.sites.items()},
+        })
+
+    # --- lifecycle ---
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/status", self.handle_status)
+        app.router.add_get("/{site}.m3u8", self.handle_index)
+        app.router.add_get("/{site}/relay", self.handle_relay)
+        app.router.add_get("/{site}/{key}.m3u8", self.handle_event)
+        app.on_startup.append(self._startup)
+        app.on_cleanup.append(self._cleanup)
+        return app
+
+    async def _startup(self, app):
+        self.session = new_session(timeout=UPSTREAM_TIMEOUT)
+
+    async def _cleanup(self, app):
+        await self.session.close()
+        await self.browsers.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="On-demand resolving HLS gateway")
+    parser.add_argument("sources", nargs="*",
+                        help=f"sources to serve (default: all of {', '.join(SITES)})")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--pages", type=int, default=PAGE_BUDGET,
+                        help=f"browser pages open at once (default {PAGE_BUDGET})")
+    parser.add_argument("--browser-server", default=None,
+                        help="ws:// Playwright server or http:// CDP endpoint to attach to instead of launching")
+    args = parser.parse_args()
+
+    unknown = [n for n in args.sources if n not in SITES]
+    if unknown:
+        parser.error(f"unknown source(s): {', '.join(unknown)}")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)-8s | %(message)s",
+                        datefmt="%H:%M:%S")
+    gateway = Gateway([SITES[name]() for name in args.sources or SITES],
+                      BrowserPool(page_budget=args.pages, server=args.browser_server))
+    log.info(f"🚪 Gateway for {', '.join(gateway.sites)} on http://{args.host}:{args.port}")
+    web.run_app(gateway.app(), host=args.host, port=args.port, print=None, access_log=None)
@@ -0,0 +1,163 @@
+import asyncio
+import re
+from urllib.parse import urljoin
+
+import aiohttp
+
+import metrics
+from http_client import new_session
+
+# --- CONFIGURATION ---
+HLS_TIMEOUT = 8
+HLS_LIMIT = 32
+HLS_LIMIT_PER_HOST = 4
+# Master playlists are a few KB; anything bigger is a media playlist
+MAX_MANIFEST_BYTES = 256 * 1024
+
+# off: leave URLs alone | annotate: add resolution/bitrate to #EXTINF |
+# pin: also replace a master URL with the variant the policy picks
+VARIANT_MODES = ("off", "annotate", "pin")
+# best | lowest | max-height:<px> | max-bandwidth:<bps>
+DEFAULT_POLICY = "best"
+
+# KEY=VALUE pairs; quoted values (CODECS) may contain commas
+HLS_ATTR_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def parse_hls_attrs(text: str) -> dict:
+    return {k: v.strip('"') for k, v in HLS_ATTR_RE.findall(text)}
+
+
+def is_master(text: str) -> bool:
+    return "#EXT-X-STREAM-INF" in text
+
+
+def parse_master(text: str, base_url: str) -> list:
+    """Variants of a master playlist, each
+    {"url", "bandwidth", "width", "height", "codecs", "frame_rate"}."""
+    variants = []
+    pending = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXT-X-STREAM-INF:"):
+            pending = parse_hls_attrs(line[len("#EXT-X-STREAM-INF:"):])
+        elif pending is not None and line and not line.startswith("#"):
+            width, _, height = pending.get("RESOLUTION", "").partition("x")
+            bandwidth = pending.get("AVERAGE-BANDWIDTH") or pending.get("BANDWIDTH") or "0"
+            variants.append({
+                "url": urljoin(base_url, line),
+                "bandwidth": int(bandwidth) if bandwidth.isdigit() else 0,
+                "width": int(width) if width.isdigit() else 0,
+                "height": int(height) if height.isdigit() else 0,
+                "codecs": pending.get("CODECS", ""),
+                "frame_rate": pending.get("FRAME-RATE", ""),
+            })
+            pending = None
+    return variants
+
+
+def choose_variant(variants, policy=DEFAULT_POLICY):
+    """Picks a variant by policy; falls back to the lowest one when nothing fits a cap."""
+    if not variants:
+        return None
+    by_rate = sorted(variants, key=lambda v: (v["bandwidth"], v["height"]))
+    kind, _, limit = policy.partition(":")
+    if kind == "lowest":
+        return by_rate[0]
+    if kind in ("max-height", "max-bandwidth"):
+        key = "height" if kind == "max-height" else "bandwidth"
+        cap = int(limit)
+        fitting = [v for v in by_rate if v[key] and v[key] <= cap]
+        return fitting[-1] if fitting else by_rate[0]
+    return by_rate[-1]
+
+
+def check_policy(policy: str) -> str:
+    """argparse type for --variant-policy."""
+    kind, _, limit = policy.partition(":")
+    if kind in ("best", "lowest") and not limit:
+        return policy
+    if kind in ("max-height", "max-bandwidth") and limit.isdigit():
+        return policy
+    raise ValueError(f"bad variant policy {policy!r}")
+
+
+class ManifestCache:
+    """Parsed manifests for the lifetime of one run (or one daemon), so a
+    URL listed twice, or seen again on the next publish, is fetched once.
+    Concurrent lookups of the same URL share one request."""
+
+    def __init__(self, headers=None):
+        self.headers = headers
+        self.entries = {}
+        self.fetched = 0
+
+    async def _fetch(self, session, url, headers):
+        """None, or (final_url, variants); variants is [] for a media playlist."""
+        try:
+            async with session.get(url, headers=headers, allow_redirects=True) as resp:
+                if resp.status != 200:
+                    return None
+                # read(n) only returns what is buffered so far, up to n
+                body = b""
+                while len(body) <= MAX_MANIFEST_BYTES:
+                    chunk = await resp.content.read(MAX_MANIFEST_BYTES + 1 - len(body))
+                    if not chunk:
+                        break
+                    body += chunk
+                final_url = str(resp.url)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+        self.fetched += 1
+        if len(body) > MAX_MANIFEST_BYTES:
+            # Cut off somewhere, maybe mid-URI; not worth pinning a variant from
+            return None
+        text = body.decode("utf-8", errors="ignore")
+        return final_url, parse_master(text, final_url) if is_master(text) else []
+
+    async def lookup_many(self, urls, headers=None) -> list:
+        """Parsed result per URL, in input order."""
+        headers = headers or self.headers
+        with metrics.span("hls_variants"):
+            async with new_session(timeout=HLS_TIMEOUT, limit=HLS_LIMIT,
+                                   limit_per_host=HLS_LIMIT_PER_HOST) as session:
+                for url in urls:
+                    if url not in self.entries:
+                        self.entries[url] = asyncio.ensure_future(self._fetch(session, url, headers))
+                return await asyncio.gather(*(self.entries[u] for u in urls))
+
+    def retain(self, urls):
+        """Forgets everything not in `urls` (tokens rotate, old URLs never come back)."""
+        keep = set(urls)
+        self.entries = {u: f for u, f in self.entries.items() if u in keep}
+
+
+async def enrich_entries(entries, mode="annotate", policy=DEFAULT_POLICY, headers=None, cache=None):
+    """Annotates (and with mode="pin", re-points) M3UEntry objects whose URL is
+    a master playlist. Entries are changed in place; returns how many were."""
+    if mode == "off" or not entries:
+        return 0
+    cache = cache or ManifestCache()
+    urls = list(dict.fromkeys(e.url for e in entries))
+    parsed = dict(zip(urls, await cache.lookup_many(urls, headers)))
+
+    changed = 0
+    for entry in entries:
+        result = parsed.get(entry.url)
+        if not result or not result[1]:
+            continue
+        chosen = choose_variant(result[1], policy)
+        if chosen["width"] and chosen["height"]:
+            entry.attrs["resolution"] = f"{chosen['width']}x{chosen['height']}"
+        if chosen["bandwidth"]:
+            entry.attrs["bitrate"] = str(chosen["bandwidth"])
+        if mode == "pin":
+            entry.url = chosen["url"]
+        changed += 1
+    metrics.count("hls_masters", changed)
+    return changed
+
+
+def variant_summary(changed, total, mode) -> str:
+    verb = "pinned" if mode == "pin" else "annotated"
+    return f"{changed}/{total} master playlists {verb}"
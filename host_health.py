@@ -0,0 +1,147 @@
+import json
+import math
+import os
+import time
+from urllib.parse import urlparse
+
+# --- CONFIGURATION ---
+# Outcomes and latencies remembered per host
+WINDOW = 40
+# Below this many samples a host gets the caller's default timeout
+MIN_SAMPLES = 5
+# Derived timeout: p95 of successful grabs plus a margin, kept within bounds
+TIMEOUT_MARGIN = 1.5
+TIMEOUT_FLOOR = 3.0
+TIMEOUT_CEIL_FACTOR = 1.5
+# The breaker opens once the recent success rate drops below this...
+TRIP_RATE = 0.2
+# ...and stays open this long, doubling per failed canary up to the cap
+COOL_OFF = 30 * 60
+COOL_OFF_MAX = 12 * 60 * 60
+# How soon a caller turned away while another one is the canary asks again
+CANARY_RECHECK = 60
+
+
+def host_of(url: str) -> str:
+    try:
+        return (urlparse(url).hostname or "").lower()
+    except ValueError:
+        return ""
+
+
+def percentile(values, pct):
+    ranked = sorted(values)
+    return ranked[min(len(ranked) - 1, math.ceil(pct / 100 * len(ranked)) - 1)]
+
+
+class HostHealth:
+    """Per-host latency and success history for embed pages, persisted
+    between runs, driving timeouts and a circuit breaker.
+
+    Stored as compact JSON:
+        {host: {"lat": [seconds, ...], "ok": [1, 0, ...], "trips": n, "open_until": ts}}
+
+    A host whose breaker is open is skipped until `open_until`; after that
+    exactly one canary request is let through, and its outcome closes the
+    breaker or reopens it for twice as long.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.hosts = {}
+        self.canaries = set()
+        self.tripped = 0
+        if path:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.hosts = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self.hosts = {}
+
+    def save(self):
+        if not self.path:
+            return
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.hosts, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def _host(self, host):
+        return self.hosts.setdefault(host, {"lat": [], "ok": [], "trips": 0, "open_until": 0})
+
+    def timeout(self, url, default) -> float:
+        """Seconds to give `url`: p95 of its host's successes plus a margin."""
+        h = self.hosts.get(host_of(url))
+        if not h or len(h["lat"]) < MIN_SAMPLES:
+            return default
+        derived = percentile(h["lat"], 95) + TIMEOUT_MARGIN
+        return round(min(max(derived, TIMEOUT_FLOOR), default * TIMEOUT_CEIL_FACTOR), 2)
+
+    def allow(self, url, now=None) -> bool:
+        """False while the host's breaker is open. Once it cools off, the
+        first caller gets through as the canary and the rest wait for it."""
+        host = host_of(url)
+        h = self.hosts.get(host)
+        if not h or not h["open_until"]:
+            return True
+        now = now or time.time()
+        if now < h["open_until"] or host in self.canaries:
+            self.tripped += 1
+            return False
+        self.canaries.add(host)
+        return True
+
+    def retry_at(self, url, now=None) -> float:
+        """When a caller allow() turned away may ask again: once the
+        breaker cools off, or a little later while the canary is out."""
+        now = now or time.time()
+        h = self.hosts.get(host_of(url))
+        return max(h["open_until"] if h else 0, now + CANARY_RECHECK)
+
+    def record(self, url, ok, elapsed=None, now=None):
+        host = host_of(url)
+        if not host:
+            return
+        h = self._host(host)
+        h["ok"] = (h["ok"] + [1 if ok else 0])[-WINDOW:]
+        if ok and elapsed is not None:
+            h["lat"] = (h["lat"] + [round(elapsed, 2)])[-WINDOW:]
+
+        now = now or time.time()
+        if host in self.canaries:
+            self.canaries.discard(host)
+            if ok:
+                h["trips"], h["open_until"] = 0, 0
+            else:
+                self._trip(h, now)
+        elif not h["open_until"] and len(h["ok"]) >= MIN_SAMPLES:
+            recent = h["ok"][-MIN_SAMPLES * 2:]
+            if sum(recent) / len(recent) < TRIP_RATE:
+                self._trip(h, now)
+
+    def _trip(self, h, now):
+        h["trips"] += 1
+        h["open_until"] = int(now + min(COOL_OFF * 2 ** (h["trips"] - 1), COOL_OFF_MAX))
+        # A fresh start once the canary gets through, not the old failures
+        h["ok"] = []
+
+    def rank(self, url) -> float:
+        """Sort key: healthiest hosts first, unknown hosts in between."""
+        h = self.hosts.get(host_of(url))
+        if not h or not h["ok"]:
+            return -0.5
+        return -sum(h["ok"]) / len(h["ok"])
+
+    def report(self) -> str:
+        """One line per host: success rate, p95 and breaker state."""
+        lines = []
+        now = time.time()
+        for host, h in sorted(self.hosts.items()):
+            rate = f"{sum(h['ok']) * 100 // len(h['ok'])}%" if h["ok"] else "-"
+            p95 = f"{percentile(h['lat'], 95):.1f}s" if h["lat"] else "-"
+            state = "open" if h["open_until"] > now else "half-open" if h["open_until"] else "closed"
+            lines.append(f"{host}: ok {rate} of {len(h['ok'])}, p95 {p95}, breaker {state}")
+        return "\n".join(lines)
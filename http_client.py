@@ -0,0 +1,195 @@
+import asyncio
+import codecs
+import hashlib
+import json
+import os
+import random
+import time
+
+import aiohttp
+
+try:
+    import brotli  # noqa: F401  (aiohttp decodes br itself once this is importable)
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODING = "gzip, deflate, br"
+    except ImportError:
+        ACCEPT_ENCODING = "gzip, deflate"
+
+# --- CONFIGURATION ---
+DEFAULT_TIMEOUT = 20
+POOL_LIMIT = 32
+POOL_LIMIT_PER_HOST = 8
+RETRIES = 3
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 15.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# An unchanged source still gets a full run at least this often, so
+# time-dependent output (LIVE flags, expiring tokens) doesn't go stale
+MAX_UNCHANGED_AGE = 3 * 60 * 60
+
+
+def new_session(headers=None, timeout=DEFAULT_TIMEOUT, limit=POOL_LIMIT,
+                limit_per_host=POOL_LIMIT_PER_HOST) -> aiohttp.ClientSession:
+    """Pooled session with compression negotiated up front."""
+    connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host, ttl_dns_cache=300)
+    return aiohttp.ClientSession(
+        headers={"Accept-Encoding": ACCEPT_ENCODING, **(headers or {})},
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=timeout)
+    )
+
+
+def backoff_delay(attempt, retry_after=None) -> float:
+    """Full-jitter exponential backoff, or the server's Retry-After."""
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), BACKOFF_MAX)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class FetchResult:
+    __slots__ = ("url", "status", "text", "unchanged")
+
+    def __init__(self, url, status, text="", unchanged=False):
+        self.url = url
+        self.status = status
+        self.text = text
+        # 304, or a 200 whose body hashes the same as last time
+        self.unchanged = unchanged
+
+    @property
+    def ok(self):
+        return self.status in (200, 304)
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class HttpClient:
+    """Shared client for upstream sources: one pooled session, retries
+    with jittered backoff, and ETag/Last-Modified/body-hash validators
+    persisted between runs in `state_file`.
+
+    Validators are only written by save(), which callers run once the
+    playlist is written, so a crashed run is never mistaken for a
+    finished one:
+
+        http = HttpClient(state_file="state/http_ppv.json")
+        async with http:
+            res = await http.get(API_URL, conditional=True)
+        if res.unchanged:
+            return  # nothing new upstream, skip the run
+        ...
+        http.save()
+    """
+
+    def __init__(self, headers=None, state_file=None, timeout=DEFAULT_TIMEOUT):
+        self.headers = headers
+        self.timeout = timeout
+        self.state_file = state_file
+        self.validators = {}
+        self.session = None
+        if state_file:
+            try:
+                with open(state_file, "r", encoding="utf-8") as f:
+                    self.validators = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self.validators = {}
+
+    async def __aenter__(self):
+        self.session = new_session(self.headers, self.timeout)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    def save(self):
+        if not self.state_file:
+            return
+        folder = os.path.dirname(self.state_file)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp = f"{self.state_file}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.validators, f, separators=(",", ":"))
+        os.replace(tmp, self.state_file)
+
+    def fresh(self, url) -> bool:
+        """True when a conditional get() of `url` may still report it
+        unchanged: its validators exist and are younger than MAX_UNCHANGED_AGE."""
+        known = self.validators.get(url)
+        return bool(known) and time.time() - known.get("fetched_at", 0) < MAX_UNCHANGED_AGE
+
+    async def get(self, url, conditional=False, headers=None, retries=RETRIES, on_chunk=None,
+                  on_start=None) -> FetchResult:
+        """GET with retries. With `conditional`, sends the stored validators
+        and reports `unchanged` on a 304 or an identical body.
+
+        `on_chunk(text)` sees a 200 body as it arrives, decoded
+        incrementally, so parsing can overlap the download. A retry after a
+        partial body replays it from the start, so `on_start()` is called
+        before every streamed attempt for the parser to start over."""
+        headers = dict(headers or {})
+        known = self.validators.get(url, {}) if conditional else {}
+        fresh = conditional and self.fresh(url)
+        if fresh:
+            if known.get("etag"):
+                headers["If-None-Match"] = known["etag"]
+            if known.get("last_modified"):
+                headers["If-Modified-Since"] = known["last_modified"]
+
+        for attempt in range(retries + 1):
+            try:
+                async with self.session.get(url, headers=headers) as resp:
+                    if resp.status in RETRY_STATUSES and attempt < retries:
+                        await asyncio.sleep(backoff_delay(attempt, resp.headers.get("Retry-After")))
+                        continue
+                    if resp.status == 304:
+                        return FetchResult(url, 304, unchanged=True)
+                    if resp.status == 200 and on_chunk is not None:
+                        if on_start is not None:
+                            on_start()
+                        text = await self._read_streaming(resp, on_chunk)
+                    else:
+                        text = await resp.text(errors="replace")
+                    if resp.status != 200:
+                        return FetchResult(url, resp.status, text)
+                    etag = resp.headers.get("ETag")
+                    last_modified = resp.headers.get("Last-Modified")
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt >= retries:
+                    raise
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+
+            digest = hashlib.sha256(text.encode("utf-8", errors="replace")).hexdigest()
+            unchanged = bool(fresh) and known.get("sha256") == digest
+            if conditional:
+                self.validators[url] = {
+                    "etag": etag,
+                    "last_modified": last_modified,
+                    "sha256": digest,
+                    # Only a real change restarts the staleness clock
+                    "fetched_at": known.get("fetched_at", 0) if unchanged else time.time(),
+                }
+            return FetchResult(url, 200, text, unchanged)
+
+    @staticmethod
+    async def _read_streaming(resp, on_chunk) -> str:
+        try:
+            decoder = codecs.getincrementaldecoder(resp.charset or "utf-8")(errors="replace")
+        except LookupError:
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        parts = []
+        async for chunk in resp.content.iter_any():
+            part = decoder.decode(chunk)
+            if part:
+                parts.append(part)
+                on_chunk(part)
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            parts.append(tail)
+            on_chunk(tail)
+        return "".join(parts)
@@ -0,0 +1,77 @@
+import asyncio
+import re
+from urllib.parse import urljoin
+
+import aiohttp
+
+import metrics
+from http_client import new_session
+
+# --- CONFIGURATION ---
+HTTP_TIMEOUT = 6
+HTTP_CONCURRENCY = 16
+
+# Manifests that show up on player pages but are never the actual stream
+IGNORED_HOSTS = ("prd.jwpltx.com",)
+
+# Plain and JSON-escaped (https:\/\/...) absolute manifest URLs
+M3U8_RE = re.compile(r'https?:(?://|\\/\\/)[^\s"\'<>]+?\.m3u8[^\s"\'<>\\]*')
+# Inline player config: file: "...", source = '...', "hls": "..." etc.
+CONFIG_RE = re.compile(
+    r'["\']?(?:file|src|source|hls|hlsUrl|playlist|streamUrl)["\']?\s*[:=]\s*["\']([^"\']+?\.m3u8[^"\']*)["\']',
+    re.IGNORECASE
+)
+
+
+def is_ignored(url: str) -> bool:
+    return any(host in url for host in IGNORED_HOSTS)
+
+
+def extract_from_html(text: str, base_url: str = ""):
+    """Finds a manifest URL in static HTML or inline player config."""
+    for m in M3U8_RE.finditer(text):
+        url = m.group(0).replace("\\/", "/")
+        if not is_ignored(url):
+            return url
+
+    for m in CONFIG_RE.finditer(text):
+        url = urljoin(base_url, m.group(1).replace("\\/", "/"))
+        if url.startswith("http") and not is_ignored(url):
+            return url
+
+    return None
+
+
+async def http_resolve(session, embed_url, headers=None):
+    """Tier 1: plain GET of the embed page, no JavaScript."""
+    try:
+        async with session.get(embed_url, headers=headers) as resp:
+            if resp.status != 200:
+                return None
+            text = await resp.text(errors="ignore")
+    except (aiohttp.ClientError, asyncio.TimeoutError, UnicodeError):
+        return None
+    return extract_from_html(text, str(resp.url))
+
+
+async def http_resolve_many(embed_urls, headers=None, concurrency=HTTP_CONCURRENCY):
+    """Resolves every embed over HTTP. Results keep the input order."""
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(url):
+        async with sem:
+            return await http_resolve(session, url)
+
+    with metrics.span("http_tier"):
+        async with new_session(headers, timeout=HTTP_TIMEOUT) as session:
+            return await asyncio.gather(*(one(u) for u in embed_urls))
+
+
+def new_tier_stats() -> dict:
+    return {"cache": 0, "http": 0, "browser": 0, "failed": 0, "skipped": 0}
+
+
+def tier_report(stats: dict) -> str:
+    """One-line hit rate per tier, e.g. 'cache 12 (30%) | http 5 (12%) | ...'"""
+    total = sum(stats.values()) or 1
+    return " | ".join(f"{k} {v} ({v * 100 // total}%)" for k, v in stats.items())
@@ -0,0 +1,192 @@
+import os
+import re
+
+# key="value" pairs on #EXTM3U / #EXTINF lines
+ATTR_RE = re.compile(r'([\w-]+)="([^"]*)"')
+DURATION_RE = re.compile(r'\s*(-?[\d.]+)')
+# Legacy form some tools write: #EXTINF group-title="X":-1 tvg-id="y",Title
+LEGACY_EXTINF_RE = re.compile(r'#EXTINF\s+((?:[^":]|"[^"]*")*):(.*)')
+
+
+class M3UEntry:
+    """One channel: the #EXTINF line, its option lines and the URL."""
+    __slots__ = ("duration", "attrs", "title", "options", "url")
+
+    def __init__(self, url="", title="", attrs=None, duration="-1", options=None):
+        self.url = url
+        self.title = title
+        self.attrs = attrs if attrs is not None else {}
+        self.duration = duration
+        # Raw lines between #EXTINF and the URL: #EXTVLCOPT, #EXTHTTP, #KODIPROP, #EXTGRP...
+        self.options = options if options is not None else []
+
+    def __repr__(self):
+        return f"M3UEntry({self.title!r}, {self.url!r})"
+
+    def __eq__(self, other):
+        if not isinstance(other, M3UEntry):
+            return NotImplemented
+        return all(getattr(self, k) == getattr(other, k) for k in self.__slots__)
+
+    def extinf(self) -> str:
+        attrs = " ".join(f'{k}="{v}"' for k, v in self.attrs.items())
+        return f"#EXTINF:{self.duration}{' ' + attrs if attrs else ''},{self.title}"
+
+    def lines(self) -> list:
+        return [self.extinf(), *self.options, self.url]
+
+
+def parse_attrs(text: str) -> dict:
+    return dict(ATTR_RE.findall(text))
+
+
+def parse_extinf(line: str):
+    """'#EXTINF:-1 tvg-id="x",Title' -> ('-1', {'tvg-id': 'x'}, 'Title')"""
+    extra = {}
+    legacy = LEGACY_EXTINF_RE.match(line)
+    if legacy:
+        extra = parse_attrs(legacy.group(1))
+        line = "#EXTINF:" + legacy.group(2)
+
+    body = line[8:] if line.startswith("#EXTINF:") else line[7:]
+    # Title starts after the first comma that isn't inside a quoted value
+    comma = body.find(",")
+    while comma != -1 and body.count('"', 0, comma) % 2:
+        comma = body.find(",", comma + 1)
+    if comma == -1:
+        head, title = body, ""
+    else:
+        head, title = body[:comma], body[comma + 1:]
+
+    m = DURATION_RE.match(head)
+    attrs = dict(ATTR_RE.findall(head))
+    for k, v in extra.items():
+        attrs.setdefault(k, v)
+    return (m.group(1) if m else "-1"), attrs, title
+
+
+class EntryParser:
+    """Builds M3UEntry objects line by line, or from text in arbitrary
+    chunks as it comes off the network:
+
+        parser = EntryParser()
+        for chunk in chunks:
+            for entry in parser.feed(chunk):
+                ...
+        for entry in parser.close():
+            ...
+    """
+
+    def __init__(self, header=None):
+        self.header = header
+        self.entry = None
+        self.options = []
+        self.buffer = ""
+
+    def line(self, raw):
+        """Takes one line; returns the entry it completes, or None."""
+        line = raw.strip()
+        if not line:
+            return None
+
+        if line.startswith("#EXTM3U"):
+            if self.header is not None:
+                self.header.update(parse_attrs(line))
+        elif line.startswith("#EXTINF"):
+            duration, attrs, title = parse_extinf(line)
+            # Options seen before the #EXTINF still belong to this entry
+            self.entry = M3UEntry(title=title, attrs=attrs, duration=duration, options=self.options)
+            self.options = []
+        elif line.startswith("#"):
+            if self.entry is not None:
+                self.entry.options.append(line)
+            else:
+                self.options.append(line)
+        else:
+            entry = self.entry
+            if entry is None:
+                entry = M3UEntry(options=self.options)
+                self.options = []
+            entry.url = line
+            self.entry = None
+            return entry
+        return None
+
+    def feed(self, text) -> list:
+        """Entries completed by `text`; a trailing partial line waits for the next chunk."""
+        *lines, self.buffer = (self.buffer + text).split("\n")
+        return [e for e in map(self.line, lines) if e is not None]
+
+    def close(self) -> list:
+        entry = self.line(self.buffer)
+        self.buffer = ""
+        return [entry] if entry is not None else []
+
+
+def iter_entries(lines, header=None):
+    """Yields M3UEntry objects from any iterable of lines (an open file
+    works and is never read whole). If `header` is a dict it is filled
+    with the #EXTM3U attributes, e.g. url-tvg."""
+    parser = EntryParser(header)
+    for raw in lines:
+        entry = parser.line(raw)
+        if entry is not None:
+            yield entry
+
+
+def iter_urls(lines):
+    """Just the URL of every entry, without parsing the #EXTINF lines."""
+    for raw in lines:
+        line = raw.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
+def format_header(attrs=None) -> str:
+    if not attrs:
+        return "#EXTM3U"
+    return "#EXTM3U " + " ".join(f'{k}="{v}"' for k, v in attrs.items())
+
+
+class M3UWriter:
+    """Writes entries to an open text file one at a time.
+
+        with open(path, "w", encoding="utf-8") as f:
+            w = M3UWriter(f, header_line)
+            for entry in entries:
+                w.write(entry)
+    """
+
+    def __init__(self, f, header="#EXTM3U"):
+        self.f = f
+        self.count = 0
+        if header is not None:
+            f.write(header + "\n")
+
+    def write(self, entry: M3UEntry):
+        self.f.write("\n".join(entry.lines()) + "\n")
+        self.count += 1
+
+
+def render_playlist(entries, header="#EXTM3U") -> str:
+    lines = [header] if header is not None else []
+    for entry in entries:
+        lines.extend(entry.lines())
+    return "\n".join(lines) + "\n"
+
+
+def write_if_changed(path, text) -> bool:
+    """Atomically replaces `path` (temp file + rename) unless it already
+    holds exactly `text`. Returns True if the file was written."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            if f.read() == text:
+                return False
+    except FileNotFoundError:
+        pass
+    folder = os.path.dirname(os.path.abspath(path))
+    tmp = os.path.join(folder, f".{os.path.basename(path)}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+    return True
@@ -0,0 +1,214 @@
+import contextlib
+import contextvars
+import cProfile
+import io
+import json
+import math
+import os
+import pstats
+import time
+import tracemalloc
+
+# --- CONFIGURATION ---
+# <source>.json run reports and <source>.prom node_exporter textfiles land here
+METRICS_DIR = "metrics"
+PROFILE_TOP = 25
+
+_current = contextvars.ContextVar("run_report", default=None)
+
+
+def _quantile(ranked, q):
+    return ranked[min(len(ranked) - 1, max(0, math.ceil(q * len(ranked)) - 1))]
+
+
+def _atomic_write(path, text):
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _prom_labels(labels):
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " "))
+        for k, v in labels.items()
+    )
+    return ",".join(f'{k}="{v}"' for k, v in escaped)
+
+
+class RunReport:
+    """Timing spans and counters for one source's run.
+
+    Spans are (stage, seconds, labels); `source` is implied. Anything
+    running inside collect() reaches the active report through the
+    module-level span()/record()/count(), so nothing is threaded through
+    call signatures.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.started_at = time.time()
+        self.duration = None
+        self.spans = []
+        self.counters = {}
+        self.memory = []
+
+    def record(self, stage, seconds, **labels):
+        self.spans.append({"stage": stage, "seconds": round(seconds, 4), "labels": labels})
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def stages(self, by=()) -> dict:
+        """{(stage, *label values): {count, total, p50, p95, max}}"""
+        grouped = {}
+        for sp in self.spans:
+            key = (sp["stage"],) + tuple(sp["labels"].get(k, "") for k in by)
+            grouped.setdefault(key, []).append(sp["seconds"])
+        out = {}
+        for key, values in grouped.items():
+            ranked = sorted(values)
+            out[key] = {
+                "count": len(ranked),
+                "total": round(sum(ranked), 3),
+                "p50": _quantile(ranked, 0.5),
+                "p95": _quantile(ranked, 0.95),
+                "max": ranked[-1],
+            }
+        return out
+
+    def to_dict(self) -> dict:
+        return {
+            "source": self.source,
+            "started_at": int(self.started_at),
+            "duration": self.duration,
+            "stages": {key[0]: summary for key, summary in self.stages().items()},
+            "counters": self.counters,
+            "memory": self.memory,
+            "spans": self.spans,
+        }
+
+    def to_prometheus(self) -> str:
+        base = {"source": self.source}
+        lines = [
+            "# HELP scraper_stage_seconds Time spent per stage and embed domain in the last run",
+            "# TYPE scraper_stage_seconds summary",
+        ]
+        for (stage, domain), s in sorted(self.stages(by=("domain",)).items()):
+            labels = {**base, "stage": stage}
+            if domain:
+                labels["domain"] = domain
+            for q in ("p50", "p95"):
+                quantile = "0.5" if q == "p50" else "0.95"
+                lines.append(f"scraper_stage_seconds{{{_prom_labels({**labels, 'quantile': quantile})}}} {s[q]}")
+            lines.append(f"scraper_stage_seconds_sum{{{_prom_labels(labels)}}} {s['total']}")
+            lines.append(f"scraper_stage_seconds_count{{{_prom_labels(labels)}}} {s['count']}")
+
+        lines += [
+            "# HELP scraper_events Counters from the last run",
+            "# TYPE scraper_events gauge",
+        ]
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"scraper_events{{{_prom_labels({**base, 'name': name})}}} {value}")
+
+        lines += [
+            "# HELP scraper_run_seconds Wall time of the last run",
+            "# TYPE scraper_run_seconds gauge",
+            f"scraper_run_seconds{{{_prom_labels(base)}}} {self.duration or 0}",
+            "# HELP scraper_last_run_timestamp_seconds When the last run started",
+            "# TYPE scraper_last_run_timestamp_seconds gauge",
+            f"scraper_last_run_timestamp_seconds{{{_prom_labels(base)}}} {int(self.started_at)}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def export(self, folder=METRICS_DIR):
+        """Writes <folder>/<source>.json and <folder>/<source>.prom atomically."""
+        _atomic_write(os.path.join(folder, f"{self.source}.json"),
+                      json.dumps(self.to_dict(), ensure_ascii=False, indent=1))
+        _atomic_write(os.path.join(folder, f"{self.source}.prom"), self.to_prometheus())
+
+    def stage_report(self) -> str:
+        """One line per stage, slowest total first."""
+        rows = sorted(self.stages().items(), key=lambda kv: -kv[1]["total"])
+        return "\n".join(
+            f"{key[0]:<16} n={s['count']:<5} total {s['total']:>8.2f}s  p50 {s['p50']:.2f}s  p95 {s['p95']:.2f}s"
+            for key, s in rows
+        )
+
+
+@contextlib.contextmanager
+def collect(source):
+    """Makes a fresh RunReport the active one for this task and its children."""
+    report = RunReport(source)
+    token = _current.set(report)
+    start = time.monotonic()
+    try:
+        yield report
+    finally:
+        report.duration = round(time.monotonic() - start, 3)
+        _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+@contextlib.contextmanager
+def span(stage, **labels):
+    """Times the block into the active report; a no-op outside collect()."""
+    report = _current.get()
+    if report is None:
+        yield
+        return
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        report.record(stage, time.monotonic() - start, **labels)
+
+
+def record(stage, seconds, **labels):
+    report = _current.get()
+    if report is not None:
+        report.record(stage, seconds, **labels)
+
+
+def count(name, n=1):
+    report = _current.get()
+    if report is not None:
+        report.count(name, n)
+
+
+@contextlib.contextmanager
+def profiled(report, enabled=False, folder=METRICS_DIR):
+    """cProfile + tracemalloc around the block when `enabled`. Dumps
+    <folder>/<source>.prof (open with snakeviz or pstats) and puts the top
+    allocation sites into the report."""
+    if not enabled:
+        yield
+        return
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        os.makedirs(folder, exist_ok=True)
+        profiler.dump_stats(os.path.join(folder, f"{report.source}.prof"))
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP)
+        print(out.getvalue())
+
+        report.counters["peak_traced_bytes"] = peak
+        report.memory = [
+            {"where": str(stat.traceback[0]), "bytes": stat.size, "blocks": stat.count}
+            for stat in snapshot.statistics("lineno")[:PROFILE_TOP]
+        ]
@@ -1,10 +1,27 @@
 import asyncio
-from playwright.async_api import async_playwright
-import aiohttp
+import contextlib
+import io
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 import time
 import html
+import argparse
+from stream_cache import StreamCache
+from http_extract import http_resolve_many, new_tier_stats, tier_report
+from capture import M3U8Capture, time_to_first
+from cdn import CANDIDATE_WINDOW, history as cdn_history, rank_candidates, swap_dead
+from probe import probe_all, probe_summary, headers_from_vlcopt
+from m3u import M3UEntry, M3UWriter, write_if_changed
+from hls import VARIANT_MODES, DEFAULT_POLICY, ManifestCache, check_policy, enrich_entries, variant_summary
+from http_client import HttpClient
+from browser_pool import ENGINES, pool_or_new
+from scheduler import Scheduler
+from shard import scan_sharded
+from blocklist import blocked_summary
+from engines import AUTO, engine_stats, engine_summary
+from progressive import PUBLISH_EVERY, PUBLISH_INTERVAL, ProgressivePlaylist
+from host_health import HostHealth, host_of
+import metrics
 
 # --- 🎨 VISUALS ---
 class Col:
@@ -25,6 +42,34 @@ def print_banner():
 API_URL = "https://api.ppv.to/api/streams"
 PLAYLIST_FILE = "PPVLand.m3u8"
 
+# Pages scanned at once on the shared browser, and the per-stream budget
+MAX_CONCURRENT_PAGES = 6
+SCAN_TIMEOUT = 8
+# With --engine auto, the default for domains without enough history yet
+BROWSER_ENGINE = "firefox"
+# Never loaded on embed pages; blocked once on the shared context
+BLOCKED_RESOURCES = ("image", "stylesheet", "font", "media")
+
+# What to do with resolved URLs that fail the liveness probe
+DEAD_POLICIES = ("quarantine", "drop", "keep")
+QUARANTINE_GROUP = "PPVLand - Offline"
+
+# Resolved URLs reused across runs, keyed by iframe URL
+CACHE_FILE = "state/ppv_cache.json"
+# ETag / Last-Modified / body hash of the API response from the last run
+HTTP_STATE_FILE = "state/http_ppv.json"
+# Per-host latency/success history behind scan timeouts and the circuit breaker
+HEALTH_FILE = "state/hosts_ppv.json"
+# Per-domain, per-engine scan history behind --engine auto
+ENGINE_STATS_FILE = "state/engines_ppv.json"
+
+# Sent on the HTTP fast path, matching what players send via STREAM_HEADERS
+EMBED_HEADERS = {
+    "Origin": "https://ppv.to",
+    "Referer": "https://ppv.to/",
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:145.0) Gecko/20100101 Firefox/143.0"
+}
+
 STREAM_HEADERS = [
     '#EXTVLCOPT:http-origin=https://ppv.to',
     '#EXTVLCOPT:http-referrer=https://ppv.to/',
@@ -88,67 +133,126 @@ def get_display_time(timestamp):
         return ""
 
 # SCRAPING HELPERS
-async def safe_grab(page, iframe_url, timeout=8):
+async def safe_grab(page, iframe_url, timeout=SCAN_TIMEOUT):
     try:
-        return await asyncio.wait_for(grab_m3u8_from_iframe(page, iframe_url), timeout=timeout)
+        return await asyncio.wait_for(grab_m3u8_from_iframe(page, iframe_url, timeout),
+                                      timeout=timeout + CANDIDATE_WINDOW)
     except asyncio.TimeoutError:
-        return set()
-
-async def grab_m3u8_from_iframe(page, iframe_url):
-    first_url = None
-
-    await page.route("**/*", lambda route: (
-        route.abort() if route.request.resource_type in ["image","stylesheet","font","media"]
-        else route.continue_()
-    ))
-
-    def handle_response(response):
-        nonlocal first_url
-        if ".m3u8" in response.url and first_url is None:
-            first_url = response.url
-
-    page.on("response", handle_response)
+        return []
 
+async def grab_m3u8_from_iframe(page, iframe_url, timeout=SCAN_TIMEOUT):
+    """Every manifest candidate the page asks for, first seen first."""
+    # Navigation gets 3/4 of the per-stream budget, the capture wait what's left
+    step = timeout * 0.75
+    started = time.monotonic()
+
+    # The first manifest opens a short window for other CDNs; no polling
+    async with M3U8Capture(page, window=CANDIDATE_WINDOW) as cap:
+        with metrics.span("embed_navigation", domain=host_of(iframe_url)):
+            try:
+                await cap.race(page.goto(iframe_url, timeout=step * 1000, wait_until="domcontentloaded"))
+            except:
+                pass
+        return await cap.collect(timeout=max(0.0, timeout - (time.monotonic() - started)))
+
+async def grab_on(browsers, engine, iframe_url, timeout, engines=None):
+    """Manifest candidates for one embed on `engine`'s warm pages. With
+    `engines` (EngineStats) the scan is recorded for the comparison, timed
+    from navigation to the first manifest."""
+    # Warm pages on one context with routing and capture hooks already in place
+    pages = browsers.page_pool(f"ppv-{engine}", engine, BLOCKED_RESOURCES)
+    rss = 0.0
     try:
-        await page.goto(iframe_url, timeout=6000, wait_until="domcontentloaded")
-    except:
-        pass
-
-    for _ in range(120):
-        if first_url:
-            break
-        await asyncio.sleep(0.05)
-
-    return {first_url} if first_url else set()
-
-async def get_streams():
-    headers = {"User-Agent": "Mozilla/5.0"}
+        async with pages.page() as page:
+            urls = await safe_grab(page, iframe_url, timeout=timeout)
+            if engines:
+                rss = browsers.engine_rss_mb(engine)
+    except Exception:
+        urls = []
+    if engines:
+        engines.record(iframe_url, engine, bool(urls), time_to_first(urls), rss)
+    return urls
+
+async def scan_stream(browsers, engine, sem, idx, total, s, health=None):
+    async with sem, browsers.page_slot():
+        timeout = health.timeout(s["iframe"], SCAN_TIMEOUT) if health else SCAN_TIMEOUT
+        engines = engine_stats(ENGINE_STATS_FILE) if engine == AUTO else None
+        if engines:
+            engine = engines.pick(s["iframe"], BROWSER_ENGINE)
+        print(f"[{idx}/{total}] {Col.YELLOW}Scanning:{Col.RESET} {s['name']} [{s['category']}] ({timeout:g}s)")
+        started = time.monotonic()
+        urls = await grab_on(browsers, engine, s["iframe"], timeout, engines)
+        best = engines.best(s["iframe"], BROWSER_ENGINE) if engines and not urls else engine
+        if best != engine:
+            # A failed sample is scanned again on the domain's engine, so
+            # sampling costs time rather than streams
+            engine = best
+            urls = await grab_on(browsers, engine, s["iframe"], timeout, engines)
+        elapsed = time.monotonic() - started
+        if health:
+            # Latency is navigation to the first manifest of the scan that
+            # found it: no page lease, candidate window or failed sample
+            health.record(s["iframe"], bool(urls), time_to_first(urls))
+        labels = {"category": s["category"], "domain": host_of(s["iframe"]), "engine": engine}
+        metrics.record("embed_scan", elapsed, ok=bool(urls), **labels)
+        if urls:
+            metrics.record("time_to_m3u8", elapsed, **labels)
+
+    if urls:
+        ranked = await rank_candidates(urls, headers_from_vlcopt(STREAM_HEADERS))
+        found = ranked[0]
+        spare = f" {Col.DIM}(+{len(ranked) - 1} fallback CDN){Col.RESET}" if len(ranked) > 1 else ""
+        print(f"   {Col.GREEN}⚡ FOUND:{Col.RESET} [{idx}/{total}] {found}{spare}")
+        return found
+
+    print(f"   {Col.DIM}❌ Signal Lost: [{idx}/{total}] {s['name']}{Col.RESET}")
+    return None
+
+async def scan_all(browsers, streams, concurrency=MAX_CONCURRENT_PAGES, engine=BROWSER_ENGINE,
+                   health=None, on_result=None):
+    """Scan every stream with at most `concurrency` pages open.
+    Results come back in the same order as `streams`; `on_result(index, url)`
+    hears about each one as soon as its scan ends."""
+    sem = asyncio.Semaphore(max(1, concurrency))
+    total = len(streams)
+
+    async def one(idx, s):
+        found = await scan_stream(browsers, engine, sem, idx, total, s, health)
+        if on_result:
+            on_result(idx - 1, found)
+        return found
+
+    tasks = [asyncio.create_task(one(idx, s)) for idx, s in enumerate(streams, start=1)]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+async def get_streams(http, conditional=True):
+    """Returns the API categories, or None if nothing changed since the last run."""
     try:
-        async with aiohttp.ClientSession(headers=headers) as session:
-            resp = await session.get(API_URL, timeout=30)
-            if resp.status != 200:
-                print(f"{Col.RED}❌ API Error {resp.status}{Col.RESET}")
-                return []
-            data = await resp.json()
-            return data.get("streams", [])
+        with metrics.span("upstream_fetch", domain=host_of(API_URL)):
+            async with http:
+                res = await http.get(API_URL, conditional=conditional)
+        if res.unchanged:
+            return None
+        if res.status != 200:
+            print(f"{Col.RED}❌ API Error {res.status}{Col.RESET}")
+            return []
+        return res.json().get("streams", [])
     except Exception as e:
         print(f"{Col.RED}❌ API Fetch Error: {e}{Col.RESET}")
         return []
 
-# MAIN
-async def main():
-    start_time = time.time()
-    print_banner()
+def new_http_client():
+    return HttpClient({"User-Agent": "Mozilla/5.0"}, state_file=HTTP_STATE_FILE)
 
-    categories = await get_streams()
-    if not categories:
-        print(f"{Col.RED}❌ No categories received{Col.RESET}")
-        return
-
-    now_ts = int(time.time())
+def flatten_streams(categories):
+    """API categories -> stream dicts with an iframe, ordered by start time."""
     streams = []
-
-    # flatten
     for cat_obj in categories:
         original_cat = cat_obj.get("category", "")
 
@@ -171,85 +275,513 @@ async def main():
                 })
 
     streams.sort(key=lambda x: x["starts_at"] or 0)
-    valid_streams = []
-
-    async with async_playwright() as p:
-        browser = await p.firefox.launch(headless=True)
-        total = len(streams)
-
-        for idx, s in enumerate(streams, start=1):
-            page = await browser.new_page()
-
-            print(f"[{idx}/{total}] {Col.YELLOW}Scanning:{Col.RESET} {s['name']} [{s['category']}]")
-
-            urls = await safe_grab(page, s["iframe"])
-            await page.close()
-
-            if urls:
-                found = next(iter(urls))
-                print(f"   {Col.GREEN}⚡ FOUND:{Col.RESET} {found}")
-
-                final_logo = s.get("poster") or BACKUP_LOGOS.get(s["category"], "")
-
-                valid_streams.append({
-                    "id": s["id"],
-                    "name": s["name"],
-                    "category": s["category"],
-                    "poster": final_logo,
-                    "starts_at": s["starts_at"],
-                    "ends_at": s["ends_at"],
-                    "url": found,
-                    "time": s["clock_time"]
-                })
+    return streams
+
+async def resolve_streams(browsers, streams, tiers, concurrency=MAX_CONCURRENT_PAGES,
+                          engine=BROWSER_ENGINE, health=None, shards=1, on_result=None):
+    """Tier 1 plain HTTP, then tier 2 browser for whatever is left.
+    Results keep the order of `streams`; the browser is only touched if needed.
+    With `health`, hosts behind an open breaker are skipped and the
+    healthiest hosts are scanned first. With `shards` > 1 tier 2 runs in
+    that many processes, each with its own browser (see shard.py).
+    `on_result(index, url, tier)` is called once per stream as soon as it
+    is settled; tier is http, browser or skipped."""
+    if not streams:
+        return []
+    report = on_result or (lambda i, url, tier: None)
+    print(f"{Col.CYAN}🌐 Trying {len(streams)} iframes over plain HTTP...{Col.RESET}")
+    results = await http_resolve_many([s["iframe"] for s in streams], EMBED_HEADERS)
+    tiers["http"] += sum(1 for f in results if f)
+    for i, found in enumerate(results):
+        if found:
+            report(i, found, "http")
+
+    to_scan = [i for i, found in enumerate(results) if not found]
+    tripped = 0
+    if health:
+        allowed = [i for i in to_scan if health.allow(streams[i]["iframe"])]
+        tripped = len(to_scan) - len(allowed)
+        if tripped:
+            print(f"{Col.DIM}🔌 Skipping {tripped} streams on hosts with an open breaker{Col.RESET}")
+        for i in set(to_scan) - set(allowed):
+            report(i, None, "skipped")
+        to_scan = sorted(allowed, key=lambda i: health.rank(streams[i]["iframe"]))
+
+    def scanned_one(k, found):
+        report(to_scan[k], found, "browser")
+    if to_scan and shards > 1:
+        print(f"{Col.CYAN}🧵 Scanning {len(to_scan)} streams on {shards} worker processes, "
+              f"{concurrency} pages each{Col.RESET}\n")
+        scanned = await scan_sharded("ppv", [streams[i] for i in to_scan], shards, concurrency, engine,
+                                     health or HostHealth(), key=lambda s: s["iframe"],
+                                     on_result=scanned_one)
+    elif to_scan:
+        print(f"{Col.CYAN}🧵 Scanning {len(to_scan)} streams with {concurrency} pages in flight{Col.RESET}\n")
+        async with pool_or_new(browsers) as pool:
+            try:
+                scanned = await scan_all(pool, [streams[i] for i in to_scan], concurrency, engine, health,
+                                         scanned_one)
+            finally:
+                pool.report_blocked("ppv-")
+    if to_scan:
+        for i, found in zip(to_scan, scanned):
+            results[i] = found
+        tiers["browser"] += sum(1 for f in scanned if f)
+    tiers["skipped"] += tripped
+    tiers["failed"] += sum(1 for f in results if not f) - tripped
+    return results
+
+async def probe_streams(streams, urls):
+    """Liveness of each resolved URL; unresolved ones count as alive.
+    A dead URL with a fallback CDN that passes is replaced in `urls`."""
+    alive = [True] * len(streams)
+    resolved = [i for i, url in enumerate(urls) if url]
+    if not resolved:
+        return alive
+    print(f"\n{Col.CYAN}🩺 Probing {len(resolved)} playlists...{Col.RESET}")
+    headers = headers_from_vlcopt(STREAM_HEADERS)
+    probes = await probe_all([urls[i] for i in resolved], headers)
+    for i, r in zip(resolved, probes):
+        if not r["ok"]:
+            alive[i] = False
+            print(f"   {Col.DIM}💀 Dead ({r['reason']}): {streams[i]['name']}{Col.RESET}")
+    print(f"{Col.CYAN}🩺 {probe_summary(probes)}{Col.RESET}")
+    revived = await swap_dead(urls, alive, headers)
+    if revived:
+        print(f"{Col.CYAN}🔁 {revived} dead streams switched to a fallback CDN{Col.RESET}")
+    return alive
+
+def stream_entries(items, now_ts=None):
+    """(stream, url, alive) triples -> M3UEntry list."""
+    entries = []
+    now_ts = now_ts or int(time.time())
+    for s, url, ok in items:
+        tvg_id = f"ppv-{s['id']}"
+        group_title = GROUP_RENAME_MAP.get(s["category"], s["category"])
+        if not ok:
+            group_title = QUARANTINE_GROUP
+
+        clean_title = s["name"]
+
+        starts_at = s.get("starts_at") or 0
+        ends_at = s.get("ends_at") or 0
+
+        is_live = (
+            starts_at > 0
+            and starts_at <= now_ts
+            and (ends_at == 0 or now_ts < ends_at)
+        )
+
+        if is_live:
+            emoji = LIVE_EMOJI_MAP.get(s["category"], "🟢")
+            clean_title = f"{emoji} LIVE {clean_title}"
+
+        if s["clock_time"]:
+            clean_title += f" - {s['clock_time']}"
+
+        entries.append(M3UEntry(
+            url=url,
+            title=clean_title,
+            attrs={
+                "tvg-id": tvg_id,
+                "tvg-name": s["name"],
+                "tvg-logo": s.get("poster") or BACKUP_LOGOS.get(s["category"], ""),
+                "group-title": group_title,
+            },
+            options=list(STREAM_HEADERS)
+        ))
+    return entries
+
+def render_entries(entries):
+    f = io.StringIO()
+    writer = M3UWriter(f)
+    for entry in entries:
+        writer.write(entry)
+    return f.getvalue()
+
+async def enrich_variants(entries, mode, policy, cache=None):
+    """Annotates or pins master playlists (see hls.py) unless `mode` is off."""
+    if mode == "off" or not entries:
+        return
+    print(f"{Col.CYAN}🎚️ Checking {len(entries)} playlists for variants...{Col.RESET}")
+    changed = await enrich_entries(entries, mode, policy, headers_from_vlcopt(STREAM_HEADERS), cache)
+    print(f"{Col.CYAN}🎚️ {variant_summary(changed, len(entries), mode)}{Col.RESET}")
+
+async def generate_playlist(browsers=None, http=None, concurrency=MAX_CONCURRENT_PAGES,
+                            use_cache=True, dead_policy="quarantine", force=False,
+                            engine=BROWSER_ENGINE, variants="off", variant_policy=DEFAULT_POLICY,
+                            shards=1, progress=None):
+    """Returns the playlist text and run stats. The text is None when the
+    API is unchanged since the last run or returned nothing.
+    `browsers` is a shared BrowserPool; one is started on demand if omitted.
+    With `progress` (a ProgressivePlaylist) every stream is reported as it
+    settles, so partial playlists get published during the run."""
+    http = http or HttpClient({"User-Agent": "Mozilla/5.0"})
+    stats = {"total": 0, "working": 0, "tiers": new_tier_stats()}
+
+    categories = await get_streams(http, conditional=not force)
+    if categories is None:
+        print(f"{Col.DIM}💤 API unchanged since the last run, nothing to do{Col.RESET}")
+        return None, stats
+    if not categories:
+        print(f"{Col.RED}❌ No categories received{Col.RESET}")
+        return None, stats
+
+    streams = flatten_streams(categories)
+    total = len(streams)
+    cache = StreamCache(CACHE_FILE) if use_cache else None
+    results = [None] * total
+    pending = []
+    if progress:
+        slots = [progress.add(f"ppv-{s['id']}", title=s["name"], category=s["category"],
+                              starts_at=s["starts_at"]) for s in streams]
+
+    def settled(i, url, tier):
+        if not progress:
+            return
+        if url:
+            progress.resolved(slots[i], stream_entries([(streams[i], url, True)])[0], tier)
+        else:
+            progress.failed(slots[i], "skipped" if tier == "skipped" else "failed", tier)
+
+    for i, s in enumerate(streams):
+        if cache:
+            cached = cache.get(s["iframe"])
+            if cached:
+                results[i] = cached
+                settled(i, cached, "cache")
+                continue
+            if cache.should_skip(s["iframe"]):
+                settled(i, None, "skipped")
+                continue
+        pending.append(i)
+
+    tiers = stats["tiers"]
+    if cache:
+        tiers["cache"] = cache.hits
+        tiers["skipped"] = total - len(pending) - cache.hits
+        print(f"{Col.CYAN}🗃️ Cache: {tiers['cache']} reused, {tiers['skipped']} backing off, {len(pending)} to resolve{Col.RESET}")
+
+    health = HostHealth(HEALTH_FILE)
+    # Behind an open breaker: not tried, so not a failure to back off from
+    tripped = set()
+
+    def resolved_one(j, url, tier):
+        if tier == "skipped":
+            tripped.add(pending[j])
+        settled(pending[j], url, tier)
+
+    async with progress.ticking() if progress else contextlib.nullcontext():
+        resolved = await resolve_streams(browsers, [streams[i] for i in pending], tiers, concurrency,
+                                         engine, health, shards, on_result=resolved_one)
+    health.save()
+    cdn_history().save()
+    if engine == AUTO:
+        engine_stats(ENGINE_STATS_FILE).save()
+    for i, found in zip(pending, resolved):
+        results[i] = found
+
+    if cache:
+        for i in pending:
+            if results[i]:
+                cache.put(streams[i]["iframe"], results[i])
+            elif i not in tripped:
+                cache.mark_failed(streams[i]["iframe"], starts_at=streams[i]["starts_at"])
+
+    # PROBE: make sure what we write actually plays
+    alive = [True] * total
+    if dead_policy != "keep":
+        before = list(results)
+        alive = await probe_streams(streams, results)
+        for i, (old, url) in enumerate(zip(before, results)):
+            if url != old:
+                if cache:
+                    cache.put(streams[i]["iframe"], url)
+                settled(i, url, "fallback")
+        if cache:
+            for s, ok in zip(streams, alive):
+                if not ok:
+                    cache.forget(s["iframe"])
+        if progress:
+            for i, ok in enumerate(alive):
+                if not ok:
+                    progress.mark(slots[i], "dead")
+
+    if cache:
+        cache.evict()
+        cache.save()
+
+    items = [
+        (s, found, ok) for s, found, ok in zip(streams, results, alive)
+        if found and (ok or dead_policy != "drop")
+    ]
+
+    stats["total"] = total
+    stats["working"] = sum(1 for _, _, ok in items if ok)
+    metrics.count("streams_total", total)
+    metrics.count("streams_working", stats["working"])
+    for tier, n in tiers.items():
+        metrics.count(f"tier_{tier}", n)
+    entries = stream_entries(items)
+    await enrich_variants(entries, variants, variant_policy)
+    return render_entries(entries), stats
+
+# --- DAEMON ---
+# The API listing is re-read this often (conditionally, so mostly 304s)
+LISTING_INTERVAL = 10 * 60
+# Upcoming events are re-resolved this long before they start, and live
+# URLs this long before their token expires
+PRESTART_LEAD = 5 * 60
+EXPIRY_LEAD = 5 * 60
+# Due times are pulled earlier by up to this much so a batch of tokens
+# minted together doesn't come due in the same second
+SPREAD = 2 * 60
+LISTING = "__listing__"
+
+def next_refresh(s, expires_at, now):
+    """When a resolved stream should be looked at again: before its token
+    expires, shortly before it starts, when it starts, or when it ends."""
+    due = expires_at - EXPIRY_LEAD
+    starts_at = s.get("starts_at") or 0
+    ends_at = s.get("ends_at") or 0
+    if now < starts_at - PRESTART_LEAD:
+        due = min(due, starts_at - PRESTART_LEAD)
+    elif now < starts_at:
+        due = min(due, starts_at)
+    if ends_at:
+        due = min(due, ends_at)
+    return max(due, now)
+
+def next_retry(s, retry_at, now):
+    """When a stream that failed (or was skipped) is tried again: once its
+    backoff is over, but no later than shortly before it starts and when it
+    starts, since upcoming events have nothing to play until then."""
+    return next_refresh(s, retry_at + EXPIRY_LEAD, now)
+
+def has_ended(s, now):
+    ends_at = s.get("ends_at") or 0
+    return 0 < ends_at <= now
+
+async def run_daemon(browsers=None, concurrency=MAX_CONCURRENT_PAGES, dead_policy="quarantine",
+                     engine=BROWSER_ENGINE, variants="off", variant_policy=DEFAULT_POLICY):
+    """Keeps PLAYLIST_FILE fresh without hourly full rescans.
+
+    Every stream sits in one priority queue keyed by when it next needs
+    attention (see next_refresh), next to a periodic listing refresh.
+    Each wake-up resolves at most `concurrency` due streams, drops ended
+    ones and rewrites the playlist, so browser work is spread over time."""
+    http = new_http_client()
+    cache = StreamCache(CACHE_FILE)
+    health = HostHealth(HEALTH_FILE)
+    sched = Scheduler()
+    streams = {}   # iframe -> stream
+    resolved = {}  # iframe -> [url, expires_at, alive]
+    tiers = new_tier_stats()
+    # Lives as long as the daemon; a URL is only fetched again once re-resolved
+    manifests = ManifestCache()
+    sched.schedule(LISTING, 0)
+
+    async def publish():
+        now = time.time()
+        items = []
+        for s in sorted(streams.values(), key=lambda x: x["starts_at"] or 0):
+            entry = resolved.get(s["iframe"])
+            if entry and entry[1] > now and (entry[2] or dead_policy != "drop"):
+                items.append((s, entry[0], entry[2]))
+        manifests.retain(url for _, url, _ in items)
+        entries = stream_entries(items, int(now))
+        await enrich_variants(entries, variants, variant_policy, manifests)
+        if write_if_changed(PLAYLIST_FILE, render_entries(entries)):
+            print(f"{Col.GREEN}💾 {PLAYLIST_FILE}: {len(items)} streams{Col.RESET}")
+        cache.evict()
+        cache.save()
+        health.save()
+        cdn_history().save()
+        if engine == AUTO:
+            engine_stats(ENGINE_STATS_FILE).save()
+        http.save()
+
+    async def refresh_listing(now):
+        # The first read is unconditional, an unchanged API must still seed the queue
+        categories = await get_streams(http, conditional=bool(streams))
+        if not categories:
+            # None is unchanged; [] is an API hiccup, keep what we have either way
+            return
+        listed = {s["iframe"]: s for s in flatten_streams(categories) if not has_ended(s, now)}
+        for key in streams.keys() - listed.keys():
+            sched.cancel(key)
+            resolved.pop(key, None)
+        for key, s in listed.items():
+            if key in streams:
+                continue
+            cached = cache.ok.get(key)
+            if cached and cached[2] - EXPIRY_LEAD > now:
+                resolved[key] = [cached[0], cached[2], True]
+                sched.schedule(key, next_refresh(s, cached[2], now), spread=SPREAD)
+            elif cache.should_skip(key, now):
+                sched.schedule(key, next_retry(s, cache.fail[key][1], now))
             else:
-                print(f"   {Col.DIM}❌ Signal Lost{Col.RESET}")
-
-        await browser.close()
-
-    # SAVE PLAYLIST
-    print(f"\n{Col.YELLOW}💾 Saving playlist to {PLAYLIST_FILE}...{Col.RESET}")
-    with open(PLAYLIST_FILE, "w", encoding="utf-8") as f:
-        f.write("#EXTM3U\n")
-        now_ts = int(time.time())
-
-        for item in valid_streams:
-            tvg_id = f"ppv-{item['id']}"
-            group_title = GROUP_RENAME_MAP.get(item["category"], item["category"])
-
-            clean_title = item["name"]
-
-            starts_at = item.get("starts_at") or 0
-            ends_at = item.get("ends_at") or 0
-
-            is_live = (
-                starts_at > 0
-                and starts_at <= now_ts
-                and (ends_at == 0 or now_ts < ends_at)
-            )
-
-            if is_live:
-                emoji = LIVE_EMOJI_MAP.get(item["category"], "🟢")
-                clean_title = f"{emoji} LIVE {clean_title}"
-
-            if item["time"]:
-                clean_title += f" - {item['time']}"
-
-            f.write(
-                f'#EXTINF:-1 tvg-id="{tvg_id}" tvg-name="{item["name"]}" '
-                f'tvg-logo="{item["poster"]}" group-title="{group_title}",{clean_title}\n'
-            )
+                sched.schedule(key, now)
+        streams.clear()
+        streams.update(listed)
+        print(f"{Col.CYAN}📡 Listing: {len(streams)} streams, next due in "
+              f"{max(0, (sched.next_due() or now) - now):.0f}s{Col.RESET}")
+
+    async def refresh_streams(keys, now):
+        batch = [streams[k] for k in keys]
+        tripped = set()
+
+        def resolved_one(j, url, tier):
+            if tier == "skipped":
+                tripped.add(j)
+
+        urls = await resolve_streams(pool, batch, tiers, concurrency, engine, health, on_result=resolved_one)
+        alive = await probe_streams(batch, urls) if dead_policy != "keep" else [True] * len(batch)
+        now = time.time()
+        for j, (s, url, ok) in enumerate(zip(batch, urls, alive)):
+            key = s["iframe"]
+            if j in tripped:
+                # Not tried: back when the host's breaker lets it through
+                sched.schedule(key, next_retry(s, health.retry_at(key, now), now))
+                continue
+            if not url:
+                cache.mark_failed(key, now, s.get("starts_at"))
+                sched.schedule(key, next_retry(s, cache.fail[key][1], now))
+                # The old URL stays listed until its own token runs out
+                continue
+            cache.put(key, url, now)
+            expires_at = cache.ok[key][2]
+            resolved[key] = [url, expires_at, ok]
+            if ok:
+                sched.schedule(key, next_refresh(s, expires_at, now), spread=SPREAD)
+            else:
+                cache.forget(key)
+                sched.schedule(key, now + LISTING_INTERVAL)
+
+    async with pool_or_new(browsers) as pool:
+        try:
+            while True:
+                await sched.wait()
+                now = time.time()
+                due = sched.pop_due(now, limit=concurrency + 1)
+                if LISTING in due:
+                    due.remove(LISTING)
+                    await refresh_listing(now)
+                    sched.schedule(LISTING, now + LISTING_INTERVAL)
+
+                keys = []
+                for key in due:
+                    s = streams.get(key)
+                    if s is None:
+                        continue
+                    if has_ended(s, now):
+                        print(f"{Col.DIM}🏁 Ended: {s['name']}{Col.RESET}")
+                        del streams[key]
+                        resolved.pop(key, None)
+                    else:
+                        keys.append(key)
+                if keys:
+                    print(f"\n{Col.YELLOW}⏰ {len(keys)} due, {len(sched)} queued{Col.RESET}")
+                    await refresh_streams(keys, now)
+                await publish()
+        finally:
+            cache.save()
+            print(f"{Col.DIM}🪜 Daemon tiers: {tier_report(tiers)}{Col.RESET}")
 
-            for h in STREAM_HEADERS:
-                f.write(h + "\n")
+# MAIN
+async def main(concurrency=MAX_CONCURRENT_PAGES, use_cache=True, dead_policy="quarantine", force=False,
+               metrics_dir=metrics.METRICS_DIR, profile=False, variants="off",
+               variant_policy=DEFAULT_POLICY, shards=1, progressive=True,
+               publish_every=PUBLISH_EVERY, publish_interval=PUBLISH_INTERVAL, engine=BROWSER_ENGINE):
+    start_time = time.time()
+    print_banner()
 
-            f.write(item["url"] + "\n")
+    http = new_http_client()
+    progress = None
+    if progressive:
+        progress = ProgressivePlaylist(PLAYLIST_FILE, render_entries, key=lambda e: e.attrs.get("tvg-id"),
+                                       every=publish_every, interval=publish_interval)
+    with metrics.collect("ppv") as report, metrics.profiled(report, profile, metrics_dir):
+        playlist, stats = await generate_playlist(
+            http=http, concurrency=concurrency, use_cache=use_cache,
+            dead_policy=dead_policy, force=force, variants=variants, variant_policy=variant_policy,
+            shards=shards, progress=progress, engine=engine
+        )
+        if playlist is not None:
+            print(f"\n{Col.YELLOW}💾 Saving playlist to {PLAYLIST_FILE}...{Col.RESET}")
+            with metrics.span("playlist_write"):
+                write_if_changed(PLAYLIST_FILE, playlist)
+                if progress:
+                    progress.save_sidecar()
+            http.save()
+            if progress:
+                print(f"{Col.DIM}📤 {progress.publishes} partial publishes; {progress.sidecar}: "
+                      f"{progress.summary()}{Col.RESET}")
+    report.export(metrics_dir)
+    if playlist is None:
+        return
 
     print(f"\n{Col.CYAN}{'='*60}{Col.RESET}")
     print(f"✅ {Col.BOLD}MISSION COMPLETE{Col.RESET}")
-    print(f"📊 {Col.BOLD}WORKING STREAMS:{Col.RESET} {len(valid_streams)} / {total}")
+    print(f"📊 {Col.BOLD}WORKING STREAMS:{Col.RESET} {stats['working']} / {stats['total']}")
+    print(f"🪜 {Col.BOLD}TIERS:{Col.RESET} {tier_report(stats['tiers'])}")
     print(f"⏱️ {Col.BOLD}TIME:{Col.RESET} {time.time()-start_time:.2f}s")
+    print(f"🛡️ {Col.BOLD}BLOCKED:{Col.RESET} {blocked_summary(report.counters)}")
+    if engine == AUTO:
+        print(f"🧪 {Col.BOLD}ENGINES:{Col.RESET} {engine_summary(report.counters)}")
+    print(f"{Col.DIM}{report.stage_report()}{Col.RESET}")
     print(f"📺 Playlist: {PLAYLIST_FILE}")
     print(f"{Col.CYAN}{'='*60}{Col.RESET}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="PPV.to playlist scraper")
+    parser.add_argument("-c", "--concurrency", type=int, default=MAX_CONCURRENT_PAGES,
+                        help=f"pages scanned at once (default {MAX_CONCURRENT_PAGES}, 1 = sequential)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="ignore and don't update the resolved-stream cache")
+    parser.add_argument("--dead", choices=DEAD_POLICIES, default="quarantine",
+                        help="what to do with streams that fail the liveness probe "
+                             "(keep skips probing)")
+    parser.add_argument("--force", action="store_true",
+                        help="run even if the API response is unchanged since last time")
+    parser.add_argument("--engine", choices=(*ENGINES, AUTO), default=BROWSER_ENGINE,
+                        help=f"browser for the scan (default {BROWSER_ENGINE}); auto routes each embed "
+                             "domain to its fastest reliable engine and samples the others "
+                             "(compare them with `python engines.py`)")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="browser worker processes for the scan, split by embed domain, each with "
+                             "its own browser and --concurrency pages (default 1 = in-process)")
+    parser.add_argument("--publish-every", type=int, default=PUBLISH_EVERY,
+                        help=f"publish the partial playlist after this many new results (default {PUBLISH_EVERY})")
+    parser.add_argument("--publish-interval", type=float, default=PUBLISH_INTERVAL,
+                        help=f"...or after this many seconds (default {PUBLISH_INTERVAL})")
+    parser.add_argument("--no-progressive", action="store_true",
+                        help="write the playlist only once the run is complete, with no sidecar")
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep running and re-resolve each stream just before its token "
+                             "expires or its event starts, instead of one full pass")
+    parser.add_argument("--metrics-dir", default=metrics.METRICS_DIR,
+                        help=f"where the JSON run report and Prometheus textfile go (default {metrics.METRICS_DIR})")
+    parser.add_argument("--profile", action="store_true",
+                        help="run under cProfile and tracemalloc; writes <metrics-dir>/ppv.prof")
+    parser.add_argument("--variants", choices=VARIANT_MODES, default="off",
+                        help="for master playlists: annotate #EXTINF with resolution/bitrate, "
+                             "or pin the variant picked by --variant-policy")
+    parser.add_argument("--variant-policy", type=check_policy, default=DEFAULT_POLICY,
+                        help="best | lowest | max-height:<px> | max-bandwidth:<bps> (default best)")
+    args = parser.parse_args()
+    if args.daemon:
+        print_banner()
+        try:
+            asyncio.run(run_daemon(concurrency=args.concurrency, dead_policy=args.dead, engine=args.engine,
+                                   variants=args.variants, variant_policy=args.variant_policy))
+        except KeyboardInterrupt:
+            print(f"\n{Col.YELLOW}👋 Daemon stopped{Col.RESET}")
+    else:
+        asyncio.run(main(concurrency=args.concurrency, use_cache=not args.no_cache,
+                         dead_policy=args.dead, force=args.force,
+                         metrics_dir=args.metrics_dir, profile=args.profile,
+                         variants=args.variants, variant_policy=args.variant_policy,
+                         shards=args.shards, progressive=not args.no_progressive,
+                         publish_every=args.publish_every, publish_interval=args.publish_interval,
+                         engine=args.engine))
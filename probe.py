@@ -0,0 +1,103 @@
+import asyncio
+import time
+from urllib.parse import urlparse
+
+import aiohttp
+
+import metrics
+from http_client import new_session
+
+# --- CONFIGURATION ---
+PROBE_TIMEOUT = 8
+PROBE_LIMIT = 64
+PROBE_LIMIT_PER_HOST = 4
+# Enough to see the header and the first tags of any real playlist
+PROBE_READ_BYTES = 16 * 1024
+
+HLS_TAGS = ("#EXTINF", "#EXT-X-STREAM-INF", "#EXT-X-TARGETDURATION", "#EXT-X-MEDIA-SEQUENCE")
+
+VLCOPT_HEADERS = {
+    "http-origin": "Origin",
+    "http-referrer": "Referer",
+    "http-user-agent": "User-Agent",
+}
+
+
+def headers_from_vlcopt(lines) -> dict:
+    """['#EXTVLCOPT:http-origin=https://x', ...] -> {'Origin': 'https://x', ...}"""
+    headers = {}
+    for line in lines:
+        if not line.startswith("#EXTVLCOPT:"):
+            continue
+        key, _, value = line[len("#EXTVLCOPT:"):].partition("=")
+        if key.strip() in VLCOPT_HEADERS:
+            headers[VLCOPT_HEADERS[key.strip()]] = value.strip()
+    return headers
+
+
+def is_hls_playlist(body: str) -> bool:
+    body = body.lstrip("\ufeff \r\n\t")
+    return body.startswith("#EXTM3U") and any(tag in body for tag in HLS_TAGS)
+
+
+async def probe_playlist(session, url, headers=None) -> dict:
+    """Fetches the start of a playlist. Returns
+    {"url", "ok", "status", "ttfb", "reason"}; ttfb is in seconds."""
+    result = {"url": url, "ok": False, "status": None, "ttfb": None, "reason": ""}
+    start = time.monotonic()
+    try:
+        async with session.get(url, headers=headers, allow_redirects=True) as resp:
+            result["status"] = resp.status
+            if resp.status != 200:
+                result["reason"] = f"HTTP {resp.status}"
+                return result
+            body = await resp.content.readany()
+            result["ttfb"] = time.monotonic() - start
+            while len(body) < PROBE_READ_BYTES:
+                if is_hls_playlist(body.decode("utf-8", errors="ignore")):
+                    result["ok"] = True
+                    return result
+                chunk = await resp.content.readany()
+                if not chunk:
+                    break
+                body += chunk
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        result["reason"] = type(e).__name__
+        return result
+
+    result["ok"] = is_hls_playlist(body.decode("utf-8", errors="ignore"))
+    if not result["ok"]:
+        result["reason"] = "not an HLS playlist"
+    return result
+
+
+async def probe_all(urls, headers=None) -> list:
+    """Probes every URL concurrently over one pooled session, limited per
+    host. `headers` is one dict for all URLs or a list parallel to `urls`.
+    Results keep the input order."""
+    if isinstance(headers, list):
+        per_url = headers
+    else:
+        per_url = [headers] * len(urls)
+
+    with metrics.span("probe"):
+        async with new_session(timeout=PROBE_TIMEOUT, limit=PROBE_LIMIT,
+                               limit_per_host=PROBE_LIMIT_PER_HOST) as session:
+            results = await asyncio.gather(*(
+                probe_playlist(session, url, h) for url, h in zip(urls, per_url)
+            ))
+    for r in results:
+        if r["ttfb"] is not None:
+            metrics.record("probe_ttfb", r["ttfb"], domain=urlparse(r["url"]).hostname or "")
+    return results
+
+
+def probe_summary(results) -> str:
+    alive = [r for r in results if r["ok"]]
+    ttfbs = sorted(r["ttfb"] for r in alive)
+    if not ttfbs:
+        return f"{len(alive)}/{len(results)} alive"
+    median = ttfbs[len(ttfbs) // 2]
+    slowest = max(alive, key=lambda r: r["ttfb"])
+    return (f"{len(alive)}/{len(results)} alive, TTFB median {median * 1000:.0f} ms, "
+            f"slowest {slowest['ttfb'] * 1000:.0f} ms ({urlparse(slowest['url']).hostname})")
@@ -0,0 +1,140 @@
+"""Playlist output that is published while a run is still resolving.
+
+The source registers each stream as it is listed and reports it again
+once it resolves or fails. Every PUBLISH_EVERY new results or
+PUBLISH_INTERVAL seconds, whichever comes first, the playlist is
+rewritten through a temp file and a rename, so readers never see half a
+file and a run that gets killed still leaves its last publish behind.
+
+A stream that has not been resolved yet keeps its entry from the playlist
+already on disk (matched on `key`). A partial publish therefore never
+offers fewer channels than consumers already had.
+
+Next to the playlist goes an NDJSON sidecar (PPVLand.m3u8 ->
+PPVLand.ndjson) with one object per stream in playlist order:
+
+    {"id": "ppv-123", "title": "...", "category": "...", "status": "resolved",
+     "tier": "browser", "url": "...", "listed": 0.4, "finished": 7.9}
+
+`status` is pending (nothing yet), stale (last run's entry kept),
+resolved, failed, skipped (backing off or breaker open) or dead (failed
+the liveness probe). `listed` and `finished` are seconds since the run
+started.
+"""
+import asyncio
+import contextlib
+import json
+import os
+import time
+
+import metrics
+from m3u import iter_entries, write_if_changed
+
+# --- CONFIGURATION ---
+# Publish after this many new results...
+PUBLISH_EVERY = 10
+# ...or when the last publish is this old and something changed (seconds)
+PUBLISH_INTERVAL = 30
+STATUSES = ("pending", "stale", "resolved", "failed", "skipped", "dead")
+
+
+def sidecar_path(path) -> str:
+    return os.path.splitext(path)[0] + ".ndjson"
+
+
+class ProgressivePlaylist:
+    """`render(entries) -> text` is the source's own playlist renderer;
+    `key(entry)` gives the id the source registers streams under, and is
+    used to find last run's entry for a stream."""
+
+    def __init__(self, path, render, key, every=PUBLISH_EVERY, interval=PUBLISH_INTERVAL):
+        self.path = path
+        self.sidecar = sidecar_path(path)
+        self.render = render
+        self.every = max(1, every)
+        self.interval = interval
+        self.started = time.monotonic()
+        self.last_publish = self.started
+        self.unpublished = 0
+        self.publishes = 0
+        self.entries = []
+        self.records = []
+        self.previous = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.previous = {key(e): e for e in iter_entries(f)}
+        except FileNotFoundError:
+            pass
+
+    def _elapsed(self):
+        return round(time.monotonic() - self.started, 3)
+
+    def add(self, stream_id, **fields) -> int:
+        """Registers one stream; returns its index for the later calls."""
+        old = self.previous.get(stream_id)
+        self.entries.append(old)
+        self.records.append({
+            "id": stream_id, **fields, "status": "stale" if old else "pending",
+            "tier": None, "url": None, "listed": self._elapsed(), "finished": None,
+        })
+        return len(self.records) - 1
+
+    def resolved(self, index, entry, tier):
+        self.entries[index] = entry
+        self._finish(index, "resolved", tier, entry.url)
+
+    def failed(self, index, status="failed", tier=None):
+        self.entries[index] = None
+        self._finish(index, status, tier, None)
+
+    def _finish(self, index, status, tier, url):
+        self.records[index].update(status=status, tier=tier, url=url, finished=self._elapsed())
+        self.unpublished += 1
+        self.maybe_publish()
+
+    def mark(self, index, status):
+        """Changes the status only, e.g. dead after probing."""
+        self.records[index]["status"] = status
+
+    def maybe_publish(self) -> bool:
+        if not self.unpublished:
+            return False
+        if self.unpublished < self.every and time.monotonic() - self.last_publish < self.interval:
+            return False
+        self.publish()
+        return True
+
+    @contextlib.asynccontextmanager
+    async def ticking(self):
+        """Also publishes on the interval while no result comes in, so a
+        slow browser tier doesn't sit on results that already arrived."""
+        async def tick():
+            while True:
+                await asyncio.sleep(self.interval)
+                self.maybe_publish()
+
+        task = asyncio.create_task(tick())
+        try:
+            yield self
+        finally:
+            task.cancel()
+            # Settled before the caller's final publish, never alongside it
+            await asyncio.gather(task, return_exceptions=True)
+
+    def publish(self):
+        entries = [e for e in self.entries if e is not None]
+        with metrics.span("progressive_publish"):
+            write_if_changed(self.path, self.render(entries))
+            self.save_sidecar()
+        self.unpublished = 0
+        self.last_publish = time.monotonic()
+        self.publishes += 1
+
+    def save_sidecar(self):
+        write_if_changed(self.sidecar, "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in self.records))
+
+    def summary(self) -> str:
+        counts = {}
+        for r in self.records:
+            counts[r["status"]] = counts.get(r["status"], 0) + 1
+        return ", ".join(f"{counts[s]} {s}" for s in STATUSES if s in counts)
@@ -0,0 +1,151 @@
+"""Runs every playlist source in one process, sharing one Playwright.
+
+    python runner.py                    # all sources
+    python runner.py ppv sharkstreams   # just these
+    python runner.py --engine chromium  # every source on one browser
+    python runner.py --engine auto      # per embed domain, by measured speed
+"""
+import argparse
+import asyncio
+import logging
+import resource
+import time
+
+import blurred
+import ppv
+import sharkstreams
+from browser_pool import BrowserPool, ENGINES, RECYCLE_PAGES
+from engines import AUTO
+from m3u import write_if_changed
+import metrics
+
+log = logging.getLogger("runner")
+
+# Pages open at once across every source
+PAGE_BUDGET = 8
+
+
+class Source:
+    __slots__ = ("name", "output_file", "new_http_client", "build")
+
+    def __init__(self, name, output_file, new_http_client, build):
+        self.name = name
+        self.output_file = output_file
+        self.new_http_client = new_http_client
+        self.build = build
+
+
+SOURCES = {}
+
+
+def register(name, output_file, new_http_client):
+    """Registers `build(browsers, http, force, engine) -> playlist text or None`."""
+    def deco(build):
+        SOURCES[name] = Source(name, output_file, new_http_client, build)
+        return build
+    return deco
+
+
+@register("ppv", ppv.PLAYLIST_FILE, ppv.new_http_client)
+async def build_ppv(browsers, http, force, engine):
+    text, _ = await ppv.generate_playlist(
+        browsers=browsers, http=http, force=force, engine=engine or ppv.BROWSER_ENGINE
+    )
+    return text
+
+
+@register("sharkstreams", sharkstreams.PLAYLIST_FILE, sharkstreams.new_http_client)
+async def build_sharkstreams(browsers, http, force, engine):
+    text, _ = await sharkstreams.generate_playlist(
+        browsers=browsers, http=http, force=force, engine=engine or sharkstreams.BROWSER_ENGINE
+    )
+    return text
+
+
+@register("blurred", blurred.OUTPUT_FILE, blurred.new_http_client)
+async def build_blurred(browsers, http, force, engine):
+    text, _ = await blurred.generate_playlist(http, force=force)
+    return text
+
+
+def peak_rss_mb():
+    """Peak RSS of this process and of its largest finished child (browsers), in MB."""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return own, children
+
+
+async def run(names, page_budget=PAGE_BUDGET, force=False, engine=None,
+              metrics_dir=metrics.METRICS_DIR, server=None, recycle_pages=RECYCLE_PAGES):
+    async def build(source, browsers):
+        http = source.new_http_client()
+        start = time.monotonic()
+        # Each gather() task has its own context, so sources never share a report
+        with metrics.collect(source.name) as report:
+            try:
+                text = await source.build(browsers, http, force, engine)
+            except Exception:
+                log.exception(f"❌ {source.name} crashed")
+                text = None
+        return source, http, text, time.monotonic() - start, report
+
+    async with BrowserPool(page_budget, server=server, recycle_pages=recycle_pages) as browsers:
+        results = await asyncio.gather(*(build(SOURCES[n], browsers) for n in names))
+        engines = sorted(browsers.browsers) or ["none"]
+        recycled = browsers.recycled
+
+    # Everything is written only once every source is done
+    log.info("\n📊 RUNNER SUMMARY ------------------------------")
+    for source, http, text, elapsed, report in results:
+        if text is None:
+            log.info(f"💤 {source.name:<13} skipped          {elapsed:7.1f}s")
+            report.export(metrics_dir)
+            continue
+        write_start = time.monotonic()
+        changed = write_if_changed(source.output_file, text)
+        report.record("playlist_write", time.monotonic() - write_start)
+        report.export(metrics_dir)
+        http.save()
+        state = "written" if changed else "unchanged"
+        log.info(f"✅ {source.name:<13} {state:<16} {elapsed:7.1f}s  → {source.output_file}")
+
+    own, children = peak_rss_mb()
+    log.info(f"🌐 Browsers: {', '.join(engines)} ({recycled} recycled)")
+    log.info(f"🧠 Peak RSS: runner {own:.0f} MB, largest child {children:.0f} MB")
+    log.info("------------------------------------------------")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run every playlist source on one shared Playwright")
+    parser.add_argument("sources", nargs="*",
+                        help=f"sources to run (default: all of {', '.join(SOURCES)})")
+    parser.add_argument("--pages", type=int, default=PAGE_BUDGET,
+                        help=f"pages open at once across all sources (default {PAGE_BUDGET})")
+    parser.add_argument("--engine", choices=(*ENGINES, AUTO),
+                        help="run every source on this browser instead of its own default; auto picks "
+                             "per embed domain from measured extraction speed (see engines.py)")
+    parser.add_argument("--force", action="store_true",
+                        help="run sources even if their upstream is unchanged")
+    parser.add_argument("--browser-server",
+                        help="connect to a long-lived browser instead of launching one: ws://... from "
+                             "`python -m playwright run-server`, or a Chromium CDP http://... endpoint "
+                             "(default $BROWSER_SERVER)")
+    parser.add_argument("--recycle-pages", type=int, default=RECYCLE_PAGES,
+                        help=f"relaunch a browser after this many pages (default {RECYCLE_PAGES})")
+    parser.add_argument("--metrics-dir", default=metrics.METRICS_DIR,
+                        help=f"where each source's run report and Prometheus textfile go (default {metrics.METRICS_DIR})")
+    parser.add_argument("--profile", action="store_true",
+                        help="run under cProfile and tracemalloc; writes <metrics-dir>/runner.prof")
+    args = parser.parse_args()
+
+    unknown = [n for n in args.sources if n not in SOURCES]
+    if unknown:
+        parser.error(f"unknown source(s): {', '.join(unknown)}")
+
+    start = time.monotonic()
+    # Sources share the event loop, so the profile covers the whole process
+    with metrics.collect("runner") as report, metrics.profiled(report, args.profile, args.metrics_dir):
+        asyncio.run(run(args.sources or list(SOURCES), args.pages, args.force, args.engine,
+                        args.metrics_dir, args.browser_server, args.recycle_pages))
+    report.export(args.metrics_dir)
+    log.info(f"🕓 Total: {time.monotonic() - start:.1f}s")
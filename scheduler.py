@@ -0,0 +1,81 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+
+
+class Scheduler:
+    """Min-heap of keys ordered by due time (unix seconds).
+
+    Rescheduling a key supersedes its earlier slot; stale heap entries are
+    skipped lazily. `spread` pulls a due time earlier by a random amount
+    so keys that share a deadline (tokens minted in the same second) do
+    not all come due in the same tick:
+
+        sched.schedule(key, expires_at - 300, spread=120)
+        while True:
+            await sched.wait()
+            for key in sched.pop_due(limit=6):
+                ...
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._due = {}
+        self._seq = itertools.count()
+        self._wake = asyncio.Event()
+
+    def __len__(self):
+        return len(self._due)
+
+    def __contains__(self, key):
+        return key in self._due
+
+    def schedule(self, key, due, spread=0):
+        if spread > 0:
+            due -= random.uniform(0, spread)
+        self._due[key] = due
+        heapq.heappush(self._heap, (due, next(self._seq), key))
+        self._wake.set()
+
+    def cancel(self, key):
+        self._due.pop(key, None)
+
+    def due_at(self, key):
+        return self._due.get(key)
+
+    def next_due(self):
+        """Earliest due time, or None when nothing is scheduled."""
+        while self._heap:
+            due, _, key = self._heap[0]
+            if self._due.get(key) == due:
+                return due
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now=None, limit=None) -> list:
+        """Removes and returns up to `limit` keys due by `now`, earliest first."""
+        now = now or time.time()
+        keys = []
+        while limit is None or len(keys) < limit:
+            due = self.next_due()
+            if due is None or due > now:
+                break
+            _, _, key = heapq.heappop(self._heap)
+            del self._due[key]
+            keys.append(key)
+        return keys
+
+    async def wait(self):
+        """Sleeps until the earliest key is due. An earlier schedule() cuts it short."""
+        while True:
+            self._wake.clear()
+            due = self.next_due()
+            delay = None if due is None else due - time.time()
+            if delay is not None and delay <= 0:
+                return
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                return
@@ -0,0 +1,166 @@
+"""Browser-tier scanning spread over worker processes, each with its own
+event loop and its own browser.
+
+A source that can be sharded exposes
+
+    async def scan_stream(browsers, engine, sem, idx, total, item, health) -> url or None
+
+(ppv.scan_stream is the reference). Items are split by embed domain,
+workers stream ("result", index, url, fallback urls) back over a
+multiprocessing queue as each scan finishes, next to their host, engine
+and CDN probe samples, and the parent writes every result into the slot of its
+original index, so the merged order never depends on which worker
+finished first.
+"""
+import asyncio
+import importlib
+import math
+import multiprocessing
+import queue as queue_mod
+
+import metrics
+from browser_pool import BrowserPool
+from cdn import fallbacks_for, forward_to as forward_cdn_to, history as cdn_history, remember_fallbacks
+from engines import engine_stats, forward_to
+from host_health import HostHealth, host_of
+
+# How often the parent wakes up to notice a worker that died without a word
+POLL_INTERVAL = 1.0
+
+
+def shard_by_domain(items, shards, key) -> list:
+    """Splits `items` into at most `shards` lists of (index, item).
+
+    Whole domains are packed onto the least-loaded shard, biggest first,
+    so a host's pages, breaker and timeouts stay in one process. A domain
+    bigger than a fair share is cut into fair-share chunks first, or one
+    busy host would leave the other workers idle. Deterministic for the
+    same input."""
+    if not items:
+        return []
+    shards = max(1, shards)
+    fair = math.ceil(len(items) / shards)
+    by_host = {}
+    for i, item in enumerate(items):
+        by_host.setdefault(host_of(key(item)), []).append((i, item))
+
+    chunks = []
+    for host in sorted(by_host, key=lambda h: (-len(by_host[h]), h)):
+        group = by_host[host]
+        chunks.extend(group[k:k + fair] for k in range(0, len(group), fair))
+
+    buckets = [[] for _ in range(shards)]
+    for chunk in sorted(chunks, key=len, reverse=True):
+        min(buckets, key=len).extend(chunk)
+    # Inside a shard, keep the caller's order (health-ranked in ppv)
+    return [sorted(b, key=lambda pair: pair[0]) for b in buckets if b]
+
+
+class _ForwardingHealth(HostHealth):
+    """The parent's host history for this shard's hosts, so timeouts match.
+    Every outcome is also queued for the parent, which owns the real one."""
+
+    def __init__(self, hosts, out):
+        super().__init__()
+        self.hosts = hosts
+        self.out = out
+
+    def record(self, url, ok, elapsed=None, now=None):
+        super().record(url, ok, elapsed, now)
+        self.out.put(("health", url, ok, elapsed))
+
+
+async def _scan_shard(source, shard, total, concurrency, engine, server, hosts, out):
+    scan_stream = importlib.import_module(source).scan_stream
+    health = _ForwardingHealth(hosts, out)
+    # --engine auto samples and CDN probes go to the parent's histories too
+    forward_to(out)
+    forward_cdn_to(out)
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(i, item):
+        try:
+            url = await scan_stream(pool, engine, sem, i + 1, total, item, health)
+        except Exception:
+            url = None
+        out.put(("result", i, url, fallbacks_for(url)))
+
+    async with BrowserPool(server=server) as pool:
+        try:
+            await asyncio.gather(*(one(i, item) for i, item in shard))
+        finally:
+            pool.report_blocked(f"{source}-")
+
+
+def _worker(source, n, shard, total, concurrency, engine, server, hosts, out):
+    with metrics.collect(f"{source}-shard{n}") as report:
+        try:
+            asyncio.run(_scan_shard(source, shard, total, concurrency, engine, server, hosts, out))
+        finally:
+            out.put(("done", n, report.spans, report.counters))
+
+
+async def scan_sharded(source, items, shards, concurrency, engine, health, key, server=None,
+                       on_result=None):
+    """Scans `items` across up to `shards` processes with `concurrency`
+    pages each. Returns URLs (or None) in the order of `items`; host
+    outcomes land in `health` and worker spans in the active RunReport.
+    `on_result(index, url)` is called as each result arrives."""
+    results = [None] * len(items)
+    buckets = shard_by_domain(items, shards, key)
+    ctx = multiprocessing.get_context("spawn")
+    out = ctx.Queue()
+    procs = []
+    for n, shard in enumerate(buckets):
+        hosts = {h: health.hosts[h] for h in {host_of(key(item)) for _, item in shard} if h in health.hosts}
+        proc = ctx.Process(target=_worker, daemon=True,
+                           args=(source, n, shard, len(items), concurrency, engine, server, hosts, out))
+        proc.start()
+        procs.append(proc)
+
+    def next_message(timeout=POLL_INTERVAL):
+        try:
+            return out.get(timeout=timeout)
+        except queue_mod.Empty:
+            return None
+
+    def handle(msg):
+        kind = msg[0]
+        if kind == "result":
+            results[msg[1]] = msg[2]
+            remember_fallbacks(msg[2], msg[3])
+            if on_result:
+                on_result(msg[1], msg[2])
+        elif kind == "health":
+            health.record(msg[1], msg[2], msg[3])
+        elif kind == "engine":
+            engine_stats(msg[1]).record(*msg[2])
+        elif kind == "cdn":
+            cdn_history(msg[1]).record(msg[2])
+        elif kind == "done":
+            running.discard(msg[1])
+            for sp in msg[2]:
+                metrics.record(sp["stage"], sp["seconds"], **sp["labels"])
+            for name, n in msg[3].items():
+                metrics.count(name, n)
+
+    loop = asyncio.get_running_loop()
+    running = set(range(len(procs)))
+    try:
+        with metrics.span("sharded_scan", shards=len(procs)):
+            while running:
+                msg = await loop.run_in_executor(None, next_message)
+                if msg is None:
+                    # A worker that crashed hard never says "done"
+                    running = {n for n in running if procs[n].is_alive()}
+                    continue
+                handle(msg)
+            # Whatever a worker queued just before it went away
+            while (msg := await loop.run_in_executor(None, next_message, 0.2)) is not None:
+                handle(msg)
+    finally:
+        for proc in procs:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+    return results
@@ -1,9 +1,26 @@
 import asyncio
+import contextlib
+import time
 import re
-import requests
 import logging
+import argparse
 from datetime import datetime
-from playwright.async_api import async_playwright
+from zoneinfo import ZoneInfo
+from stream_cache import StreamCache
+from http_extract import (HTTP_CONCURRENCY, HTTP_TIMEOUT, http_resolve, new_tier_stats, tier_report,
+                          extract_from_html)
+from capture import Candidates, M3U8Capture, time_to_first
+from cdn import CANDIDATE_WINDOW, history as cdn_history, rank_candidates, swap_dead
+from probe import probe_all, probe_summary
+from m3u import M3UEntry, write_if_changed
+from http_client import HttpClient, new_session
+from browser_pool import ENGINES, pool_or_new
+from hls import VARIANT_MODES, DEFAULT_POLICY, check_policy, enrich_entries, variant_summary
+from host_health import HostHealth, host_of
+from blocklist import blocked_summary
+from engines import AUTO, engine_stats, engine_summary
+from progressive import PUBLISH_EVERY, PUBLISH_INTERVAL, ProgressivePlaylist
+import metrics
 
 # --- LOGGING SETUP (Console Only) ---
 logging.basicConfig(
@@ -15,10 +32,18 @@ logging.basicConfig(
 log = logging.getLogger("scraper")
 
 # --- CONFIGURATION ---
+PLAYLIST_FILE = "SharkStreams.m3u8"
+HOMEPAGE_URL = "https://sharkstreams.net"
+# Start times on the homepage are Eastern wall-clock time
+HOMEPAGE_TZ = ZoneInfo("America/New_York")
+
 FETCH_HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
 }
 
+# Embed pages expect to be framed by the homepage
+EMBED_HEADERS = {**FETCH_HEADERS, "Referer": "https://sharkstreams.net/"}
+
 FALLBACK_LOGOS = {
     "american football": "http://drewlive24.duckdns.org:9000/Logos/Am-Football2.png",
     "nfl": "http://drewlive24.duckdns.org:9000/Logos/Am-Football2.png",
@@ -72,9 +97,52 @@ TV_IDS = {
     "other": "Sports.Dummy.us"
 }
 
-total_matches = 0
-total_streams = 0
-total_failures = 0
+# Isolated browser contexts draining the match queue in parallel
+WORKER_CONTEXTS = 4
+# With --engine auto, the default for domains without enough history yet
+BROWSER_ENGINE = "chromium"
+
+# What to do with resolved URLs that fail the liveness probe
+DEAD_POLICIES = ("quarantine", "drop", "keep")
+QUARANTINE_GROUP = "SharkStreams - Offline"
+
+# Resolved URLs reused across runs, keyed by embed URL (tokens carry expires=)
+CACHE_FILE = "state/shark_cache.json"
+# ETag / Last-Modified / body hash of the homepage from the last run
+HTTP_STATE_FILE = "state/http_shark.json"
+# Per-host latency/success history behind embed timeouts and the circuit breaker
+HEALTH_FILE = "state/hosts_shark.json"
+# Per-domain, per-engine scan history behind --engine auto
+ENGINE_STATS_FILE = "state/engines_shark.json"
+# Embed page budget for hosts without enough history yet
+EMBED_TIMEOUT = 8
+
+# Homepage rows start with ROW_START and carry these, in this order
+ROW_START = '<div class="row">'
+ROW_FIELD_RES = (
+    re.compile(r'<span class="ch-date">([^<]+)</span>'),
+    re.compile(r'<span class="ch-category">([^<]+)</span>'),
+    re.compile(r'<span class="ch-name">([^<]+)</span>'),
+    re.compile(r"openEmbed\('([^']+)'\)"),
+)
+
+
+def new_stats() -> dict:
+    """Per-worker counters, merged into one dict at the end of a run, when
+    `matches` becomes every homepage row and `tiers` is added."""
+    return {"matches": 0, "scanned": 0, "streams": 0, "failures": 0, "cached": 0, "http": 0, "dead": 0, "tripped": 0}
+
+
+def merge_stats(stats_list) -> dict:
+    merged = new_stats()
+    for st in stats_list:
+        for key, val in st.items():
+            merged[key] = merged.get(key, 0) + val
+    return merged
+
+
+def new_http_client():
+    return HttpClient(FETCH_HEADERS, state_file=HTTP_STATE_FILE)
 
 
 def strip_non_ascii(text: str) -> str:
@@ -104,112 +172,208 @@ def is_current_or_future(date_str: str) -> bool:
         return True # Default to showing it if date parse fails
 
 
-def get_all_matches():
-    """Scrapes SharkStreams homepage."""
-    url = "https://sharkstreams.net"
+def start_timestamp(date_str: str):
+    """'2025-11-18 19:00:00' (ET) -> unix time, or None."""
+    try:
+        dt = datetime.strptime(date_str.strip(), "%Y-%m-%d %H:%M:%S")
+    except (AttributeError, ValueError):
+        return None
+    return int(dt.replace(tzinfo=HOMEPAGE_TZ).timestamp())
+
+
+def full_embed_url(embed_url: str) -> str:
+    """Homepage links are often protocol-relative ('//host/embed')."""
+    if not embed_url.startswith('http'):
+        return f"https:{embed_url}" if embed_url.startswith('//') else embed_url
+    return embed_url
+
+
+def parse_row(segment: str):
+    """(date, category, name, embed_url) from one row's HTML, or None.
+    Each field is searched for once, after the previous one."""
+    fields = []
+    pos = 0
+    for rx in ROW_FIELD_RES:
+        m = rx.search(segment, pos)
+        if not m:
+            return None
+        fields.append(m.group(1))
+        pos = m.end()
+    return tuple(fields)
+
+
+class MatchParser:
+    """Homepage rows as the HTML arrives: feed() chunks, then take the
+    finished (date, category, name, embed_url) rows from pop_rows().
+
+    The page is cut at each row start and a row is only parsed once the
+    next one begins (or at close()), so every byte is scanned a bounded
+    number of times and cost stays linear in page size. A row missing a
+    field is dropped instead of borrowing it from the rows after it.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.in_row = False
+        self.rows = []
+        self.seconds = 0.0
+
+    def reset(self):
+        """Drops the partial row and unread rows of a cut-off download."""
+        self.buffer = ""
+        self.in_row = False
+        self.rows = []
+
+    def feed(self, text):
+        started = time.perf_counter()
+        # Only the new text (plus a marker split across chunks) can hold a new row start
+        search_from = max(0, len(self.buffer) - len(ROW_START) + 1)
+        self.buffer += text
+        cut = self.buffer.rfind(ROW_START, search_from)
+        if cut >= 0:
+            self._parse(self.buffer[:cut])
+            self.buffer = self.buffer[cut:]
+            self.in_row = True
+        elif not self.in_row:
+            # Still before the first row: nothing to keep but a partial marker
+            self.buffer = self.buffer[-(len(ROW_START) - 1):]
+        self.seconds += time.perf_counter() - started
+
+    def close(self):
+        self._parse(self.buffer)
+        self.buffer = ""
+
+    def pop_rows(self) -> list:
+        rows, self.rows = self.rows, []
+        return rows
+
+    def _parse(self, text):
+        for segment in text.split(ROW_START)[1:]:
+            row = parse_row(segment)
+            if row:
+                self.rows.append(row)
+
+
+def match_from_row(raw_date, category, name, embed_url) -> dict:
+    clean_name = strip_non_ascii(name)
+
+    # --- CONDITIONAL TITLE FORMATTING ---
+    if is_current_or_future(raw_date):
+        # If Live/Future: "Pistons vs Hawks (Nov 18 - 07:00 PM ET)"
+        readable_time = format_time_et(raw_date)
+        display_title = f"{clean_name} ({readable_time})"
+    else:
+        # If Old/Past: Just "NFL Redzone" (No confusing date)
+        display_title = clean_name
+
+    return {
+        "title": display_title,
+        "name": clean_name,
+        "date": raw_date.strip(),
+        "category": strip_non_ascii(category),
+        "embed_url": embed_url
+    }
+
+
+async def get_all_matches(http, conditional=True, on_match=None):
+    """Scrapes SharkStreams homepage. Returns None if it is unchanged since the last run,
+    [] if the download failed. `on_match(match)` is called for each row as soon as it
+    has downloaded; after a failure the caller must drop the rows it was handed."""
+    url = HOMEPAGE_URL
     all_matches = []
-    
+    parser = MatchParser()
+    seen = set()
+
+    def take_rows():
+        for row in parser.pop_rows():
+            # A retried download replays rows we already handed out;
+            # seen outlives parser.reset() so they go out only once
+            if row in seen:
+                continue
+            seen.add(row)
+            match = match_from_row(*row)
+            all_matches.append(match)
+            if on_match:
+                on_match(match)
+
+    def on_chunk(text):
+        parser.feed(text)
+        take_rows()
+
     try:
         log.info(f"📡 Fetching {url}...")
-        res = requests.get(url, headers=FETCH_HEADERS, timeout=10)
-        res.raise_for_status()
-        html = res.text
-
-        pattern = re.compile(
-            r'<div class="row">.*?<span class="ch-date">([^<]+)</span>.*?<span class="ch-category">([^<]+)</span>.*?<span class="ch-name">([^<]+)</span>.*?openEmbed\(\'([^\']+)\'\)',
-            re.DOTALL
-        )
-        
-        matches = pattern.findall(html)
-        
-        for m in matches:
-            raw_date, category, name, embed_url = m
-            clean_name = strip_non_ascii(name)
-            
-            # --- CONDITIONAL TITLE FORMATTING ---
-            if is_current_or_future(raw_date):
-                # If Live/Future: "Pistons vs Hawks (Nov 18 - 07:00 PM ET)"
-                readable_time = format_time_et(raw_date)
-                display_title = f"{clean_name} ({readable_time})"
-            else:
-                # If Old/Past: Just "NFL Redzone" (No confusing date)
-                display_title = clean_name
-
-            all_matches.append({
-                "title": display_title,
-                "category": strip_non_ascii(category),
-                "embed_url": embed_url
-            })
+        with metrics.span("upstream_fetch", domain=host_of(url)):
+            async with http:
+                res = await http.get(url, conditional=conditional, on_chunk=on_chunk, on_start=parser.reset)
+        parser.close()
+        metrics.record("homepage_parse", parser.seconds)
+        if res.unchanged:
+            return None
+        if res.status != 200:
+            raise RuntimeError(f"HTTP {res.status}")
+        # The last row only ends with the page
+        take_rows()
 
         log.info(f"✅ Found {len(all_matches)} matches from HTML")
 
     except Exception as e:
+        # A cut-off page would only make a cut-off playlist
         log.warning(f"⚠️ Failed fetching main page: {e}")
-    
+        return []
+
     log.info(f"🎯 Total matches collected: {len(all_matches)}")
     return all_matches
 
 
-async def extract_m3u8(page, embed_url):
-    global total_failures
-    found = None
-    
-    if not embed_url.startswith('http'):
-        embed_url = f"https:{embed_url}" if embed_url.startswith('//') else embed_url
-
+async def poke_player(page):
+    """Clicks play, then once more through whatever overlay ate the first
+    click. The context's blocker keeps those clicks from opening popups."""
     try:
-        async def on_request(request):
-            nonlocal found
-            if ".m3u8" in request.url and not found:
-                if "prd.jwpltx.com" in request.url:
-                    return
-                found = request.url
-                log.info(f"  ⚡ Stream detected: {found}")
-
-        page.on("request", on_request)
+        play_selectors = ["button.vjs-big-play-button", ".jw-icon-display", "div[class*='play']", "video", "button"]
+        for sel in play_selectors:
+            if await page.is_visible(sel):
+                await page.click(sel, timeout=500)
+                break
         
-        log.info(f"    • Navigating to player: {embed_url}")
-        await page.goto(embed_url, wait_until="domcontentloaded", timeout=8000)
+        await page.mouse.click(300, 300)
+        await asyncio.sleep(0.2)
+        await page.mouse.click(300, 300)
         
-        try:
-            play_selectors = ["button.vjs-big-play-button", ".jw-icon-display", "div[class*='play']", "video", "button"]
-            for sel in play_selectors:
-                if await page.is_visible(sel):
-                    await page.click(sel, timeout=500)
-                    break
-            
-            await page.mouse.click(300, 300)
-            await asyncio.sleep(0.2)
-            
-            pages_now = page.context.pages
-            if len(pages_now) > 1:
-                for p in pages_now[1:]:
-                    try: await p.close()
-                    except: pass
-            
-            await page.bring_to_front()
-            await page.mouse.click(300, 300)
-            
-        except Exception:
-            pass 
-
-        for _ in range(8):
-            if found: break
-            await asyncio.sleep(0.5)
-
-        if not found:
-            content = await page.content()
-            matches = re.findall(r'(https?://[^\s"\'<>]+\.m3u8)', content)
-            if matches:
-                found = matches[0]
+    except Exception:
+        pass 
+
+
+async def extract_candidates(page, embed_url, stats=None, timeout=EMBED_TIMEOUT) -> list:
+    """Every manifest the player asks for within CANDIDATE_WINDOW of the
+    first one, first seen first; [] when there is none."""
+    embed_url = full_embed_url(embed_url)
+
+    try:
+        # Every step below is cut short the moment a manifest is requested
+        async with M3U8Capture(page, events=("request",), window=CANDIDATE_WINDOW) as cap:
+            log.info(f"    • Navigating to player: {embed_url}")
+            with metrics.span("embed_navigation", domain=host_of(embed_url)):
+                found = await cap.race(page.goto(embed_url, wait_until="domcontentloaded", timeout=timeout * 1000))
+            if not found:
+                found = await cap.race(poke_player(page))
+            candidates = await cap.collect(timeout=timeout / 2)
+
+        if candidates:
+            log.info(f"  ⚡ Stream detected: {candidates[0]}" +
+                     (f" (+{len(candidates) - 1} more)" if len(candidates) > 1 else ""))
+        else:
+            found = extract_from_html(await page.content(), embed_url)
+            if found:
                 log.info(f"  🕵️ Regex found stream in source code")
+                candidates = Candidates([found], time.monotonic() - cap.started)
 
-        return found
+        return candidates
 
     except Exception as e:
-        total_failures += 1
+        if stats is not None:
+            stats["failures"] += 1
         log.warning(f"⚠️ Extraction failed for {embed_url}: {e}")
-        return None
+        return []
 
 
 def get_logo_url(category):
@@ -220,8 +384,30 @@ def get_logo_url(category):
     return FALLBACK_LOGOS["other"]
 
 
-async def process_match(index, match, total, ctx):
-    global total_streams
+async def grab_on(pages, embed_url, stats, timeout, engines=None) -> list:
+    """extract_candidates() on a page from `pages`. With `engines`
+    (EngineStats) the scan is recorded for pages.engine, timed from
+    navigation to the first manifest."""
+    try:
+        async with pages.page() as page:
+            candidates = await extract_candidates(page, embed_url, stats, timeout)
+            rss = pages.browsers.engine_rss_mb(pages.engine) if engines else 0.0
+    except Exception:
+        # An engine that can't even open a page loses its domains too
+        if engines:
+            engines.record(embed_url, pages.engine, False)
+        raise
+    if engines:
+        engines.record(embed_url, pages.engine, bool(candidates), time_to_first(candidates), rss)
+    return candidates
+
+
+async def process_match(index, match, total, pages, stats, health=None, engines=None, fallback=None):
+    """(match, manifest candidates); the candidates are [] when nothing
+    played and None when the host's breaker kept it from being tried.
+    With `engines` every scan is recorded for the engine comparison, and
+    when nothing plays on `pages` the match gets a second try on
+    `fallback` (the domain's own engine after a failed sample)."""
     title = match.get("title", "Unknown")
     category = match.get("category", "Other")
     embed_url = match.get("embed_url")
@@ -230,80 +416,393 @@ async def process_match(index, match, total, ctx):
     
     if not embed_url:
         log.info("      ❌ No embed URL found")
+        return match, []
+
+    embed_url = full_embed_url(embed_url)
+    if health and not health.allow(embed_url):
+        stats["tripped"] += 1
+        log.info("      🔌 Host breaker open, skipped")
         return match, None
 
-    page = await ctx.new_page()
-    m3u8 = await extract_m3u8(page, embed_url)
-    await page.close()
+    stats["scanned"] += 1
+    timeout = health.timeout(embed_url, EMBED_TIMEOUT) if health else EMBED_TIMEOUT
+    started = time.monotonic()
+    try:
+        m3u8 = await grab_on(pages, embed_url, stats, timeout, engines)
+    except Exception:
+        if fallback is None:
+            raise
+        m3u8 = []
+    if not m3u8 and fallback is not None:
+        pages = fallback
+        m3u8 = await grab_on(pages, embed_url, stats, timeout, engines)
+    elapsed = time.monotonic() - started
+    if health:
+        # Latency is navigation to the first manifest of the scan that
+        # found it: no page lease, candidate window or failed sample
+        health.record(embed_url, bool(m3u8), time_to_first(m3u8))
+    labels = {"category": category, "domain": host_of(embed_url), "engine": pages.engine}
+    metrics.record("embed_scan", elapsed, ok=bool(m3u8), **labels)
+    if m3u8:
+        metrics.record("time_to_m3u8", elapsed, **labels)
 
     if m3u8:
-        total_streams += 1
+        stats["streams"] += 1
         log.info(f"      ✅ Stream OK")
         return match, m3u8
     else:
         log.info(f"      ❌ No stream found")
-        return match, None
+        return match, []
 
 
-async def generate_playlist():
-    global total_matches
-    matches = get_all_matches()
-    total_matches = len(matches)
-    
-    if not matches:
-        log.warning("❌ No matches found.")
-        return "#EXTM3U\n"
+def match_entry(match, url, ok=True) -> M3UEntry:
+    raw_cat = match.get("category")
+    cat_key = raw_cat.lower().replace(" ", "")
+    return M3UEntry(
+        url=url,
+        title=match.get("title"),
+        attrs={
+            "tvg-id": TV_IDS.get(cat_key, TV_IDS["other"]),
+            "tvg-name": match.get("title"),
+            "tvg-logo": get_logo_url(raw_cat),
+            "group-title": f"SharkStreams - {raw_cat}" if ok else QUARANTINE_GROUP,
+        }
+    )
 
+
+def render_entries(entries) -> str:
     content = ["#EXTM3U"]
+    for entry in entries:
+        content.extend(entry.lines())
+    return "\n".join(content)
+
+
+async def match_worker(worker_id, browsers, engine, queue, results, matches, stats, health=None,
+                       on_result=None):
+    """Drain the shared queue on a private context so popup cleanup in one
+    worker never closes another worker's page. The context and its warm
+    page outlive the run when `browsers` is shared. Stops at a None match.
+    With engine "auto" each match goes to its embed domain's engine, on a
+    context per engine. `on_result(index, url, tier)` hears about each
+    match as it finishes; tier is browser, or skipped behind an open
+    breaker."""
+    engines = engine_stats(ENGINE_STATS_FILE) if engine == AUTO else None
+    while True:
+        _, i, m = await queue.get()
+        if m is None:
+            break
+        pick, fallback = engine, None
+        if engines:
+            embed_url = full_embed_url(m["embed_url"])
+            pick, best = engines.pick(embed_url, BROWSER_ENGINE), engines.best(embed_url, BROWSER_ENGINE)
+            if pick != best:
+                # A sample; the domain's engine takes over if it fails, so
+                # sampling costs time rather than streams
+                fallback = browsers.page_pool(f"sharkstreams-{worker_id}-{best}", best)
+        pages = browsers.page_pool(f"sharkstreams-{worker_id}-{pick}", pick)
+        tier = "browser"
+        try:
+            async with browsers.page_slot():
+                _, candidates = await process_match(i, m, len(matches), pages, stats, health, engines,
+                                                    fallback)
+            if candidates is None:
+                tier, candidates = "skipped", []
+            # Ranked with the page already given back
+            url = (await rank_candidates(candidates, FETCH_HEADERS) or [None])[0]
+        except Exception as e:
+            stats["failures"] += 1
+            log.warning(f"⚠️ Worker {worker_id} failed on match {i}: {e}")
+            url = None
+        results[i - 1] = url
+        if on_result:
+            on_result(i, url, tier)
+
+
+async def generate_playlist(workers=WORKER_CONTEXTS, use_cache=True, dead_policy="quarantine",
+                            http=None, force=False, browsers=None, engine=BROWSER_ENGINE,
+                            variants="off", variant_policy=DEFAULT_POLICY, progress=None):
+    """Returns the playlist text and the merged run stats. The text is None
+    when the homepage hasn't changed since the last run.
+    `browsers` is a shared BrowserPool; one is started on demand if omitted.
+
+    Matches flow through while the homepage is still downloading: each
+    parsed row goes to the cache, then the plain-HTTP tier, then a
+    health-ordered queue drained by the browser workers. When the last
+    run's validators are fresh the rows are held until the body hash
+    rules out an unchanged homepage, so a skipped run stays free. With `progress`
+    (a ProgressivePlaylist) every match is reported as it settles, so
+    partial playlists get published during the run."""
+    http = http or HttpClient(FETCH_HEADERS)
+    cache = StreamCache(CACHE_FILE) if use_cache else None
+    health = HostHealth(HEALTH_FILE)
+    tiers = new_tier_stats()
+    worker_stats = [new_stats() for _ in range(max(1, workers))]
+
+    matches = []
+    results = []
+    pending = []
+    to_scan = []
+    # (host rank, index, match): healthiest embed hosts first among what has
+    # arrived, so a dying host can't hold up the rest
+    queue = asyncio.PriorityQueue()
+    http_sem = asyncio.Semaphore(HTTP_CONCURRENCY)
+    http_tasks = []
+    worker_tasks = []
+    slots = []
+    # Behind an open breaker: not tried, so not a failure to back off from
+    tripped = set()
+
+    def settled(i, url, tier):
+        if not progress:
+            return
+        if url:
+            progress.resolved(slots[i - 1], match_entry(matches[i - 1], url), tier)
+        else:
+            progress.failed(slots[i - 1], "skipped" if tier == "skipped" else "failed", tier)
+
+    def browsed(i, url, tier):
+        if tier == "skipped":
+            tripped.add(i)
+        settled(i, url, tier)
+
+    # Tier 1: plain HTTP, no browser
+    async def http_tier(i, embed_url):
+        async with http_sem:
+            found = await http_resolve(session, embed_url)
+        if found:
+            results[i - 1] = found
+            tiers["http"] += 1
+            settled(i, found, "http")
+        else:
+            # Tier 2: browser, launched only once something lands here
+            to_scan.append(i)
+            queue.put_nowait((health.rank(embed_url), i, matches[i - 1]))
+
+    def admit(m):
+        matches.append(m)
+        results.append(None)
+        i = len(matches)
+        if progress:
+            slots.append(progress.add(m["title"], category=m["category"], date=m["date"]))
+        embed_url = m.get("embed_url")
+        if cache and embed_url:
+            cached = cache.get(embed_url)
+            if cached:
+                results[i - 1] = cached
+                settled(i, cached, "cache")
+                return
+            if cache.should_skip(embed_url):
+                settled(i, None, "skipped")
+                return
+        pending.append(i)
+        if embed_url:
+            http_tasks.append(asyncio.ensure_future(http_tier(i, full_embed_url(embed_url))))
+        else:
+            settled(i, None, None)
+
+    # With fresh validators the body may still hash the same as last time,
+    # and an unchanged homepage must not cost a single embed request: rows
+    # wait until that is ruled out
+    held = [] if not force and http.fresh(HOMEPAGE_URL) else None
+    on_match = held.append if held is not None else admit
+
+    async with pool_or_new(browsers) as pool, new_session(EMBED_HEADERS, timeout=HTTP_TIMEOUT) as session, \
+            progress.ticking() if progress else contextlib.nullcontext():
+        try:
+            worker_tasks = [
+                asyncio.ensure_future(match_worker(w, pool, engine, queue, results, matches, worker_stats[w], health,
+                                                   on_result=browsed))
+                for w in range(len(worker_stats))
+            ]
+            fetched = await get_all_matches(http, conditional=not force, on_match=on_match)
+            if fetched is None:
+                # Only known once the body hashed the same as last time
+                log.info("💤 Homepage unchanged since the last run, nothing to do")
+                return None, new_stats()
+            if not fetched:
+                # Failed or empty; whatever rows arrived are cancelled with the
+                # rest of the pipeline below
+                log.warning("❌ No matches found.")
+                return "#EXTM3U\n", new_stats()
+            for m in held or ():
+                admit(m)
+            await asyncio.gather(*http_tasks)
+            for _ in worker_tasks:
+                queue.put_nowait((float("inf"), 0, None))
+            if to_scan:
+                log.info(f"🧵 {len(worker_tasks)} worker contexts scanned {len(to_scan)} matches")
+            await asyncio.gather(*worker_tasks)
+        finally:
+            # Nothing may outlive the pool and session it was using
+            for t in http_tasks + worker_tasks:
+                t.cancel()
+            await asyncio.gather(*http_tasks, *worker_tasks, return_exceptions=True)
+            pool.report_blocked("sharkstreams-")
+
+    total_matches = len(matches)
+
+    if to_scan:
+        health.save()
+        cdn_history().save()
+        if engine == AUTO:
+            engine_stats(ENGINE_STATS_FILE).save()
+        tiers["browser"] = sum(1 for i in to_scan if results[i - 1])
+    if cache:
+        tiers["cache"] = cache.hits
+        tiers["skipped"] = total_matches - len(pending) - cache.hits
+        log.info(f"🗃️ Cache: {tiers['cache']} reused, {tiers['skipped']} backing off, {len(pending)} resolved")
+
+    entries = []
     success = 0
-    
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        ctx = await browser.new_context()
-        
-        for i, m in enumerate(matches, 1):
-            match_data, url = await process_match(i, m, total_matches, ctx)
-            
-            if not url:
-                continue
 
-            title = match_data.get("title")
-            raw_cat = match_data.get("category")
-            logo = get_logo_url(raw_cat)
-            
-            cat_key = raw_cat.lower().replace(" ", "")
-            tv_id = TV_IDS.get(cat_key, TV_IDS["other"])
-            
-            group_title = f"SharkStreams - {raw_cat}"
-
-            content.append(
-                f'#EXTINF:-1 tvg-id="{tv_id}" tvg-name="{title}" '
-                f'tvg-logo="{logo}" group-title="{group_title}",{title}'
-            )
-            content.append(url)
+    stats = merge_stats(worker_stats)
+    stats["matches"] = total_matches
+    stats["tiers"] = tiers
+    tiers["skipped"] += stats["tripped"]
+    tiers["failed"] = sum(1 for i in pending if not results[i - 1]) - stats["tripped"]
+    stats["cached"] = tiers["cache"]
+    stats["http"] = tiers["http"]
+    log.info(f"🪜 Tiers: {tier_report(tiers)}")
+
+    if cache:
+        for i in pending:
+            embed_url = matches[i - 1].get("embed_url")
+            if not embed_url:
+                continue
+            if results[i - 1]:
+                cache.put(embed_url, results[i - 1])
+            elif i not in tripped:
+                cache.mark_failed(embed_url, starts_at=start_timestamp(matches[i - 1]["date"]))
+
+    # Make sure what we write actually plays
+    alive = [True] * total_matches
+    if dead_policy != "keep":
+        resolved = [i for i in range(total_matches) if results[i]]
+        log.info(f"🩺 Probing {len(resolved)} playlists...")
+        probes = await probe_all([results[i] for i in resolved], FETCH_HEADERS)
+        for i, r in zip(resolved, probes):
+            if not r["ok"]:
+                alive[i] = False
+                stats["dead"] += 1
+                log.info(f"      💀 Dead ({r['reason']}): {matches[i].get('title')}")
+                if cache:
+                    cache.forget(matches[i]["embed_url"])
+                if progress:
+                    progress.mark(slots[i], "dead")
+        log.info(f"🩺 {probe_summary(probes)}")
+        before = list(results)
+        revived = await swap_dead(results, alive, FETCH_HEADERS)
+        if revived:
+            stats["dead"] -= revived
+            log.info(f"🔁 {revived} dead streams switched to a fallback CDN")
+        for i, (old, url) in enumerate(zip(before, results)):
+            if url != old:
+                if cache:
+                    cache.put(matches[i]["embed_url"], url)
+                settled(i + 1, url, "fallback")
+
+    if cache:
+        cache.evict()
+        cache.save()
+
+    # Written in the original homepage order, whichever worker finished first
+    for match_data, url, ok in zip(matches, results, alive):
+        if not url:
+            continue
+        if not ok and dead_policy == "drop":
+            continue
+
+        entries.append(match_entry(match_data, url, ok))
+        if ok:
             success += 1
 
-        await browser.close()
+    if variants != "off" and entries:
+        log.info(f"🎚️ Checking {len(entries)} playlists for variants...")
+        changed = await enrich_entries(entries, variants, variant_policy, FETCH_HEADERS)
+        log.info(f"🎚️ {variant_summary(changed, len(entries), variants)}")
 
     log.info(f"\n🎉 {success} working streams written to playlist.")
-    return "\n".join(content)
+    for key in ("matches", "scanned", "streams", "failures", "dead", "tripped"):
+        metrics.count(key, stats[key])
+    for tier, n in tiers.items():
+        metrics.count(f"tier_{tier}", n)
+    return render_entries(entries), stats
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SharkStreams playlist scraper")
+    parser.add_argument("-w", "--workers", type=int, default=WORKER_CONTEXTS,
+                        help=f"isolated browser contexts (default {WORKER_CONTEXTS}, 1 = sequential)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="ignore and don't update the resolved-stream cache")
+    parser.add_argument("--dead", choices=DEAD_POLICIES, default="quarantine",
+                        help="what to do with streams that fail the liveness probe "
+                             "(keep skips probing)")
+    parser.add_argument("--force", action="store_true",
+                        help="run even if the homepage is unchanged since last time")
+    parser.add_argument("--engine", choices=(*ENGINES, AUTO), default=BROWSER_ENGINE,
+                        help=f"browser for the embeds (default {BROWSER_ENGINE}); auto routes each embed "
+                             "domain to its fastest reliable engine and samples the others "
+                             "(compare them with `python engines.py`)")
+    parser.add_argument("--metrics-dir", default=metrics.METRICS_DIR,
+                        help=f"where the JSON run report and Prometheus textfile go (default {metrics.METRICS_DIR})")
+    parser.add_argument("--profile", action="store_true",
+                        help="run under cProfile and tracemalloc; writes <metrics-dir>/sharkstreams.prof")
+    parser.add_argument("--publish-every", type=int, default=PUBLISH_EVERY,
+                        help=f"publish the partial playlist after this many new results (default {PUBLISH_EVERY})")
+    parser.add_argument("--publish-interval", type=float, default=PUBLISH_INTERVAL,
+                        help=f"...or after this many seconds (default {PUBLISH_INTERVAL})")
+    parser.add_argument("--no-progressive", action="store_true",
+                        help="write the playlist only once the run is complete, with no sidecar")
+    parser.add_argument("--variants", choices=VARIANT_MODES, default="off",
+                        help="for master playlists: annotate entries with resolution/bitrate, "
+                             "or pin the variant picked by --variant-policy")
+    parser.add_argument("--variant-policy", type=check_policy, default=DEFAULT_POLICY,
+                        help="best | lowest | max-height:<px> | max-bandwidth:<bps> (default best)")
+    args = parser.parse_args()
+
     start = datetime.now()
     log.info("🚀 Starting SharkStreams run...")
     
-    playlist = asyncio.run(generate_playlist())
-    
-    with open("SharkStreams.m3u8", "w", encoding="utf-8") as f:
-        f.write(playlist)
+    http = new_http_client()
+    progress = None
+    if not args.no_progressive:
+        # tvg-id is per category here, so streams are told apart by title
+        progress = ProgressivePlaylist(PLAYLIST_FILE, render_entries, key=lambda e: e.attrs.get("tvg-name"),
+                                       every=args.publish_every, interval=args.publish_interval)
+    with metrics.collect("sharkstreams") as report, metrics.profiled(report, args.profile, args.metrics_dir):
+        playlist, stats = asyncio.run(generate_playlist(
+            workers=args.workers, use_cache=not args.no_cache, dead_policy=args.dead,
+            http=http, force=args.force, variants=args.variants, variant_policy=args.variant_policy,
+            progress=progress, engine=args.engine
+        ))
+
+        if playlist is not None:
+            with metrics.span("playlist_write"):
+                write_if_changed(PLAYLIST_FILE, playlist)
+                if progress:
+                    progress.save_sidecar()
+            http.save()
+            if progress:
+                log.info(f"📤 {progress.publishes} partial publishes; {progress.sidecar}: {progress.summary()}")
+    report.export(args.metrics_dir)
         
     end = datetime.now()
     duration = (end - start).total_seconds()
     
     log.info("\n📊 FINAL SUMMARY ------------------------------")
     log.info(f"🕓 Duration: {duration:.2f} sec")
-    log.info(f"📺 Matches:  {total_matches}")
-    log.info(f"✅ Streams:  {total_streams}")
-    log.info(f"❌ Failures: {total_failures}")
+    log.info(f"📺 Matches:  {stats['matches']}")
+    if stats.get("tiers"):
+        log.info(f"🪜 Tiers:    {tier_report(stats['tiers'])}")
+    log.info(f"✅ Streams:  {stats['streams']}")
+    log.info(f"🗃️ Cached:   {stats['cached']}")
+    log.info(f"🌐 HTTP:     {stats['http']}")
+    log.info(f"💀 Dead:     {stats['dead']}")
+    log.info(f"❌ Failures: {stats['failures']}")
+    log.info(f"🔌 Tripped:  {stats['tripped']}")
+    log.info(f"🛡️ Blocked:  {blocked_summary(report.counters)}")
+    if args.engine == AUTO:
+        log.info(f"🧪 Engines:  {engine_summary(report.counters)}")
+    log.info("⏱️ Stages:\n" + report.stage_report())
     log.info("------------------------------------------------")
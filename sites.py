@@ -0,0 +1,130 @@
+"""Per-source adapters for tools that work across sources (gateway.py,
+events.py): how to list a source's events, resolve one embed and
+describe an event as a playlist entry."""
+import abc
+import logging
+import re
+
+import ppv
+import sharkstreams
+from capture import time_to_first
+from cdn import rank_candidates
+from host_health import HostHealth
+from m3u import M3UEntry
+from probe import headers_from_vlcopt
+from stream_cache import StreamCache
+
+log = logging.getLogger("sites")
+
+
+def slugify(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")
+
+
+class Site(abc.ABC):
+    """One upstream source.
+
+    Events are {"key", "embed", "name", "category", "starts_at", ...source
+    fields}; `key` is stable across listings and `starts_at` is unix time
+    or None. The cache and host history start from the batch scraper's
+    state files; callers decide whether to save them back.
+    """
+
+    name = ""
+    title = ""
+    headers = {}
+    # Sent when probing manifest candidates to rank them
+    stream_headers = {}
+    engine = None
+    timeout = 8
+
+    def __init__(self, cache_file, health_file):
+        self.cache = StreamCache(cache_file)
+        self.health = HostHealth(health_file)
+        self.events = {}
+        self.listed_at = None
+        # Hosts that showed up in a resolved URL or a manifest we served;
+        # the gateway's relay refuses everything else
+        self.hosts = set()
+
+    @abc.abstractmethod
+    async def fetch_events(self) -> list:
+        """Every event currently listed."""
+
+    @abc.abstractmethod
+    async def browser_resolve(self, browsers, embed, timeout):
+        """Manifest candidates for `embed` from a browser page, as the
+        capture.Candidates the scan returned."""
+
+    @abc.abstractmethod
+    def entry(self, event, url) -> M3UEntry:
+        """Playlist entry for `event` at `url`, with the option lines a
+        player needs to send this source's headers."""
+
+    async def browse(self, browsers, embed):
+        """Browser tier for one embed, within the host's derived timeout.
+        Callers check self.health.allow(embed) first: an embed skipped
+        behind an open breaker was not tried, so it is no failure."""
+        timeout = self.health.timeout(embed, self.timeout)
+        try:
+            async with browsers.page_slot():
+                urls = await self.browser_resolve(browsers, embed, timeout)
+        except Exception as e:
+            log.warning(f"⚠️ Browser resolution failed for {embed}: {e}")
+            urls = []
+        # Navigation to the first manifest only, as in the batch scrapers
+        self.health.record(embed, bool(urls), time_to_first(urls))
+        # Ranked with the page already given back
+        return (await rank_candidates(urls, self.stream_headers) or [None])[0]
+
+
+class PPVSite(Site):
+    name = "ppv"
+    title = "PPVLand"
+    headers = ppv.EMBED_HEADERS
+    stream_headers = headers_from_vlcopt(ppv.STREAM_HEADERS)
+    engine = ppv.BROWSER_ENGINE
+    timeout = ppv.SCAN_TIMEOUT
+
+    async def fetch_events(self):
+        categories = await ppv.get_streams(ppv.new_http_client(), conditional=False)
+        return [{**s, "key": str(s["id"]), "embed": s["iframe"]} for s in ppv.flatten_streams(categories or [])]
+
+    async def browser_resolve(self, browsers, embed, timeout):
+        pages = browsers.page_pool("sites-ppv", self.engine, ppv.BLOCKED_RESOURCES)
+        async with pages.page() as page:
+            return await ppv.safe_grab(page, embed, timeout)
+
+    def entry(self, event, url):
+        return ppv.stream_entries([(event, url, True)])[0]
+
+
+class SharkSite(Site):
+    name = "shark"
+    title = "SharkStreams"
+    headers = sharkstreams.EMBED_HEADERS
+    stream_headers = sharkstreams.FETCH_HEADERS
+    engine = sharkstreams.BROWSER_ENGINE
+    timeout = sharkstreams.EMBED_TIMEOUT
+
+    async def fetch_events(self):
+        matches = await sharkstreams.get_all_matches(sharkstreams.new_http_client(), conditional=False)
+        return [
+            # The title gains and loses its start-time suffix over the
+            # event's life; the name and raw date don't
+            {**m, "key": slugify(f"{m['name']} {m['date']}"), "embed": sharkstreams.full_embed_url(m["embed_url"]),
+             "starts_at": sharkstreams.start_timestamp(m["date"])}
+            for m in matches or [] if m.get("embed_url")
+        ]
+
+    async def browser_resolve(self, browsers, embed, timeout):
+        pages = browsers.page_pool("sites-shark", self.engine)
+        async with pages.page() as page:
+            return await sharkstreams.extract_candidates(page, embed, timeout=timeout)
+
+    def entry(self, event, url):
+        return sharkstreams.match_entry(event, url)
+
+
+SITES = {"ppv": lambda: PPVSite(ppv.CACHE_FILE, ppv.HEALTH_FILE),
+         "shark": lambda: SharkSite(sharkstreams.CACHE_FILE, sharkstreams.HEALTH_FILE)}
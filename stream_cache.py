@@ -0,0 +1,123 @@
+import json
+import os
+import time
+from urllib.parse import urlparse, parse_qs
+
+# --- CONFIGURATION ---
+# URLs without an expires= token are trusted for this long
+DEFAULT_TTL = 90 * 60
+# Entries this close to expiry are treated as misses and re-resolved
+REFRESH_MARGIN = 10 * 60
+# Negative cache: wait BACKOFF_BASE * 2^(failures-1) before retrying, capped
+BACKOFF_BASE = 15 * 60
+BACKOFF_MAX = 12 * 60 * 60
+
+EXPIRY_PARAMS = ("expires", "expiry", "exp")
+
+
+def parse_expiry(url: str):
+    """Returns the unix expiry carried in the URL query string, or None."""
+    try:
+        qs = parse_qs(urlparse(url).query)
+    except ValueError:
+        return None
+    for key in EXPIRY_PARAMS:
+        for raw in qs.get(key, []):
+            try:
+                value = int(float(raw))
+            except ValueError:
+                continue
+            # Some CDNs sign in milliseconds
+            if value > 10**12:
+                value //= 1000
+            return value
+    return None
+
+
+class StreamCache:
+    """On-disk cache of resolved m3u8 URLs keyed by embed/iframe URL.
+
+    Stored as compact JSON:
+        {"ok":   {key: [url, resolved_at, expires_at]},
+         "fail": {key: [failures, retry_at]}}
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL, margin=REFRESH_MARGIN):
+        self.path = path
+        self.ttl = ttl
+        self.margin = margin
+        self.ok = {}
+        self.fail = {}
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.ok = data.get("ok", {})
+            self.fail = data.get("fail", {})
+        except (FileNotFoundError, ValueError):
+            self.ok, self.fail = {}, {}
+
+    def save(self):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"ok": self.ok, "fail": self.fail}, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def get(self, key, now=None):
+        """Cached URL if it stays valid past the refresh margin, else None."""
+        now = now or time.time()
+        entry = self.ok.get(key)
+        if entry and entry[2] - self.margin > now:
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        return None
+
+    def put(self, key, url, now=None):
+        now = now or time.time()
+        expires_at = parse_expiry(url) or int(now + self.ttl)
+        self.ok[key] = [url, int(now), expires_at]
+        self.fail.pop(key, None)
+
+    def forget(self, key):
+        """Drops a positive entry, e.g. after its URL failed a liveness probe."""
+        self.ok.pop(key, None)
+
+    def should_skip(self, key, now=None) -> bool:
+        """True while a repeatedly failing embed is still backing off."""
+        now = now or time.time()
+        entry = self.fail.get(key)
+        return bool(entry) and entry[1] > now
+
+    def mark_failed(self, key, now=None, starts_at=None):
+        """Backs `key` off, twice as long per failure. Before `starts_at`
+        an event has nothing to play yet: that doesn't count as a failure,
+        and the retry comes no later than the start."""
+        now = now or time.time()
+        failures = self.fail.get(key, [0, 0])[0]
+        if starts_at and starts_at > now:
+            retry_at = min(now + BACKOFF_BASE, starts_at)
+        else:
+            failures += 1
+            retry_at = now + min(BACKOFF_BASE * 2 ** (failures - 1), BACKOFF_MAX)
+        self.fail[key] = [failures, int(retry_at)]
+        self.ok.pop(key, None)
+
+    def evict(self, now=None) -> int:
+        """Drops expired entries and lapsed backoffs. Returns how many went."""
+        now = now or time.time()
+        dead_ok = [k for k, e in self.ok.items() if e[2] <= now]
+        # Keep the failure count around for a while so backoff keeps growing
+        dead_fail = [k for k, e in self.fail.items() if e[1] + BACKOFF_MAX <= now]
+        for k in dead_ok:
+            del self.ok[k]
+        for k in dead_fail:
+            del self.fail[k]
+        return len(dead_ok) + len(dead_fail)
@@ -0,0 +1,69 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("playwright")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sharkstreams
+from http_client import FetchResult
+
+
+def homepage(rows):
+    out = []
+    for i in range(rows):
+        out.append(
+            f'<div class="row"><span class="ch-date">2025-11-18 {i % 24:02d}:00:00</span>'
+            f'<span class="ch-category">Basketball</span>'
+            f'<span class="ch-name">Team {2 * i} vs Team {2 * i + 1}</span>'
+            f'<a class="btn" onclick="openEmbed(\'//embed.example/{i}\')">Watch</a></div>'
+        )
+    return "<html><body>" + "\n".join(out) + "</body></html>"
+
+
+class StreamingHttp:
+    """Hands the page to on_chunk in small pieces, like HttpClient.get."""
+
+    def __init__(self, html, chunk=333):
+        self.html = html
+        self.chunk = chunk
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def get(self, url, conditional=False, on_chunk=None, on_start=None):
+        if on_start:
+            on_start()
+        for i in range(0, len(self.html), self.chunk):
+            on_chunk(self.html[i:i + self.chunk])
+        return FetchResult(url, 200, self.html)
+
+
+def test_last_row_with_embed_link_is_kept():
+    seen = []
+    matches = asyncio.run(sharkstreams.get_all_matches(StreamingHttp(homepage(20)), on_match=seen.append))
+    assert len(matches) == 20
+    assert matches[-1]["embed_url"] == "//embed.example/19"
+    assert seen == matches
+
+
+class CutOffHttp(StreamingHttp):
+    """Hands out part of the page, then loses the connection."""
+
+    async def get(self, url, conditional=False, on_chunk=None, on_start=None):
+        on_chunk(self.html[:len(self.html) // 2])
+        raise ConnectionResetError("connection lost mid-download")
+
+
+def test_cut_off_homepage_yields_no_matches():
+    seen = []
+    matches = asyncio.run(sharkstreams.get_all_matches(CutOffHttp(homepage(20)), on_match=seen.append))
+    assert matches == []
+    assert seen